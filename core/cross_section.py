@@ -0,0 +1,191 @@
+"""
+cross_section.py
+
+[役割]
+- 日付などのキーごとのクロスセクション計算を、groupby のコールバック無しで行う NumPy カーネル
+  - キーを1回だけ factorize して「行 → セグメント番号」を持ち、
+    和・件数は np.bincount、分位点・順位は (セグメント, 値) の lexsort で全セグメントを一度に計算する
+  - 結果は入力と同じ行順の配列で返す
+- pandas の groupby(...).transform(...) と同じ定義
+  - 平均・分散は NaN を除外（pandas の nanops と同じ式。分散は2パス）
+  - 分位点は numpy.percentile(method="linear") と同じ補間、順位は rank(method="first") と同じ（同値は出現順）
+  - キーが NaN の行は groupby と同じくどのグループにも入らず、結果は NaN
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+
+@dataclass
+class Segments:
+    """
+    codes[i] は i 行目のセグメント番号（キーが NaN の行は -1）。
+    セグメントはキーの昇順（groupby(sort=True) と同じ順）。
+    """
+    codes: np.ndarray
+    n_segments: int
+
+    @classmethod
+    def from_keys(cls, keys) -> "Segments":
+        codes, uniques = pd.factorize(np.asarray(keys), sort=True)
+        return cls(codes=codes.astype(np.int64), n_segments=len(uniques))
+
+    @classmethod
+    def from_codes(cls, codes) -> "Segments":
+        """
+        保存済みの整数コード（負は欠損。連番でなくてよい）から作る。
+        セグメントはコードの昇順（np.unique で詰め直す。文字列キーの factorize より軽い）
+        """
+        codes = np.asarray(codes, dtype=np.int64)
+        v = codes >= 0
+        uniques, inv = np.unique(codes[v], return_inverse=True)
+        out = np.full(len(codes), -1, dtype=np.int64)
+        out[v] = inv
+        return cls(codes=out, n_segments=len(uniques))
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, cols) -> "Segments":
+        """複数列のキー（例: ("date", "sector")）。どれかが NaN の行は -1"""
+        cols = list(cols)
+        if len(cols) == 1:
+            return cls.from_keys(df[cols[0]].to_numpy())
+        g = df.groupby(cols, sort=True, dropna=True, observed=True)
+        codes = g.ngroup().to_numpy(dtype="float64", na_value=np.nan)
+        return cls(codes=np.where(np.isnan(codes), -1, codes).astype(np.int64), n_segments=g.ngroups)
+
+    @property
+    def valid(self) -> np.ndarray:
+        return self.codes >= 0
+
+    # ---- セグメントごとの集計（長さ n_segments）---- #
+    def _bincount(self, weights) -> np.ndarray:
+        v = self.valid
+        return np.bincount(self.codes[v], weights=weights[v], minlength=self.n_segments)
+
+    def size(self) -> np.ndarray:
+        """セグメントの行数（NaN の値も数える）"""
+        return np.bincount(self.codes[self.valid], minlength=self.n_segments)
+
+    def count(self, x) -> np.ndarray:
+        return self._bincount((~np.isnan(x)).astype("float64"))
+
+    def sum(self, x) -> np.ndarray:
+        return self._bincount(np.where(np.isnan(x), 0.0, x))
+
+    def mean(self, x) -> np.ndarray:
+        n = self.count(x)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(n > 0, self.sum(x) / n, np.nan)
+
+    def var(self, x, ddof: int = 1) -> np.ndarray:
+        """分散（件数 <= ddof のセグメントは NaN）"""
+        n = self.count(x)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            avg = self.sum(x) / n
+            sqr = (self.broadcast(avg) - x) ** 2
+            out = self.sum(sqr) / (n - ddof)
+        return np.where(n > ddof, out, np.nan)
+
+    def std(self, x, ddof: int = 1) -> np.ndarray:
+        return np.sqrt(self.var(x, ddof=ddof))
+
+    def quantile(self, x, q: float) -> np.ndarray:
+        """分位点（NaN を除いた値で numpy.percentile(method="linear") と同じ補間）"""
+        x = np.asarray(x, dtype="float64")
+        v = self.valid & ~np.isnan(x)
+        codes, vals = self.codes[v], x[v]
+        order = np.lexsort((vals, codes))
+        sorted_vals = vals[order]
+        n = np.bincount(codes, minlength=self.n_segments)
+        starts = np.concatenate([[0], np.cumsum(n)[:-1]])
+
+        out = np.full(self.n_segments, np.nan)
+        has = n > 0
+        if not has.any():
+            return out
+        nn, st = n[has], starts[has]
+        virtual = (nn - 1) * q
+        prev = np.floor(virtual)
+        gamma = virtual - prev
+        prev_i = prev.astype(np.int64)
+        next_i = np.minimum(prev_i + 1, nn - 1)
+        above = virtual >= nn - 1
+        prev_i = np.where(above, nn - 1, prev_i)
+        a = sorted_vals[st + prev_i]
+        b = sorted_vals[st + next_i]
+        # numpy の _lerp と同じ式（t >= 0.5 は b 側から）
+        diff = b - a
+        res = a + diff * gamma
+        res = np.where(gamma >= 0.5, b - diff * (1 - gamma), res)
+        out[has] = np.where(above, a, res)
+        return out
+
+    def rank(self, x, ascending: bool = True) -> np.ndarray:
+        """
+        セグメント内の順位 1..n（行ごと）。rank(method="first") と同じく、同値は行の出現順。
+        NaN の値・キーが NaN の行は NaN。
+        """
+        x = np.asarray(x, dtype="float64")
+        out = np.full(len(x), np.nan)
+        v = np.flatnonzero(self.valid & ~np.isnan(x))
+        if len(v) == 0:
+            return out
+        codes = self.codes[v]
+        vals = x[v] if ascending else -x[v]
+        # (セグメント, 値) の順に並べる。lexsort は安定なので同値は行の出現順のまま
+        order = np.lexsort((vals, codes))
+        n = np.bincount(codes, minlength=self.n_segments)
+        starts = np.concatenate([[0], np.cumsum(n)[:-1]])
+        sorted_codes = codes[order]
+        out[v[order]] = np.arange(len(v)) - starts[sorted_codes] + 1.0
+        return out
+
+    # ---- 行ごとに戻す ---- #
+    def broadcast(self, per_segment) -> np.ndarray:
+        """セグメントごとの値 → 行ごとの値（キーが NaN の行は NaN）"""
+        per_segment = np.asarray(per_segment, dtype="float64")
+        out = np.full(len(self.codes), np.nan)
+        v = self.valid
+        out[v] = per_segment[self.codes[v]]
+        return out
+
+
+def zscore(seg: Segments, x, ddof: int = 0, zero_if_flat: bool = True, eps: float = 0.0) -> np.ndarray:
+    """
+    セグメントごとの z-score (x - mean) / (std + eps)。
+    zero_if_flat=True なら std == 0 のセグメントは全行 0（NaN の行も 0。従来の _z と同じ）。
+    """
+    x = np.asarray(x, dtype="float64")
+    mu = seg.broadcast(seg.mean(x))
+    sd = seg.broadcast(seg.std(x, ddof=ddof))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        z = (x - mu) / (sd + eps)
+    if zero_if_flat:
+        z = np.where(sd == 0, 0.0, z)
+    return z
+
+
+def rank_scaled(seg: Segments, x, ascending: bool = True) -> np.ndarray:
+    """
+    セグメント内の順位 1..n を -1〜+1 にスケール（2 * (r - 1) / (n - 1 + 1e-8) - 1）。
+    グループごとに rank(method="first") を取って (r - min) / (max - min) でスケールしたのと同じ値。
+    """
+    x = np.asarray(x, dtype="float64")
+    r = seg.rank(x, ascending=ascending)
+    n = seg.broadcast(seg.count(x))
+    return 2.0 * (r - 1.0) / (n - 1.0 + 1e-8) - 1.0
+
+
+def rank_tilt(seg: Segments, x, top_n: int, bottom_n: int, alpha: float) -> np.ndarray:
+    """
+    降順の順位で上位 top_n 行に +alpha、下位 bottom_n 行に -alpha（重なる行は -alpha）、それ以外は 0。
+    下位の判定に使う n は NaN の値も含むセグメントの行数（NaN の行は 0。キーが NaN の行は NaN）。
+    """
+    r = seg.rank(x, ascending=False)
+    n = seg.broadcast(seg.size())
+    w = np.where(r <= top_n, +alpha, 0.0)
+    w = np.where(r > n - bottom_n, -alpha, w)
+    return np.where(seg.valid, w, np.nan)
@@ -1,10 +1,13 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
-from typing import Dict, Tuple, Iterable, Literal
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Tuple, Iterable, Literal
 
+import numpy as np
 import pandas as pd
 
+from core.cross_section import Segments, rank_scaled, rank_tilt, zscore
+
 
 ScoreType = Literal[
     "zscore_linear",
@@ -93,17 +96,188 @@ SCORING_VARIANTS: Dict[str, ScoringVariantConfig | dict] = {
 }
 
 
-def _zscore(x: pd.Series) -> pd.Series:
-    return (x - x.mean()) / (x.std(ddof=1) + 1e-8)
+# 中間量のキー（Variant 間で共有する配列）
+#   ("z", col)                          : col のグループ内 z-score（(x - mean) / (std(ddof=1) + 1e-8)）
+#   ("rank_scaled", col, ascending)     : col のグループ内順位を -1〜+1 にスケール
+#   ("tilt", col, top_n, bottom_n, alpha): 降順順位の上位/下位 N に ±alpha
+#   ("col", col)                        : df の列そのまま（事前に作った *_z 列など）
+PlanKey = Tuple
 
 
-def _rank_scaled(x: pd.Series) -> pd.Series:
+@dataclass(frozen=True)
+class VariantPlan:
     """
-    0〜1 のランクを -1〜+1 にスケール。
-    ascending=False にする側で呼べば「上位ほど +1」にできる。
+    1つの Variant の計算式:
+        score = clip_out( sign * clip_head(head) + Σ coef * term )
+    head / term は中間量のキー（PlanKey）。同じキーは Variant をまたいで1回だけ計算する。
     """
-    r = x.rank(method="first")  # 1,2,3,...
-    return 2.0 * (r - r.min()) / (r.max() - r.min() + 1e-8) - 1.0
+    name: str
+    head: PlanKey
+    head_clip: Tuple[float, float] | None = None
+    head_sign: float = 1.0
+    terms: Tuple[Tuple[float, PlanKey], ...] = ()
+    out_clip: Tuple[float, float] | None = None
+
+    @property
+    def out_col(self) -> str:
+        return f"score_{self.name}"
+
+    @property
+    def inputs(self) -> Tuple[PlanKey, ...]:
+        return (self.head,) + tuple(key for _, key in self.terms)
+
+    @property
+    def columns(self) -> Tuple[str, ...]:
+        """計算に使う df の列名"""
+        return tuple(dict.fromkeys(key[1] for key in self.inputs))
+
+
+def _as_dict(cfg: ScoringVariantConfig | dict) -> dict:
+    # 辞書形式の場合はそのまま使用、dataclass の場合は辞書に変換
+    return cfg if isinstance(cfg, dict) else asdict(cfg)
+
+
+def compile_variant(
+    name: str,
+    cfg: ScoringVariantConfig | dict,
+    *,
+    base_col: str,
+    ascending: bool,
+    columns: Iterable[str],
+) -> VariantPlan:
+    """
+    SCORING_VARIANTS の1エントリ（dataclass / dict）を VariantPlan に変換する。
+    columns は入力 df の列名（無い列を参照する項は 0 扱いとして落とす）。
+    """
+    cfg_dict = _as_dict(cfg)
+    cfg_type = cfg_dict["type"]
+    columns = set(columns)
+    z_base = ("z", base_col)
+
+    if cfg_type == "zscore_linear":
+        return VariantPlan(name, z_base, head_clip=cfg_dict.get("clip"))
+
+    if cfg_type == "rank_linear":
+        # base_col の値で昇順/降順を切り替えた順位を -1〜+1 にスケール
+        sign = -1.0 if cfg_dict.get("inverse", False) else 1.0
+        return VariantPlan(name, ("rank_scaled", base_col, ascending), head_sign=sign)
+
+    if cfg_type == "zscore_with_rank_tilt":
+        # Variant C: z-score + rank tilt
+        tilt = ("tilt", base_col, cfg_dict["top_n"], cfg_dict["bottom_n"], cfg_dict["tilt_strength"])
+        return VariantPlan(name, z_base, head_clip=cfg_dict["clip"], terms=((1.0, tilt),), out_clip=(-3, 3))
+
+    if cfg_type == "zscore_lowvol":
+        # Variant D: z-score - low vol/beta penalty
+        lv = cfg_dict.get("lambda_vol", 0.0)
+        lb = cfg_dict.get("lambda_beta", 0.0)
+        vol_col = cfg_dict.get("vol_col")
+        beta_col = cfg_dict.get("beta_col")
+
+        terms = []
+        # vol_z の取得（なければ 0 扱い）
+        if vol_col is not None and vol_col in columns:
+            terms.append((-lv, ("col", vol_col)))
+        elif "vol_20d" in columns:
+            # on-the-fly で z-score を作る簡易版
+            terms.append((-lv, ("z", "vol_20d")))
+        # beta_z の取得（なければ 0 扱い）
+        if beta_col is not None and beta_col in columns:
+            terms.append((-lb, ("col", beta_col)))
+        return VariantPlan(name, z_base, head_clip=cfg_dict["clip"], terms=tuple(terms), out_clip=(-3, 3))
+
+    if cfg_type in ("zscore_downvol", "zscore_downbeta", "zscore_downcombo"):
+        # Variant E/F/G: z-score - downside vol / downside beta penalty
+        # 既定値は Variant ごとの値（E: vol 0.7 / F: beta 0.5 / G: vol 0.5 + beta 0.3）
+        if cfg_type == "zscore_downvol":
+            down = [(cfg_dict.get("lambda_vol_down", 0.7), cfg_dict.get("vol_down_col", "downside_vol_60d"))]
+        elif cfg_type == "zscore_downbeta":
+            down = [(cfg_dict.get("lambda_beta_down", 0.5), cfg_dict.get("beta_down_col", "down_beta_252d"))]
+        else:
+            down = [
+                (cfg_dict.get("lambda_vol_down", 0.5), cfg_dict.get("vol_down_col", "downside_vol_60d")),
+                (cfg_dict.get("lambda_beta_down", 0.3), cfg_dict.get("beta_down_col", "down_beta_252d")),
+            ]
+        # vol_down_z / beta_down_z の取得（なければ 0 扱い）
+        terms = tuple((-lam, ("z", col)) for lam, col in down if col is not None and col in columns)
+        return VariantPlan(name, z_base, head_clip=cfg_dict["clip"], terms=terms, out_clip=(-3, 3))
+
+    raise ValueError(f"Unknown scoring type: {cfg_type}")
+
+
+def compile_plan(
+    variants: Iterable[str] | None,
+    *,
+    base_col: str,
+    ascending: bool,
+    columns: Iterable[str],
+) -> List[VariantPlan]:
+    """variants（None なら SCORING_VARIANTS 全部）を SCORING_VARIANTS の順で VariantPlan にする"""
+    names = list(SCORING_VARIANTS) if variants is None else list(variants)
+    unknown = [v for v in names if v not in SCORING_VARIANTS]
+    if unknown:
+        raise KeyError(f"未知のスコアリング Variant: {unknown}")
+    columns = list(columns)
+    return [
+        compile_variant(name, cfg, base_col=base_col, ascending=ascending, columns=columns)
+        for name, cfg in SCORING_VARIANTS.items()
+        if name in names
+    ]
+
+
+class _CrossSectionCache:
+    """
+    compute_scores_all 用: 中間量（列ごとの日次 z-score・ランクなど）を1回だけ計算して使い回す。
+    全 Variant が同じ base_col の z-score を使うので、Variant を増やしてもクロスセクション集計は増えない。
+    """
+
+    def __init__(self, df: pd.DataFrame, group_cols: Iterable[str], group_codes=None):
+        self.df = df
+        self.group_cols = list(group_cols)
+        if group_codes is not None:
+            self.seg = Segments.from_codes(group_codes)
+        else:
+            self.seg = Segments.from_frame(df, self.group_cols)
+        self._values: Dict[PlanKey, np.ndarray] = {}
+
+    def _col(self, col: str) -> np.ndarray:
+        return self.df[col].to_numpy(dtype="float64")
+
+    def get(self, key: PlanKey) -> np.ndarray:
+        if key in self._values:
+            return self._values[key]
+        kind = key[0]
+        if kind == "z":
+            # (x - mean) / (std(ddof=1) + 1e-8)
+            out = zscore(self.seg, self._col(key[1]), ddof=1, zero_if_flat=False, eps=1e-8)
+        elif kind == "rank_scaled":
+            # グループ内の順位 rank(method="first") を -1〜+1 にスケール
+            out = rank_scaled(self.seg, self._col(key[1]), ascending=key[2])
+        elif kind == "tilt":
+            # 全グループの順位を lexsort 1回で求める
+            _, col, top_n, bottom_n, alpha = key
+            out = rank_tilt(self.seg, self._col(col), top_n, bottom_n, alpha)
+        elif kind == "col":
+            out = self._col(key[1])
+        else:
+            raise ValueError(f"未知の中間量: {key}")
+        self._values[key] = out
+        return out
+
+    def evaluate(self, plan: VariantPlan) -> np.ndarray:
+        s = _clip(self.get(plan.head), plan.head_clip)
+        if plan.head_sign != 1.0:
+            s = plan.head_sign * s
+        for coef, key in plan.terms:
+            s = s + coef * self.get(key)
+        return _clip(s, plan.out_clip)
+
+
+def _clip(x: np.ndarray, clip: Tuple[float, float] | None) -> np.ndarray:
+    if clip is None:
+        return x
+    lo, hi = clip
+    return np.clip(x, lo, hi)
 
 
 def compute_scores_all(
@@ -112,6 +286,8 @@ def compute_scores_all(
     *,
     group_cols: Iterable[str] = ("date",),
     ascending: bool = True,
+    variants: Iterable[str] | None = None,
+    group_codes: np.ndarray | None = None,
 ) -> pd.DataFrame:
     """
     各 SCORING_VARIANTS ごとに score_<name> カラムを追加する。
@@ -122,164 +298,36 @@ def compute_scores_all(
     base_col : factor の元カラム（例: "raw_mom_score"）
     group_cols : 日次 or 日次×セクターなど
     ascending : True なら「値が小さいほど rank 1」、False なら「大きいほど rank 1」
-    """
-    g = df.groupby(list(group_cols))
-
-    for name, cfg in SCORING_VARIANTS.items():
-        out_col = f"score_{name}"
-        
-        # 辞書形式の場合はそのまま使用、dataclass の場合は辞書に変換
-        if isinstance(cfg, dict):
-            cfg_dict = cfg
-            cfg_type = cfg_dict["type"]
-        else:
-            cfg_dict = {
-                "type": cfg.type,
-                "clip": cfg.clip,
-                "inverse": cfg.inverse,
-                "top_n": cfg.top_n,
-                "bottom_n": cfg.bottom_n,
-                "tilt_strength": cfg.tilt_strength,
-                "lambda_vol": cfg.lambda_vol,
-                "lambda_beta": cfg.lambda_beta,
-                "vol_col": cfg.vol_col,
-                "beta_col": cfg.beta_col,
-                "lambda_vol_down": cfg.lambda_vol_down,
-                "lambda_beta_down": cfg.lambda_beta_down,
-                "vol_down_col": cfg.vol_down_col,
-                "beta_down_col": cfg.beta_down_col,
-            }
-            cfg_type = cfg.type
-
-        if cfg_type == "zscore_linear":
-            s = g[base_col].transform(_zscore)
-            if cfg_dict.get("clip") is not None:
-                lo, hi = cfg_dict["clip"]
-                s = s.clip(lo, hi)
-            df[out_col] = s
-
-        elif cfg_type == "rank_linear":
-            # base_col の値で昇順/降順を切り替え
-            def _rank_group(x: pd.Series) -> pd.Series:
-                r = x.rank(method="first", ascending=ascending)
-                return _rank_scaled(r)
-
-            s = g[base_col].transform(_rank_group)
-            if cfg_dict.get("inverse", False):
-                s = -s
-            df[out_col] = s
-
-        elif cfg_type == "zscore_with_rank_tilt":
-            # Variant C: z-score + rank tilt
-            s_z = g[base_col].transform(_zscore)
-            lo, hi = cfg_dict["clip"]
-            s_z = s_z.clip(lo, hi)
-
-            # rank tilt
-            def _tilt_block(x: pd.Series) -> pd.Series:
-                r = x.rank(method="first", ascending=False)
-                n = len(x)
-                top_n = cfg_dict["top_n"]
-                bottom_n = cfg_dict["bottom_n"]
-                alpha = cfg_dict["tilt_strength"]
-                
-                w = pd.Series(0.0, index=x.index)
-                w[r <= top_n] = +alpha
-                w[r > n - bottom_n] = -alpha
-                return w
-
-            tilt = g[base_col].transform(_tilt_block)
-            df[out_col] = (s_z + tilt).clip(-3, 3)
-
-        elif cfg_type == "zscore_lowvol":
-            # Variant D: z-score - low vol/beta penalty
-            s_z = g[base_col].transform(_zscore)
-            lo, hi = cfg_dict["clip"]
-            s_z = s_z.clip(lo, hi)
-
-            lv = cfg_dict.get("lambda_vol", 0.0)
-            lb = cfg_dict.get("lambda_beta", 0.0)
-
-            vol_col = cfg_dict.get("vol_col")
-            beta_col = cfg_dict.get("beta_col")
-
-            # vol_z の取得（なければ 0 扱い）
-            if vol_col is not None and vol_col in df.columns:
-                vol_z = df[vol_col]
-            elif "vol_20d" in df.columns:
-                # on-the-fly で z-score を作る簡易版
-                vol_z = g["vol_20d"].transform(_zscore)
-            else:
-                vol_z = pd.Series(0.0, index=df.index)
-
-            # beta_z の取得（なければ 0 扱い）
-            if beta_col is not None and beta_col in df.columns:
-                beta_z = df[beta_col]
-            else:
-                beta_z = pd.Series(0.0, index=df.index)
-
-            df[out_col] = (s_z - lv * vol_z - lb * beta_z).clip(-3, 3)
-
-        elif cfg_type == "zscore_downvol":
-            # Variant E: z-score - downside vol penalty
-            s_z = g[base_col].transform(_zscore)
-            lo, hi = cfg_dict["clip"]
-            s_z = s_z.clip(lo, hi)
-
-            lambda_vol_down = cfg_dict.get("lambda_vol_down", 0.7)
-            vol_down_col = cfg_dict.get("vol_down_col", "downside_vol_60d")
-
-            # vol_down_z の取得（なければ 0 扱い）
-            if vol_down_col is not None and vol_down_col in df.columns:
-                vol_down_z = g[vol_down_col].transform(_zscore)
-            else:
-                vol_down_z = pd.Series(0.0, index=df.index)
-
-            df[out_col] = (s_z - lambda_vol_down * vol_down_z).clip(-3, 3)
+    variants : 計算する Variant 名のリスト（None なら全部）。指定した Variant の列と、
+        それが依存する中間量だけを計算する
+    group_codes : group_cols に対応する行ごとの整数コード（負は欠損。scripts/group_codes の gc_* 列）。
+        渡すと group_cols の列で groupby せずにこのコードでグループを作る
 
-        elif cfg_type == "zscore_downbeta":
-            # Variant F: z-score - downside beta penalty
-            s_z = g[base_col].transform(_zscore)
-            lo, hi = cfg_dict["clip"]
-            s_z = s_z.clip(lo, hi)
-
-            lambda_beta_down = cfg_dict.get("lambda_beta_down", 0.5)
-            beta_down_col = cfg_dict.get("beta_down_col", "down_beta_252d")
-
-            # beta_down_z の取得（なければ 0 扱い）
-            if beta_down_col is not None and beta_down_col in df.columns:
-                beta_down_z = g[beta_down_col].transform(_zscore)
-            else:
-                beta_down_z = pd.Series(0.0, index=df.index)
-
-            df[out_col] = (s_z - lambda_beta_down * beta_down_z).clip(-3, 3)
-
-        elif cfg_type == "zscore_downcombo":
-            # Variant G: z-score - downside vol + beta combo
-            s_z = g[base_col].transform(_zscore)
-            lo, hi = cfg_dict["clip"]
-            s_z = s_z.clip(lo, hi)
-
-            lambda_vol_down = cfg_dict.get("lambda_vol_down", 0.5)
-            lambda_beta_down = cfg_dict.get("lambda_beta_down", 0.3)
-            vol_down_col = cfg_dict.get("vol_down_col", "downside_vol_60d")
-            beta_down_col = cfg_dict.get("beta_down_col", "down_beta_252d")
-
-            # vol_down_z の取得（なければ 0 扱い）
-            if vol_down_col is not None and vol_down_col in df.columns:
-                vol_down_z = g[vol_down_col].transform(_zscore)
-            else:
-                vol_down_z = pd.Series(0.0, index=df.index)
-
-            # beta_down_z の取得（なければ 0 扱い）
-            if beta_down_col is not None and beta_down_col in df.columns:
-                beta_down_z = g[beta_down_col].transform(_zscore)
-            else:
-                beta_down_z = pd.Series(0.0, index=df.index)
-
-            df[out_col] = (s_z - lambda_vol_down * vol_down_z - lambda_beta_down * beta_down_z).clip(-3, 3)
+    各 Variant は VariantPlan（compile_plan）に変換してから評価する。
+    z-score・ランクなどの中間量は Variant をまたいで1回だけ計算する（_CrossSectionCache）。
+    """
+    plans = compile_plan(variants, base_col=base_col, ascending=ascending, columns=df.columns)
+    cs = _CrossSectionCache(df, group_cols, group_codes)
+    for plan in plans:
+        df[plan.out_col] = cs.evaluate(plan)
+    return df
 
-        else:
-            raise ValueError(f"Unknown scoring type: {cfg_type}")
 
-    return df
+def score_variants(
+    df: pd.DataFrame,
+    configs: Dict[str, ScoringVariantConfig | dict],
+    base_col: str,
+    *,
+    group_cols: Iterable[str] = ("date",),
+    ascending: bool = True,
+    group_codes: np.ndarray | None = None,
+) -> Dict[str, np.ndarray]:
+    """
+    configs（名前 → 設定）の score を 名前 → 配列 で返す（df は変更しない）。
+    設定は SCORING_VARIANTS に無いものでもよい（パラメータのスイープ用）。中間量は共有する。
+    """
+    cs = _CrossSectionCache(df, group_cols, group_codes)
+    return {
+        name: cs.evaluate(compile_variant(name, cfg, base_col=base_col, ascending=ascending, columns=df.columns))
+        for name, cfg in configs.items()
+    }
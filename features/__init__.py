@@ -0,0 +1,16 @@
+"""
+features: 特徴量の宣言（レジストリ）
+
+各サブパッケージが FeatureSpec を REGISTRY に登録する。
+  momentum   : ret_1d, ret_5d, ret_20d
+  volatility : vol_20d, downside_ret_1d, downside_vol_60d, down_beta_252d, beta_252d
+  liquidity  : turnover, adv_20d
+
+計算（DAG 解決・キャッシュ）は scripts/feature_engine.py が行う。
+"""
+from features.registry import REGISTRY, FeatureSpec, register
+
+# 登録（import 時に REGISTRY へ追加される）
+from features import momentum, volatility, liquidity  # noqa: F401,E402
+
+__all__ = ["REGISTRY", "FeatureSpec", "register"]
@@ -0,0 +1,173 @@
+"""
+kernels.py
+
+[役割]
+- 行番号×銘柄 の密行列と長い形式の対応（SymbolPanel）
+- 列ごとの計算カーネル（pct_change / rolling mean・std / 市場ベータ・下落ベータ）
+
+[行列の形]
+- 行 = 銘柄内の行番号（0,1,2,...）、列 = 銘柄。各銘柄の系列を列の先頭から詰め、末尾は NaN。
+  暦日で揃えた 日付×銘柄 パネルではなく「銘柄ごとの行」で揃えるので、
+  pct_change(n) や rolling(n) の窓は従来の groupby 版と同じ行を指す（欠損日がある銘柄でも同値）。
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+
+@dataclass
+class SymbolPanel:
+    """
+    (symbol, date) 順の長い形式 ⇔ 行番号×銘柄 の密行列 の対応表。
+    code[i] / pos[i] が長い形式の i 行目の列番号・行番号。
+    """
+    symbols: pd.Index
+    code: np.ndarray
+    pos: np.ndarray
+    n_rows: int
+
+    @classmethod
+    def from_symbols(cls, symbols) -> "SymbolPanel":
+        """symbol 列（同じ銘柄が連続している前提）から作る"""
+        symbols = np.asarray(symbols)
+        n = len(symbols)
+        if n == 0:
+            return cls(symbols=pd.Index([]), code=np.array([], dtype=np.int64),
+                       pos=np.array([], dtype=np.int64), n_rows=0)
+        new_sym = np.r_[True, symbols[1:] != symbols[:-1]]
+        code = np.cumsum(new_sym) - 1
+        starts = np.flatnonzero(new_sym)
+        pos = np.arange(n) - starts[code]
+        uniq = pd.Index(symbols[starts])
+        if not uniq.is_unique:
+            raise ValueError("symbol が連続していません（symbol, date で並べ替えてから渡してください）")
+        return cls(symbols=uniq, code=code, pos=pos, n_rows=int(pos.max()) + 1)
+
+    @property
+    def shape(self) -> tuple:
+        return (self.n_rows, len(self.symbols))
+
+    def to_wide(self, values, dtype="float64") -> np.ndarray:
+        """長い形式の1列 → 行番号×銘柄 の行列（空きは NaN）"""
+        out = np.full(self.shape, np.nan, dtype=dtype)
+        out[self.pos, self.code] = np.asarray(values, dtype=dtype)
+        return out
+
+    def to_long(self, wide: np.ndarray) -> np.ndarray:
+        """行番号×銘柄 の行列 → 長い形式の1列"""
+        return np.asarray(wide)[self.pos, self.code]
+
+
+# -------------------- 列ごとのカーネル -------------------- #
+def pct_change(wide: np.ndarray, periods: int = 1) -> np.ndarray:
+    """列ごとの pct_change（pandas 既定の fill_method="pad" と同じく欠損は直前値で埋めてから計算）"""
+    return pd.DataFrame(wide).ffill().pct_change(periods=periods, fill_method=None).to_numpy()
+
+
+def rolling_mean(wide: np.ndarray, window: int, min_periods: int) -> np.ndarray:
+    return pd.DataFrame(wide).rolling(window=window, min_periods=min_periods).mean().to_numpy()
+
+
+def rolling_std(wide: np.ndarray, window: int, min_periods: int) -> np.ndarray:
+    return pd.DataFrame(wide).rolling(window=window, min_periods=min_periods).std().to_numpy()
+
+
+def _rolling_sum(v: np.ndarray, window: int) -> np.ndarray:
+    """列ごとの直近 window 行の和（累積和の差。先頭の window-1 行は先頭からの和）"""
+    c = np.zeros((v.shape[0] + 1,) + v.shape[1:], dtype="float64")
+    np.cumsum(v, axis=0, out=c[1:])
+    lo = np.maximum(np.arange(v.shape[0]) + 1 - window, 0)
+    return c[1:] - c[lo]
+
+
+def rolling_beta(r: np.ndarray, m: np.ndarray, window: int = 252, min_periods: int = 60) -> np.ndarray:
+    """
+    行番号×銘柄 の行列どうしのローリングベータ beta = cov(r, m) / var(m)（全銘柄を一括で計算）。
+
+    各列の直近 window 行のうち r, m がともに有限の行を使い、件数が min_periods 未満
+    または var(m) <= 0 のときは NaN。窓ごとの Σr, Σm, Σr·m, Σm², 件数 を累積和の差で求める。
+    """
+    r = np.asarray(r, dtype="float64")
+    m = np.asarray(m, dtype="float64")
+    valid = np.isfinite(r) & np.isfinite(m)
+    # cov / var は平行移動で不変なので、列ごとの平均を引いてから累積和を取る（桁落ち対策）
+    with np.errstate(invalid="ignore"):
+        cnt_all = valid.sum(axis=0)
+        mx = np.where(cnt_all > 0, np.where(valid, m, 0.0).sum(axis=0) / np.maximum(cnt_all, 1), 0.0)
+        my = np.where(cnt_all > 0, np.where(valid, r, 0.0).sum(axis=0) / np.maximum(cnt_all, 1), 0.0)
+    x = np.where(valid, m - mx, 0.0)
+    y = np.where(valid, r - my, 0.0)
+
+    cnt = _rolling_sum(valid.astype("float64"), window)
+    sx = _rolling_sum(x, window)
+    sy = _rolling_sum(y, window)
+    sxy = _rolling_sum(x * y, window)
+    sxx = _rolling_sum(x * x, window)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cov = sxy - sx * sy / cnt
+        var = sxx - sx * sx / cnt
+        beta = cov / var
+    ok = (cnt >= min_periods) & (var > 1e-12 * np.maximum(sxx, 1e-300))
+    return np.where(ok, beta, np.nan)
+
+
+def rolling_downside_beta(symbols, r, m, window=252, min_periods=60):
+    """
+    下落相場（m < 0）のみを使った銘柄ごとのローリングベータ（全銘柄を一括で計算）。
+
+    symbols / r / m は (symbol, date) 順に並んだ同じ長さの配列。
+    各行について同じ銘柄の直近 window 行のうち m < 0 の行だけで
+      beta = cov(r, m) / var(m)   （cov は ddof=1、var は ddof=0。従来の np.cov / np.var と同じ）
+    を求める。下落日が min_periods 未満、下落日の r に NaN を含む、var <= 0 のときは NaN。
+
+    銘柄内の行位置で累積和を取り、窓の両端の差（Σm, Σr, Σr·m, Σm², 件数）から計算するので
+    行ごとに窓をスライスしない。
+    """
+    symbols = np.asarray(symbols)
+    r = np.asarray(r, dtype="float64")
+    m = np.asarray(m, dtype="float64")
+    n = len(r)
+    if n == 0:
+        return np.array([], dtype="float64")
+
+    down = m < 0  # NaN は False
+    r_nan = down & np.isnan(r)
+    # cov / var は平行移動で不変なので、全体平均を引いてから累積和を取る（桁落ち対策）
+    mx = m[down].mean() if down.any() else 0.0
+    my = r[down & ~r_nan].mean() if (down & ~r_nan).any() else 0.0
+    x = np.where(down, m - mx, 0.0)
+    y = np.where(down & ~r_nan, r - my, 0.0)
+
+    def _csum(v):
+        out = np.empty(n + 1, dtype="float64")
+        out[0] = 0.0
+        np.cumsum(v, out=out[1:])
+        return out
+
+    # 銘柄の先頭行の位置 → 窓の開始位置 = max(銘柄先頭, i - window + 1)
+    new_sym = np.r_[True, symbols[1:] != symbols[:-1]]
+    sym_start = np.maximum.accumulate(np.where(new_sym, np.arange(n), 0))
+    lo = np.maximum(sym_start, np.arange(n) - window + 1)
+    hi = np.arange(n) + 1
+
+    def _win(v):
+        c = _csum(v)
+        return c[hi] - c[lo]
+
+    cnt = _win(down.astype("float64"))
+    n_nan = _win(r_nan.astype("float64"))
+    sx = _win(x)
+    sy = _win(y)
+    sxy = _win(x * y)
+    sxx = _win(x * x)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cov = (sxy - sx * sy / cnt) / (cnt - 1)
+        var = (sxx - sx * sx / cnt) / cnt
+        beta = cov / var
+    ok = (cnt >= min_periods) & (n_nan == 0) & (var > 0)
+    return np.where(ok, beta, np.nan)
@@ -0,0 +1,15 @@
+"""
+liquidity: 売買代金系の特徴量
+"""
+from features.kernels import rolling_mean
+from features.registry import register
+
+
+@register("turnover", inputs=("close", "volume"), window=0, description="売買代金 close * volume")
+def turnover(panel, x):
+    return x["close"] * x["volume"]
+
+
+@register("adv_20d", inputs=("turnover",), window=20, description="20日平均売買代金（min_periods=5）")
+def adv_20d(panel, x):
+    return rolling_mean(x["turnover"], 20, 5)
@@ -0,0 +1,20 @@
+"""
+momentum: リターン系の特徴量
+"""
+from features.kernels import pct_change
+from features.registry import register
+
+
+@register("ret_1d", inputs=("close",), window=1, description="1営業日リターン")
+def ret_1d(panel, x):
+    return pct_change(x["close"], 1)
+
+
+@register("ret_5d", inputs=("close",), window=5, description="5営業日リターン")
+def ret_5d(panel, x):
+    return pct_change(x["close"], 5)
+
+
+@register("ret_20d", inputs=("close",), window=20, description="20営業日リターン")
+def ret_20d(panel, x):
+    return pct_change(x["close"], 20)
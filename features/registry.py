@@ -0,0 +1,131 @@
+"""
+registry.py
+
+[役割]
+- 特徴量の宣言 FeatureSpec（入力・窓・dtype・計算関数）とレジストリ
+- 依存関係（DAG）の解決: 要求された特徴量に必要なものだけをトポロジカル順に並べる
+
+入力（inputs）は「価格の基本列（close / volume / mkt_ret_1d）」か「他の特徴量名」。
+計算関数は func(panel, inputs) -> 行番号×銘柄 の行列
+  panel  : features.kernels.SymbolPanel
+  inputs : {入力名: 行番号×銘柄 の行列}
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from features.kernels import SymbolPanel
+
+FeatureFunc = Callable[[SymbolPanel, Dict[str, np.ndarray]], np.ndarray]
+
+# 価格データ側で用意する列（特徴量ではない入力）
+BASE_COLUMNS = ("close", "volume", "mkt_ret_1d")
+
+
+@dataclass(frozen=True)
+class FeatureSpec:
+    """
+    name    : 出力列名
+    inputs  : 入力（基本列 or 他の特徴量名）
+    window  : 銘柄ごとに遡る行数（キャッシュキー・差分計算の遡り幅に使う）
+    func    : 計算関数
+    dtype   : 出力 dtype
+    version : 計算内容を変えたら上げる（キャッシュを無効化する）
+    """
+    name: str
+    inputs: Tuple[str, ...]
+    window: int
+    func: FeatureFunc
+    dtype: str = "float64"
+    version: int = 1
+    description: str = ""
+
+
+class FeatureRegistry:
+    def __init__(self) -> None:
+        self._specs: Dict[str, FeatureSpec] = {}
+
+    def add(self, spec: FeatureSpec) -> FeatureSpec:
+        if spec.name in self._specs:
+            raise ValueError(f"feature '{spec.name}' は登録済みです")
+        if spec.name in BASE_COLUMNS:
+            raise ValueError(f"feature 名に基本列 '{spec.name}' は使えません")
+        self._specs[spec.name] = spec
+        return spec
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._specs
+
+    def __getitem__(self, name: str) -> FeatureSpec:
+        return self._specs[name]
+
+    def names(self) -> List[str]:
+        return list(self._specs)
+
+    def resolve(self, names: Optional[Iterable[str]] = None) -> List[FeatureSpec]:
+        """
+        names（None なら全部）の計算に必要な特徴量を依存順に返す。
+        未登録の入力（基本列以外）や循環依存は ValueError。
+        """
+        targets = list(self._specs) if names is None else list(names)
+        order: List[FeatureSpec] = []
+        state: Dict[str, int] = {}  # 1: 訪問中, 2: 完了
+
+        def _visit(name: str, path: Tuple[str, ...]) -> None:
+            if name in BASE_COLUMNS:
+                return
+            if name not in self._specs:
+                raise ValueError(f"未登録の feature / 入力です: {name}（依存: {' -> '.join(path + (name,))}）")
+            st = state.get(name)
+            if st == 2:
+                return
+            if st == 1:
+                raise ValueError(f"feature の依存が循環しています: {' -> '.join(path + (name,))}")
+            state[name] = 1
+            spec = self._specs[name]
+            for dep in spec.inputs:
+                _visit(dep, path + (name,))
+            state[name] = 2
+            order.append(spec)
+
+        for n in targets:
+            _visit(n, ())
+        return order
+
+    def lookback(self, names: Optional[Iterable[str]] = None) -> int:
+        """names の計算に必要な遡り行数（依存を辿った window の合計の最大）"""
+        need: Dict[str, int] = {}
+        for spec in self.resolve(names):
+            upstream = [need.get(d, 0) for d in spec.inputs if d not in BASE_COLUMNS]
+            need[spec.name] = spec.window + max(upstream, default=0)
+        return max(need.values(), default=0)
+
+
+REGISTRY = FeatureRegistry()
+
+
+def register(
+    name: str,
+    *,
+    inputs: Iterable[str],
+    window: int,
+    dtype: str = "float64",
+    version: int = 1,
+    description: str = "",
+):
+    """計算関数に付けるデコレータ（REGISTRY に登録する）"""
+    def _wrap(func: FeatureFunc) -> FeatureFunc:
+        REGISTRY.add(FeatureSpec(
+            name=name,
+            inputs=tuple(inputs),
+            window=int(window),
+            func=func,
+            dtype=dtype,
+            version=version,
+            description=description,
+        ))
+        return func
+    return _wrap
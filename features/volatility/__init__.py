@@ -0,0 +1,39 @@
+"""
+volatility: ボラティリティ・下落系の特徴量
+"""
+import numpy as np
+
+from features.kernels import rolling_beta, rolling_downside_beta, rolling_std
+from features.registry import register
+
+
+@register("vol_20d", inputs=("ret_1d",), window=20, description="20日リターンの標準偏差（min_periods=5）")
+def vol_20d(panel, x):
+    return rolling_std(x["ret_1d"], 20, 5)
+
+
+@register("downside_ret_1d", inputs=("ret_1d",), window=0, description="下落した日のみのリターン（それ以外・欠損は 0）")
+def downside_ret_1d(panel, x):
+    r = x["ret_1d"]
+    return np.where(r < 0, r, 0.0)
+
+
+@register("downside_vol_60d", inputs=("downside_ret_1d",), window=60,
+          description="下落日のボラティリティ（60日、min_periods=20）")
+def downside_vol_60d(panel, x):
+    return rolling_std(x["downside_ret_1d"], 60, 20)
+
+
+@register("down_beta_252d", inputs=("ret_1d", "mkt_ret_1d"), window=252,
+          description="下落相場（TOPIX < 0）でのベータ（252日、下落日 60 日以上）")
+def down_beta_252d(panel, x):
+    beta = rolling_downside_beta(
+        panel.code, panel.to_long(x["ret_1d"]), panel.to_long(x["mkt_ret_1d"]), window=252, min_periods=60
+    )
+    return panel.to_wide(beta)
+
+
+@register("beta_252d", inputs=("ret_1d", "mkt_ret_1d"), window=252,
+          description="TOPIX に対するベータ（252日、両方そろった日 60 日以上）")
+def beta_252d(panel, x):
+    return rolling_beta(x["ret_1d"], x["mkt_ret_1d"], window=252, min_periods=60)
@@ -3,7 +3,7 @@
 リバランス日をholding_horizonごとに設定し、その間は同じウェイトを保持
 """
 from pathlib import Path
-from typing import List
+from typing import List, Optional
 
 import pandas as pd
 import numpy as np
@@ -11,6 +11,7 @@ import numpy as np
 from scoring_engine import ScoringEngineConfig, build_daily_portfolio
 from event_guard import EventGuard
 from weights_cleaning import clean_target_weights
+from price_panel import PricePanel, load_matching_panel
 
 
 # バックテストモード: "z_lin" / "rank" / "z_clip_rank" / "z_lowvol" / "z_downvol" / "z_downbeta" / "z_downcombo"
@@ -80,6 +81,7 @@ def backtest_non_ladder(
     features: pd.DataFrame,
     prices: pd.DataFrame,
     holding_horizon: int,
+    panel: Optional[PricePanel] = None,
 ) -> pd.DataFrame:
     """
     非ラダー版（非重複ウィンドウ方式）でバックテストを実行
@@ -90,6 +92,8 @@ def backtest_non_ladder(
         features: 全銘柄×営業日の特徴量（daily_feature_scores.parquet）
         prices: 全銘柄×営業日の価格
         holding_horizon: 5, 10, 20, 60 など（保持期間）
+        panel: 日付×銘柄の価格パネル（price_panel.load_matching_panel(prices) など）。
+            明示的に渡したときだけ使い、prices と日付・銘柄が一致しなければ ValueError。省略時は prices から pivot で作る
     
     Returns:
         日次ポートフォリオリターンのDataFrame
@@ -100,21 +104,30 @@ def backtest_non_ladder(
     # 日付をソート
     features["date"] = pd.to_datetime(features["date"])
     features = features.sort_values("date")
-    dates = sorted(features["date"].unique())
+    dates = pd.DatetimeIndex(sorted(features["date"].unique()))
+    # 日付ごとの行位置（リバランス日ごとの全行スキャンを避ける）
+    rows_by_date = features.groupby("date", sort=False).indices
     
-    # 価格データを準備
-    prices["date"] = pd.to_datetime(prices["date"])
-    prices = prices.sort_values(["symbol", "date"])
-    
-    # 価格データを日付×銘柄のピボットテーブルに変換（高速化のため）
-    prices_pivot = prices.pivot_table(
-        index="date", 
-        columns="symbol", 
-        values="close"
-    )
-    
-    # 翌日のリターンを計算（close-to-close）
-    prices_ret = prices_pivot.pct_change().shift(-1)
+    # 価格パネル（日付×銘柄）: 呼び出し側が渡した memmap を共有し、無ければ prices から pivot で作る
+    if panel is not None:
+        panel.check_matches(prices)
+        prices_pivot = panel.frame("close")
+        # 翌日のリターン（close-to-close, pct_change().shift(-1) と同じ定義）
+        prices_ret = panel.frame("ret_fwd_1d")
+    else:
+        # 価格データを準備
+        prices["date"] = pd.to_datetime(prices["date"])
+        prices = prices.sort_values(["symbol", "date"])
+
+        # 価格データを日付×銘柄のピボットテーブルに変換（高速化のため）
+        prices_pivot = prices.pivot_table(
+            index="date",
+            columns="symbol",
+            values="close"
+        )
+
+        # 翌日のリターンを計算（close-to-close）
+        prices_ret = prices_pivot.pct_change().shift(-1)
     
     # ポートフォリオ構築用の設定（horizon に応じてスコア列を切り替え）
     score_col = get_score_col_for_horizon(holding_horizon)
@@ -123,12 +136,15 @@ def backtest_non_ladder(
     )
     
     # リバランス日を決定（holding_horizon ごと）
+    # （dates 上の位置も持っておき、保有期間は位置のスライスで取る）
     rebalance_dates = []
+    rebalance_pos = []
     last_rebalance_idx = -1
     
     for i, dt in enumerate(dates):
         if i == 0 or (i - last_rebalance_idx) >= holding_horizon:
             rebalance_dates.append(dt)
+            rebalance_pos.append(i)
             last_rebalance_idx = i
     
     print(f"  [H{holding_horizon}] 非ラダー方式バックテスト開始（リバランス日数: {len(rebalance_dates)} 日）")
@@ -139,7 +155,10 @@ def backtest_non_ladder(
     
     for i, rebalance_date in enumerate(rebalance_dates):
         # リバランス日の特徴量を取得
-        today_feat = features[features["date"] == rebalance_date].copy()
+        pos = rows_by_date.get(rebalance_date)
+        if pos is None:
+            continue
+        today_feat = features.iloc[pos]  # iloc は新しいフレームを返す（build_daily_portfolio 側でもコピーする）
         
         if today_feat.empty:
             continue
@@ -203,17 +222,11 @@ def backtest_non_ladder(
         # 次のリバランス日まで（または最後まで）のリターンを計算
         next_rebalance_idx = i + 1
         if next_rebalance_idx < len(rebalance_dates):
-            end_date = rebalance_dates[next_rebalance_idx]
-            holding_dates = [
-                d for d in dates 
-                if rebalance_date < d <= end_date
-            ]
+            # (rebalance_date, 次のリバランス日] の営業日
+            holding_dates = dates[rebalance_pos[i] + 1:rebalance_pos[next_rebalance_idx] + 1]
         else:
             # 最後のリバランス日以降は最後の日まで
-            holding_dates = [
-                d for d in dates 
-                if d > rebalance_date
-            ]
+            holding_dates = dates[rebalance_pos[i] + 1:]
         
         # 各日付でポートフォリオリターンを計算
         for trade_date in holding_dates:
@@ -252,7 +265,7 @@ def backtest_non_ladder(
 
 def main():
     """H=10の非ラダー版バックテストを実行"""
-    from horizon_ensemble import build_features_shared, calc_alpha_beta_for_horizon, summarize_horizon, compute_monthly_perf, print_horizon_performance
+    from horizon_ensemble import build_features_shared, backtest_feature_columns, calc_alpha_beta_for_horizon, summarize_horizon, compute_monthly_perf, print_horizon_performance
     
     horizon = 20
     
@@ -262,13 +275,16 @@ def main():
     
     # 共有featureと価格データを読み込み
     print("\n[STEP 1] 共有featureと価格データを読み込み中...")
-    features, prices = build_features_shared()
+    features, prices = build_features_shared(backtest_feature_columns(get_score_col_for_horizon(horizon)))
     print(f"  Features: {len(features)} rows")
     print(f"  Prices: {len(prices)} rows")
+    # 日付×銘柄の価格パネル（price_store 取り込み時に作った memmap）
+    panel = load_matching_panel(prices)
+    print(f"  Price panel: {'memmap' if panel is not None else 'なし（pivot で作成）'}")
     
     # バックテスト実行
     print(f"\n[STEP 2] H{horizon} 非ラダー版バックテスト実行中...")
-    df_pt = backtest_non_ladder(features, prices, horizon)
+    df_pt = backtest_non_ladder(features, prices, horizon, panel=panel)
     # ファイル名にモードを含める（非ラダー版）
     suffix_mode = get_mode_suffix()
     pt_path = Path(f"data/processed/paper_trade_h{horizon}_nonladder_{suffix_mode}.parquet")
@@ -1,7 +1,6 @@
 # scripts/build_features.py
 
 import pandas as pd
-import numpy as np
 from pathlib import Path
 import sys
 from pathlib import Path as PathLib
@@ -10,13 +9,27 @@ from pathlib import Path as PathLib
 sys.path.insert(0, str(PathLib(__file__).parent.parent))
 
 from feature_builder import FeatureBuilderConfig, build_feature_matrix
-from core.scoring_engine import compute_scores_all
+from core.scoring_engine import SCORING_VARIANTS, compute_scores_all
 import data_loader
+import feature_engine
+import feature_store
+import feature_stream
+import group_codes
 
+# スコアリングのグループ（group_codes.GROUP_CODE_COLUMNS のキー）。
+# sector 中立にするときは ("date", "sector") に変える（コードは保存済みなので groupby のコストは同じ）
+SCORE_GROUP_COLS = ("date",)
+# スコアの元カラム（ペナルティ適用前のスコア）と順位の向き（値が大きいほど rank 上位）
+SCORE_BASE_COL = "feature_raw"
+SCORE_ASCENDING = False
+
+# 差分モードで読む過去分（営業日）。down_beta_252d の 252行 + ret_1d の1行に、
+# 銘柄ごとの欠損日の余裕を足したもの
+WARMUP_SESSIONS = 300
 
-def main():
-    prices = data_loader.load_prices()
 
+def prepare_prices(prices: pd.DataFrame) -> pd.DataFrame:
+    """列名を補正し、(symbol, date) 順に並べて TOPIX の日次リターン mkt_ret_1d を付ける"""
     # ---------- カラム補正 ----------
     # date
     if "date" not in prices.columns:
@@ -45,24 +58,6 @@ def main():
     prices["date"] = pd.to_datetime(prices["date"])
     prices = prices.sort_values(["symbol", "date"])
 
-    # ---------- リターン ----------
-    prices["ret_1d"] = prices.groupby("symbol")["close"].pct_change()
-    prices["ret_5d"] = prices.groupby("symbol")["close"].pct_change(5)
-    prices["ret_20d"] = prices.groupby("symbol")["close"].pct_change(20)
-
-    # ---------- ボラ ----------
-    prices["vol_20d"] = (
-        prices.groupby("symbol")["ret_1d"]
-        .transform(lambda x: x.rolling(window=20, min_periods=5).std())
-    )
-
-    # ---------- ADV ----------
-    prices["turnover"] = prices["close"] * prices["volume"]
-    prices["adv_20d"] = (
-        prices.groupby("symbol")["turnover"]
-        .transform(lambda x: x.rolling(window=20, min_periods=5).mean())
-    )
-
     # ---------- TOPIX データの読み込みとマージ ----------
     tpx_path = Path("data/processed/index_tpx_daily.parquet")
     if tpx_path.exists():
@@ -71,7 +66,7 @@ def main():
         df_tpx["date"] = pd.to_datetime(df_tpx["trade_date"])
         # TOPIXの日次リターンを計算
         df_tpx["mkt_ret_1d"] = df_tpx["tpx_ret_cc"]
-        # prices にマージ
+        # prices にマージ（left なので symbol, date の並びは保たれる）
         prices = prices.merge(
             df_tpx[["date", "mkt_ret_1d"]],
             on="date",
@@ -81,47 +76,43 @@ def main():
         print("警告: TOPIXデータが見つかりません。mkt_ret_1d は使用できません。")
         prices["mkt_ret_1d"] = 0.0
 
-    # ---------- Variant E/F/G 用の特徴量 ----------
-    # downside_ret_1d: 下落した日のみのリターン
-    prices["downside_ret_1d"] = prices["ret_1d"].where(prices["ret_1d"] < 0, 0.0)
-    
-    # downside_vol_60d: 下落日のボラティリティ（60日ローリング）
-    prices["downside_vol_60d"] = (
-        prices.groupby("symbol")["downside_ret_1d"]
-        .transform(lambda x: x.rolling(window=60, min_periods=20).std())
-    )
-    
-    # down_beta_252d: 下落相場でのベータ（252日ローリング）
-    def rolling_downside_beta(r, m, window=252, min_periods=60):
-        """
-        下落相場（m < 0）のみを使ってベータを計算
-        """
-        out = []
-        for i in range(len(r)):
-            start = max(0, i - window + 1)
-            r_win = r.iloc[start:i+1]
-            m_win = m.iloc[start:i+1]
-            mask = m_win < 0
-            r_d = r_win[mask]
-            m_d = m_win[mask]
-            if len(r_d) < min_periods:
-                out.append(np.nan)
-            else:
-                cov = np.cov(r_d, m_d)[0, 1]
-                var = np.var(m_d)
-                out.append(cov / var if var > 0 else np.nan)
-        return pd.Series(out, index=r.index)
-    
-    # 各銘柄ごとにdownside betaを計算
-    prices["down_beta_252d"] = np.nan
-    for symbol in prices["symbol"].unique():
-        mask = prices["symbol"] == symbol
-        r = prices.loc[mask, "ret_1d"]
-        m = prices.loc[mask, "mkt_ret_1d"]
-        if len(r) > 0 and len(m) > 0 and m.notna().sum() > 0:
-            beta_series = rolling_downside_beta(r, m, window=252, min_periods=60)
-            prices.loc[mask, "down_beta_252d"] = beta_series.values
+    return prices
+
+
+def compute_features(prices: pd.DataFrame, variants=None) -> pd.DataFrame:
+    """
+    価格（長い形式）から daily_feature_scores の列を計算する。
+    variants（スコアリング Variant 名のリスト）を渡すと、その計算に必要な特徴量だけを計算する。
+    """
+    prices = prepare_prices(prices)
+
+    # ---------- リターン / ボラ / ADV / 下落系（Variant E/F/G 用） ----------
+    # 行×銘柄 の行列で一括計算（feature_engine）
+    #   ret_1d, ret_5d, ret_20d, vol_20d(20日std), turnover(close*volume), adv_20d(20日平均),
+    #   downside_ret_1d, downside_vol_60d(60日std), down_beta_252d(252日・下落日のみ),
+    #   beta_252d(252日・TOPIX ベータ)
+    #   特徴量は features/ のレジストリで宣言（依存解決・特徴量ごとのキャッシュ）
+    names = None if variants is None else feature_engine.required_features(variants)
+    prices = feature_engine.add_price_features(prices, mkt_col="mkt_ret_1d", names=names)
+    return score_features(prices, variants=variants)
 
+
+def selected_variants(variants=None):
+    """
+    実際に score 列を作る Variant（None なら全部）。
+    feature_score（= score_z_lin）は常に出力するので z_lin は必ず含める。
+    """
+    if variants is None:
+        return None
+    return list(dict.fromkeys(["z_lin", *variants]))
+
+
+def score_features(prices: pd.DataFrame, variants=None) -> pd.DataFrame:
+    """
+    価格系特徴量の付いた行から、日付ごとのクロスセクション（z-score・ペナルティ・スコア）を計算する。
+    行ごとの計算はすべて同じ日付の行だけを使う（ストリーミング更新でも1日分ずつ呼べる）。
+    variants を渡すと、その score 列（と score_z_lin）だけを計算する。
+    """
     # ---------- feature_builder 入力 ----------
     feature_cols = [
         "date",
@@ -135,42 +126,177 @@ def main():
         "downside_vol_60d",  # Variant E/F/G 用
         "mkt_ret_1d",  # Variant F/G 用
         "down_beta_252d",  # Variant F/G 用
+        "beta_252d",  # Variant D 用
     ]
+    feature_cols = [c for c in feature_cols if c in prices.columns]
     df_feat_input = prices[feature_cols].dropna(subset=["ret_5d", "ret_20d", "vol_20d", "adv_20d"])
 
     config = FeatureBuilderConfig()
     df_featured = build_feature_matrix(df_feat_input, config)
 
-    # Variant D 用の z-score カラムを事前に生成
-    g = df_featured.groupby("date")
-    
-    # 20日ボラの z-score
-    if "vol_20d" in df_featured.columns and "vol_20d_z" not in df_featured.columns:
-        from core.scoring_engine import _zscore
-        df_featured["vol_20d_z"] = g["vol_20d"].transform(_zscore)
-    
-    # もし beta_252d があるなら同様に（現時点では未実装）
-    if "beta_252d" in df_featured.columns and "beta_252d_z" not in df_featured.columns:
-        from core.scoring_engine import _zscore
-        df_featured["beta_252d_z"] = g["beta_252d"].transform(_zscore)
+    # Variant D 用の z-score カラム（vol_20d_z / beta_252d_z）を事前に生成
+    # 日付ごとの平均・標準偏差（ddof=1）を1回の groupby でまとめて求める（(x - mean) / (std + 1e-8)、Variant の z 項と同じ式）
+    z_src = [c for c in ("vol_20d", "beta_252d")
+             if c in df_featured.columns and f"{c}_z" not in df_featured.columns]
+    if z_src:
+        g = df_featured.groupby("date")[z_src]
+        mu = g.transform("mean")
+        sd = g.transform("std")
+        for c in z_src:
+            df_featured[f"{c}_z"] = (df_featured[c] - mu[c]) / (sd[c] + 1e-8)
+
+    # sector（JPX 上場銘柄一覧から結合）と、日付 / 日付×セクター / 日付×サイズバケットの整数コード
+    df_featured = group_codes.add_group_codes(df_featured)
 
     # ① z_lin と rank_only の両方の score 列を追加
     df_featured = compute_scores_all(
         df_featured,
-        base_col="feature_raw",  # ペナルティ適用前のスコアを base として使用
-        group_cols=("date",),  # 後で sector 中立にするときは ("date","sector") に変える
-        ascending=False,       # 「値が大きいほど rank 上位」なら False
+        base_col=SCORE_BASE_COL,  # ペナルティ適用前のスコアを base として使用
+        group_cols=SCORE_GROUP_COLS,
+        ascending=SCORE_ASCENDING,  # 「値が大きいほど rank 上位」なら False
+        variants=selected_variants(variants),
+        group_codes=group_codes.codes_for(df_featured, SCORE_GROUP_COLS),
     )
 
     # ② 既存コード互換のため、当面は z_lin を feature_score として使う
     df_featured["feature_score"] = df_featured["score_z_lin"]
+    return df_featured
+
+
+def feature_config_hash(variants=None) -> str:
+    """
+    daily_feature_scores の中身を決める設定のハッシュ（feature store のパーティションに記録する）
+    = 特徴量の宣言 ＋ FeatureBuilderConfig ＋ SCORING_VARIANTS ＋ セクター対応表・スコアリングのグループ
+    """
+    import hashlib
+    import json
+    from dataclasses import asdict
+
+    names = None if variants is None else feature_engine.required_features(variants)
+    selected = selected_variants(variants) or list(SCORING_VARIANTS)
+    payload = {
+        "features": feature_engine.features_fingerprint(names),
+        "builder": asdict(FeatureBuilderConfig()),
+        "variants": {k: (v if isinstance(v, dict) else asdict(v))
+                     for k, v in SCORING_VARIANTS.items() if k in selected},
+        "groups": {"sectors": group_codes.fingerprint(), "score_group_cols": list(SCORE_GROUP_COLS)},
+    }
+    return hashlib.sha1(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def load_trailing_prices(first_new_date: pd.Timestamp) -> pd.DataFrame:
+    """first_new_date の WARMUP_SESSIONS 営業日前から後の価格だけを読む"""
+    from trading_calendar import get_calendar
+
+    try:
+        start = get_calendar().offset(first_new_date, -WARMUP_SESSIONS)
+    except ValueError:
+        start = pd.NaT
+    if pd.isna(start):
+        start = first_new_date - pd.tseries.offsets.BDay(WARMUP_SESSIONS)
+
+    return load_prices_since(start)
 
-    out_path = Path("data/processed/daily_feature_scores.parquet")
-    out_path.parent.mkdir(parents=True, exist_ok=True)
-    df_featured.to_parquet(out_path, index=False)
 
-    print("feature matrix saved to:", out_path)
-    print(df_featured.tail())
+def load_prices_since(start: pd.Timestamp) -> pd.DataFrame:
+    """start 以降の価格だけを読む（price_store が新しければそちらから）"""
+    import price_store
+
+    if price_store.is_fresh():
+        return price_store.load_price_store(start=start)
+    prices = data_loader.load_prices()
+    return prices[pd.to_datetime(prices["date"]) >= start].reset_index(drop=True)
+
+
+def run_full(variants=None) -> pd.DataFrame:
+    prices = data_loader.load_prices()
+    df_featured = compute_features(prices, variants=variants)
+    out_dir = feature_store.write_features(df_featured, config_hash=feature_config_hash(variants))
+    print("feature matrix saved to:", out_dir)
+    return df_featured
+
+
+def run_incremental(variants=None) -> pd.DataFrame:
+    """
+    feature store の最終日より後の営業日だけを計算して追加する。
+    特徴量はすべて「銘柄ごとの過去 252 行以内」か「日付ごとのクロスセクション」なので、
+    直近 WARMUP_SESSIONS 営業日の価格から新しい日付の行をフル再構築と同じ値で作れる。
+    """
+    last = feature_store.last_date()
+    if last is None:
+        print("feature store が無いためフル再構築します")
+        return run_full(variants)
+
+    first_new = pd.Timestamp(last) + pd.Timedelta(days=1)
+    prices = load_trailing_prices(first_new)
+    if (pd.to_datetime(prices["date"]) > last).sum() == 0:
+        print(f"新しい営業日はありません（feature store の最終日: {last.date()}）")
+        return prices.iloc[0:0]
+
+    df_featured = compute_features(prices, variants=variants)
+    df_new = df_featured[df_featured["date"] > last]
+    parts = feature_store.append_features(df_new, config_hash=feature_config_hash(variants))
+    print(f"appended {df_new['date'].nunique()} dates ({len(df_new)} rows) to:", parts)
+    return df_new
+
+
+def run_stream(variants=None) -> pd.DataFrame:
+    """
+    ストリーミング更新: 保存済みの状態（feature_stream）を使い、新しい営業日の行を
+    銘柄ごとの O(1) 更新で計算して追加する（過去の価格は読み直さない）。
+    状態が無い・feature store の最終日とずれている場合は、直近 WARMUP_SESSIONS 営業日の価格を流して作り直す。
+    """
+    last = feature_store.last_date()
+    if last is None:
+        print("feature store が無いためフル再構築します")
+        return run_full(variants)
+
+    first_new = pd.Timestamp(last) + pd.Timedelta(days=1)
+    state = feature_stream.load_state()
+    if state is None or state.last_date != last:
+        print("ストリーミング状態を直近の価格から作り直します")
+        prices = prepare_prices(load_trailing_prices(first_new))
+        state = feature_stream.replay(prices[prices["date"] <= last])
+        prices = prices[prices["date"] > last]
+    else:
+        prices = prepare_prices(load_prices_since(first_new))
+
+    if prices.empty:
+        print(f"新しい営業日はありません（feature store の最終日: {last.date()}）")
+        state.save()
+        return prices
+
+    rows = [state.update(date, bars) for date, bars in prices.groupby("date", sort=True)]
+    df_new = score_features(pd.concat(rows, ignore_index=True), variants=variants)
+    parts = feature_store.append_features(df_new, config_hash=feature_config_hash(variants))
+    state.save()
+    print(f"appended {df_new['date'].nunique()} dates ({len(df_new)} rows) to:", parts)
+    return df_new
+
+
+def parse_args():
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Build daily_feature_scores (full rebuild or incremental append).")
+    mode = ap.add_mutually_exclusive_group()
+    mode.add_argument("--full", action="store_true", help="全期間を再計算して作り直す（既定）")
+    mode.add_argument("--incremental", action="store_true", help="最終日より後の営業日だけ計算して追加する")
+    mode.add_argument("--stream", action="store_true",
+                      help="保存済みのローリング状態から最終日より後の営業日だけ計算して追加する")
+    ap.add_argument("--variants", nargs="+", default=None,
+                    help="計算するスコアリング Variant（既定: SCORING_VARIANTS 全部。z_lin は常に含む）")
+    return ap.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.stream:
+        df = run_stream(args.variants)
+    elif args.incremental:
+        df = run_incremental(args.variants)
+    else:
+        df = run_full(args.variants)
+    print(df.tail())
 
 
 if __name__ == "__main__":
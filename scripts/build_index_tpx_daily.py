@@ -29,8 +29,8 @@ def main() -> None:
     for symbol in tpx_symbols:
         try:
             print(f"TOPIX データ取得を試行中: {symbol}")
-            # refresh=True で最新データを強制取得
-            df = dl.load_stock_data(symbol, refresh=True)
+            # incremental=True で最終保存日以降だけ取得して追記（キャッシュが無ければ全期間取得）
+            df = dl.load_stock_data(symbol, incremental=True)
             if df is not None and not df.empty:
                 used_symbol = symbol
                 print(f"✓ {symbol} で取得成功")
@@ -7,11 +7,12 @@ from pathlib import Path
 
 from scoring_engine import ScoringEngineConfig, build_daily_portfolio
 from event_guard import EventGuard
+from trading_calendar import get_calendar
+import feature_store
 
 
 def main():
-    feat_path = Path("data/processed/daily_feature_scores.parquet")
-    df_features = pd.read_parquet(feat_path)
+    df_features = feature_store.read_features()
 
     # EventGuard を初期化
     guard = EventGuard()
@@ -50,7 +51,8 @@ def main():
     # ペーパートレード用に trading_date と decision_date を追加
     # T日のポートフォリオは、T-1日に決めたという前提
     df_port["trading_date"] = df_port["date"]
-    df_port["decision_date"] = df_port["trading_date"] - pd.tseries.offsets.BDay(1)
+    # decision_date は JPX 営業日カレンダー上の前営業日（祝日・年末年始を飛ばす）
+    df_port["decision_date"] = get_calendar().prev_sessions(df_port["trading_date"]).values
 
     out_path = Path("data/processed/daily_portfolio_guarded.parquet")
     out_path.parent.mkdir(parents=True, exist_ok=True)
@@ -0,0 +1,434 @@
+"""
+bulk_downloader.py
+
+[役割]
+- 多数ティッカーの日足を並列・レート制限付きでダウンロードする共通エンジン
+  - 有界ワーカープール（ThreadPoolExecutor。HTTP の取得関数のみ。yfinance はスレッドセーフでないので直列）
+  - トークンバケットによるリクエストレート制限（プロバイダのスロットリング回避）
+  - 複数ティッカーのバッチリクエスト（yf.download に tickers をまとめて渡す）
+  - バッチで取れなかったティッカーは個別にリトライ（指数バックオフ）
+  - 進捗マニフェスト（JSON）で中断後に再開できる
+
+取得関数（fetch_batch）は差し替え可能:
+  - yf_batch_fetcher(...)   : yfinance の複数ティッカー一括取得
+  - http_csv_fetcher(...)   : URL テンプレートから CSV を取得（Stooq 互換 / ローカルのスタブ HTTP サーバ）
+
+どちらも {ticker: DataFrame(index=Date, columns=[Open, High, Low, Close, (Adj Close), Volume])}
+を返す（yf.download の単一ティッカー出力と同じ形）。
+
+使用例（ローカルのスタブサーバで動作確認）:
+  python -m http.server 8765 --directory /tmp/stub_prices   # /tmp/stub_prices/7203.T.csv など
+  python scripts/download_prices.py --tickers 7203.T,9984.T \
+      --source-url "http://127.0.0.1:8765/{ticker}.csv"
+
+セルフチェック（スタブサーバを自前で立てて、レート制限・リトライ・マニフェスト再開を確かめる）:
+  python scripts/bulk_downloader.py --self-check
+"""
+from __future__ import annotations
+
+import io
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Sequence
+
+import pandas as pd
+
+try:
+    import yfinance as yf  # type: ignore
+except Exception:
+    yf = None
+
+try:
+    import requests  # type: ignore
+except Exception:
+    requests = None
+
+BatchFetcher = Callable[[Sequence[str]], Dict[str, pd.DataFrame]]
+ResultHandler = Callable[[str, pd.DataFrame], None]
+
+# yf.download は結果・エラーをモジュール共有の dict（yfinance.shared._DFS / _ERRORS）に集めるため、
+# 複数スレッドから同時に呼ぶと他のバッチのティッカーを取り込んだり失ったりする。プロセス内で1つずつ呼ぶ
+_YF_LOCK = threading.Lock()
+
+
+# -------------------- レート制限 -------------------- #
+class TokenBucket:
+    """
+    スレッドセーフなトークンバケット。
+    rate 個/秒 でトークンが補充され、最大 capacity 個まで貯まる。
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None) -> None:
+        if rate <= 0:
+            raise ValueError(f"rate must be positive: {rate}")
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1.0) -> None:
+        """トークンが貯まるまでブロックしてから消費する"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+# -------------------- 進捗マニフェスト -------------------- #
+class DownloadManifest:
+    """
+    ティッカーごとの取得状況を JSON に保存する（中断→再開用）。
+      {"7203.T": {"status": "done", "rows": 2450, "attempts": 1, "updated_at": ...}, ...}
+    status: done / empty / failed
+    """
+
+    def __init__(self, path: Optional[Path]) -> None:
+        self.path = Path(path) if path is not None else None
+        self._lock = threading.Lock()
+        self.entries: Dict[str, dict] = {}
+        if self.path is not None and self.path.exists():
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self.entries = json.load(f)
+            except Exception:
+                self.entries = {}
+
+    def is_done(self, ticker: str) -> bool:
+        return self.entries.get(ticker, {}).get("status") in ("done", "empty")
+
+    def pending(self, tickers: Iterable[str]) -> List[str]:
+        return [t for t in tickers if not self.is_done(t)]
+
+    def mark(self, ticker: str, status: str, *, rows: int = 0, attempts: int = 1, error: Optional[str] = None) -> None:
+        with self._lock:
+            self.entries[ticker] = {
+                "status": status,
+                "rows": int(rows),
+                "attempts": int(attempts),
+                "updated_at": time.time(),
+                **({"error": error} if error else {}),
+            }
+            self._save_locked()
+
+    def _save_locked(self) -> None:
+        if self.path is None:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f, ensure_ascii=False, indent=1)
+        tmp.replace(self.path)
+
+    def summary(self) -> Dict[str, int]:
+        out: Dict[str, int] = {}
+        for e in self.entries.values():
+            out[e.get("status", "?")] = out.get(e.get("status", "?"), 0) + 1
+        return out
+
+
+# -------------------- 取得関数 -------------------- #
+def _split_batch_frame(data: pd.DataFrame, tickers: Sequence[str]) -> Dict[str, pd.DataFrame]:
+    """yf.download の複数ティッカー出力（MultiIndex 列）をティッカーごとに分割"""
+    out: Dict[str, pd.DataFrame] = {}
+    if data is None or data.empty:
+        return out
+    if isinstance(data.columns, pd.MultiIndex):
+        for lvl in range(data.columns.nlevels):
+            values = set(data.columns.get_level_values(lvl))
+            if values & set(tickers):
+                for t in tickers:
+                    if t in values:
+                        df = data.xs(t, axis=1, level=lvl).dropna(how="all")
+                        if not df.empty:
+                            out[t] = df
+                return out
+        return out
+    if len(tickers) == 1:
+        df = data.dropna(how="all")
+        if not df.empty:
+            out[tickers[0]] = df
+    return out
+
+
+def yf_batch_fetcher(
+    *,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    period: Optional[str] = None,
+) -> BatchFetcher:
+    """
+    yfinance の複数ティッカー一括取得（1バッチ = 1リクエスト）。
+    yf.download は _YF_LOCK で直列化し、BulkDownloader もこの取得関数ではワーカー1本で動かす
+    （スループットはバッチサイズとトークンバケットで調整する）。
+    """
+    if yf is None:
+        raise RuntimeError("yfinance が利用できません。pip install yfinance を実行してください。")
+
+    window: dict = {}
+    if period is not None:
+        window["period"] = period
+    else:
+        window["start"] = start
+        window["end"] = end or date.today().isoformat()
+
+    def _fetch(tickers: Sequence[str]) -> Dict[str, pd.DataFrame]:
+        with _YF_LOCK:
+            data = yf.download(
+                list(tickers),
+                **window,
+                interval="1d",
+                auto_adjust=False,
+                progress=False,
+                threads=False,
+                group_by="ticker",
+            )
+        return _split_batch_frame(data, tickers)
+
+    _fetch.serial = True  # BulkDownloader はワーカー1本で呼ぶ
+    return _fetch
+
+
+def http_csv_fetcher(url_template: str, *, timeout: int = 20, headers: Optional[dict] = None) -> BatchFetcher:
+    """
+    url_template（例: "http://127.0.0.1:8765/{ticker}.csv"）から1ティッカーずつ CSV を取得。
+    CSV は Date, Open, High, Low, Close, (Adj Close), Volume を想定（Stooq 互換）。
+    接続はスレッドごとの requests.Session で使い回す。
+    """
+    if requests is None:
+        raise RuntimeError("requests が利用できません。pip install requests を実行してください。")
+    local = threading.local()
+    headers = headers or {"User-Agent": "Mozilla/5.0"}
+
+    def _session():
+        if getattr(local, "session", None) is None:
+            local.session = requests.Session()
+        return local.session
+
+    def _fetch(tickers: Sequence[str]) -> Dict[str, pd.DataFrame]:
+        out: Dict[str, pd.DataFrame] = {}
+        for t in tickers:
+            r = _session().get(url_template.format(ticker=t), headers=headers, timeout=timeout)
+            if r.status_code == 404:
+                continue
+            r.raise_for_status()
+            df = pd.read_csv(io.StringIO(r.text))
+            if "Date" not in df.columns or df.empty:
+                continue
+            df["Date"] = pd.to_datetime(df["Date"], errors="coerce")
+            df = df.dropna(subset=["Date"]).set_index("Date")
+            df = df.apply(pd.to_numeric, errors="coerce")
+            out[t] = df
+        return out
+
+    return _fetch
+
+
+# -------------------- エンジン -------------------- #
+class BulkDownloader:
+    """
+    fetch_batch をバッチ単位で並列実行し、取れたティッカーを on_result に渡す。
+
+    - バッチは batch_size ティッカーずつ。1リクエストごとに TokenBucket を1つ消費
+    - バッチで欠けた／空だったティッカーは個別に最大 max_retries 回リトライ
+    - manifest があれば完了済みティッカーはスキップし、結果を逐次記録する
+    - fetch_batch.serial が True（yf_batch_fetcher）ならワーカーは1本（並列化は http_csv_fetcher などのみ）
+    """
+
+    def __init__(
+        self,
+        fetch_batch: BatchFetcher,
+        *,
+        batch_size: int = 20,
+        max_workers: int = 4,
+        rate_per_sec: float = 2.0,
+        burst: Optional[float] = None,
+        max_retries: int = 3,
+        backoff: float = 1.5,
+        manifest: Optional[DownloadManifest] = None,
+        log: Callable[[str], None] = print,
+    ) -> None:
+        self.fetch_batch = fetch_batch
+        self.batch_size = max(1, int(batch_size))
+        self.max_workers = max(1, int(max_workers))
+        if getattr(fetch_batch, "serial", False) and self.max_workers > 1:
+            log(f"[bulk_downloader] この取得関数はスレッドセーフでないため workers={self.max_workers} → 1 で実行します")
+            self.max_workers = 1
+        self.bucket = TokenBucket(rate_per_sec, burst)
+        self.max_retries = max(0, int(max_retries))
+        self.backoff = backoff
+        self.manifest = manifest or DownloadManifest(None)
+        self.log = log
+
+    def _call(self, tickers: Sequence[str]) -> Dict[str, pd.DataFrame]:
+        self.bucket.acquire()
+        return self.fetch_batch(tickers)
+
+    def _retry_one(self, ticker: str, first_error: Optional[str]) -> tuple:
+        """個別リトライ。戻り値: (DataFrame or None, attempts, error)"""
+        err = first_error
+        for i in range(self.max_retries):
+            if i:
+                time.sleep(self.backoff ** i)
+            try:
+                df = self._call([ticker]).get(ticker)
+                if df is not None and not df.empty:
+                    return df, i + 2, None
+                err = None  # 取れたが空 → データなし
+            except Exception as e:
+                err = str(e)
+        return None, self.max_retries + 1, err
+
+    def _run_batch(self, batch: Sequence[str], on_result: ResultHandler) -> Dict[str, str]:
+        status: Dict[str, str] = {}
+        try:
+            got = self._call(batch)
+            batch_err = None
+        except Exception as e:
+            got, batch_err = {}, str(e)
+
+        for t in batch:
+            df = got.get(t)
+            attempts = 1
+            err = batch_err
+            if df is None or df.empty:
+                df, attempts, err = self._retry_one(t, batch_err)
+            if df is None or df.empty:
+                st = "failed" if err else "empty"
+                self.manifest.mark(t, st, attempts=attempts, error=err)
+                status[t] = st
+                continue
+            try:
+                on_result(t, df)
+            except Exception as e:
+                self.manifest.mark(t, "failed", attempts=attempts, error=f"on_result: {e}")
+                status[t] = "failed"
+                continue
+            self.manifest.mark(t, "done", rows=len(df), attempts=attempts)
+            status[t] = "done"
+        return status
+
+    def run(self, tickers: Sequence[str], on_result: ResultHandler) -> Dict[str, str]:
+        """
+        tickers を取得して on_result(ticker, df) を呼ぶ（ワーカースレッドから呼ばれる）。
+        戻り値: {ticker: "done" | "empty" | "failed"}（今回処理した分のみ）
+        """
+        todo = self.manifest.pending(dict.fromkeys(tickers))
+        skipped = len(set(tickers)) - len(todo)
+        batches = [todo[i:i + self.batch_size] for i in range(0, len(todo), self.batch_size)]
+        self.log(f"[bulk_downloader] {len(todo)} tickers in {len(batches)} batches "
+                 f"(skip {skipped} done, workers={self.max_workers}, rate={self.bucket.rate}/s)")
+
+        result: Dict[str, str] = {}
+        t0 = time.time()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as ex:
+            futures = [ex.submit(self._run_batch, b, on_result) for b in batches]
+            for n, fut in enumerate(as_completed(futures), 1):
+                result.update(fut.result())
+                if n % 10 == 0 or n == len(futures):
+                    self.log(f"[bulk_downloader] {n}/{len(futures)} batches ({time.time() - t0:.1f}s)")
+        return result
+
+
+# -------------------- セルフチェック -------------------- #
+def self_check() -> None:
+    """
+    localhost のスタブ HTTP サーバ（http.server）に対して http_csv_fetcher + BulkDownloader を動かし、
+    トークンバケット・リトライ（バックオフ）・404・マニフェストからの再開を確かめる。
+    """
+    import tempfile
+    from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+    # TokenBucket: burst を使い切った後は rate 個/秒 に抑えられる
+    bucket = TokenBucket(rate=20.0, capacity=2)
+    t0 = time.monotonic()
+    for _ in range(12):
+        bucket.acquire()
+    elapsed = time.monotonic() - t0
+    assert elapsed >= (12 - 2) / 20.0 * 0.9, f"token bucket too fast: {elapsed:.3f}s"
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        csv = "Date,Open,High,Low,Close,Adj Close,Volume\n2024-01-04,100,101,99,100,100,1000\n" \
+              "2024-01-05,100,102,99,101,101,1200\n"
+        for t in ("1001.T", "1002.T", "1003.T", "FLAKY.T"):
+            (root / f"{t}.csv").write_text(csv, encoding="utf-8")
+
+        hits: Dict[str, int] = {}
+        hits_lock = threading.Lock()
+
+        class Handler(SimpleHTTPRequestHandler):
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, directory=str(root), **kwargs)
+
+            def do_GET(self):
+                name = self.path.lstrip("/")
+                with hits_lock:
+                    hits[name] = hits.get(name, 0) + 1
+                    n = hits[name]
+                if name == "FLAKY.T.csv" and n == 1:  # 1回目だけ 503 → 個別リトライで取れる
+                    self.send_error(503)
+                    return
+                super().do_GET()
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            url = f"http://127.0.0.1:{server.server_address[1]}/{{ticker}}.csv"
+            fetch = http_csv_fetcher(url, timeout=5)
+            manifest_path = root / "manifest.json"
+            got: Dict[str, pd.DataFrame] = {}
+            got_lock = threading.Lock()
+
+            def on_result(t: str, df: pd.DataFrame) -> None:
+                with got_lock:
+                    got[t] = df
+
+            def engine() -> BulkDownloader:
+                return BulkDownloader(fetch, batch_size=2, max_workers=2, rate_per_sec=50.0,
+                                      max_retries=2, backoff=1.1,
+                                      manifest=DownloadManifest(manifest_path), log=lambda msg: None)
+
+            # 1回目: 1003.T 以外（再開を確かめるため）
+            status = engine().run(["1001.T", "1002.T", "FLAKY.T", "MISSING.T"], on_result)
+            assert status == {"1001.T": "done", "1002.T": "done", "FLAKY.T": "done", "MISSING.T": "empty"}, status
+            # バッチ [FLAKY.T, MISSING.T] は FLAKY.T の 503 で失敗 → 両方を個別リトライ
+            assert hits["FLAKY.T.csv"] == 2, hits
+            assert hits["MISSING.T.csv"] == 2, hits  # 404 は空として max_retries 回まで
+            assert list(got["1001.T"].columns) == ["Open", "High", "Low", "Close", "Adj Close", "Volume"]
+            assert len(got["1001.T"]) == 2 and isinstance(got["1001.T"].index, pd.DatetimeIndex)
+
+            # 2回目: マニフェストで完了済み（done / empty）はスキップし、新しいティッカーだけ取る
+            before = dict(hits)
+            status = engine().run(["1001.T", "1002.T", "1003.T", "FLAKY.T", "MISSING.T"], on_result)
+            assert status == {"1003.T": "done"}, status
+            assert {k: v - before.get(k, 0) for k, v in hits.items() if v != before.get(k, 0)} == {"1003.T.csv": 1}
+            assert DownloadManifest(manifest_path).summary() == {"done": 4, "empty": 1}
+        finally:
+            server.shutdown()
+            server.server_close()
+    print("[bulk_downloader] self-check ok")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser(description="bulk_downloader のセルフチェック（localhost のスタブ HTTP サーバ）")
+    ap.add_argument("--self-check", action="store_true", help="トークンバケット・リトライ・マニフェスト再開を確かめる")
+    if ap.parse_args().self_check:
+        self_check()
+    else:
+        ap.print_help()
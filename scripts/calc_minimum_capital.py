@@ -22,6 +22,8 @@ warnings.filterwarnings('ignore')
 import pandas as pd
 import numpy as np
 
+import price_cache  # 同一プロセス内の再読込を省く（mtime で無効化）
+
 DATA_DIR = Path("data/processed")
 RAW_DATA_DIR = Path("data/raw")
 
@@ -43,7 +45,7 @@ def load_inverse_etf_price() -> float:
     for path in inverse_paths:
         if path.exists():
             try:
-                df = pd.read_parquet(path)
+                df = price_cache.read_parquet(path)
                 
                 # 日付カラムを確認
                 date_col = None
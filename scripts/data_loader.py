@@ -6,20 +6,29 @@ DataLoader: 日本株/為替/VIX/先物のローカル↔取得↔保存（安
 - VIX は FRED → Stooq → yfinance の多段フォールバック
 - 先物は NK=F 失敗時に ^N225 へフォールバック
 - Stooq/FRED はHTTPリトライ＋certifiで安定化
+  - keep-alive の共有 Session（接続プール）を使い回す
+  - ETag / Last-Modified による条件付きGET（304 ならローカルのレスポンスキャッシュを返す）
+  - 直前に失敗したホスト／URLは一定時間リトライしない（ネガティブキャッシュ）
 - 空CSVはキャッシュ扱いしない
 - offline_first=True でローカル優先（通信しない）
+- incremental=True で差分更新（最終日以降だけ取得し、重なり区間を検証して追記）
 
 出力列: [date, open, high, low, close, adj_close, volume, turnover]
 """
 from __future__ import annotations
 
 import ast
+import hashlib
 import io
+import json
+import threading
 import time
 import typing as t
 from dataclasses import dataclass
 from pathlib import Path
+from urllib.parse import urlsplit
 
+import numpy as np
 import pandas as pd
 import certifi
 
@@ -36,6 +45,13 @@ except Exception:
 DATE_COL = "date"
 STD_COLS = [DATE_COL, "open", "high", "low", "close", "adj_close", "volume", "turnover"]
 
+# 差分更新: 最終保存日からこの日数（暦日）さかのぼって取り直し、重なり区間で整合性を確認する
+INCREMENTAL_OVERLAP_DAYS = 10
+# 重なり区間で照合する列（配当調整は adj_close だけ、分割は close と volume も変わる）
+INCREMENTAL_CHECK_COLS = ("close", "adj_close", "volume")
+# 重なり区間の照合の許容誤差（CSV は float32 で保存しているため）
+INCREMENTAL_RTOL = 1e-4
+
 
 @dataclass
 class SaveSpec:
@@ -45,21 +61,129 @@ class SaveSpec:
 
 
 # -------------------- HTTP with retry -------------------- #
-def _http_get_with_retry(url: str, headers=None, timeout: int = 20, tries: int = 3, backoff: float = 1.5):
-    """小さめのHTTP GETリトライ（証明書はcertifi）"""
+# 接続プール（keep-alive）付きの共有 Session
+HTTP_POOL_CONNECTIONS = 8
+HTTP_POOL_MAXSIZE = 16
+# 失敗したホスト／URLを再試行しない秒数
+NEGATIVE_CACHE_TTL = 300.0
+
+_session = None
+_session_lock = threading.Lock()
+# key: "host:<netloc>" or "url:<url>" → 再試行を許可する時刻（time.monotonic）
+_negative_cache: t.Dict[str, float] = {}
+_negative_lock = threading.Lock()
+
+
+@dataclass
+class HttpResponse:
+    """_http_get_with_retry の戻り値（呼び出し側は text だけを使う）"""
+    text: str
+    status_code: int
+    from_cache: bool = False
+
+
+def _get_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            s = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=HTTP_POOL_CONNECTIONS,
+                pool_maxsize=HTTP_POOL_MAXSIZE,
+                max_retries=0,
+            )
+            s.mount("https://", adapter)
+            s.mount("http://", adapter)
+            s.verify = certifi.where()
+            _session = s
+        return _session
+
+
+def _negative_check(url: str) -> None:
+    now = time.monotonic()
+    keys = (f"host:{urlsplit(url).netloc}", f"url:{url}")
+    with _negative_lock:
+        for key in keys:
+            until = _negative_cache.get(key)
+            if until is not None and now < until:
+                raise RuntimeError(f"直前に失敗したため {NEGATIVE_CACHE_TTL:.0f}s 間スキップ中: {key}")
+
+
+def _negative_mark(url: str, err: Exception) -> None:
+    """4xx（429 以外）は URL 単位、それ以外（接続断・429・5xx）はホスト単位で記録"""
+    status = getattr(getattr(err, "response", None), "status_code", None)
+    if status is not None and 400 <= status < 500 and status != 429:
+        key = f"url:{url}"
+    else:
+        key = f"host:{urlsplit(url).netloc}"
+    with _negative_lock:
+        _negative_cache[key] = time.monotonic() + NEGATIVE_CACHE_TTL
+
+
+def _cache_paths(cache_dir: Path, url: str) -> t.Tuple[Path, Path]:
+    key = hashlib.sha1(url.encode("utf-8")).hexdigest()
+    return cache_dir / f"{key}.json", cache_dir / f"{key}.body"
+
+
+def _http_get_with_retry(
+    url: str,
+    headers=None,
+    timeout: int = 20,
+    tries: int = 3,
+    backoff: float = 1.5,
+    cache_dir: t.Optional[Path] = None,
+) -> HttpResponse:
+    """
+    小さめのHTTP GETリトライ（証明書はcertifi）。
+    cache_dir を渡すと ETag / Last-Modified で条件付きGETし、304 ならキャッシュ本文を返す。
+    """
     if requests is None:
         raise RuntimeError("requests が利用できません。pip install requests を実行してください。")
-    headers = headers or {"User-Agent": "Mozilla/5.0"}
+    _negative_check(url)
+    headers = dict(headers or {"User-Agent": "Mozilla/5.0"})
+
+    meta_path = body_path = None
+    meta: dict = {}
+    if cache_dir is not None:
+        meta_path, body_path = _cache_paths(Path(cache_dir), url)
+        if meta_path.exists() and body_path.exists():
+            try:
+                with open(meta_path, "r", encoding="utf-8") as f:
+                    meta = json.load(f)
+            except Exception:
+                meta = {}
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
     last_err = None
     for i in range(tries):
         try:
-            r = requests.get(url, headers=headers, timeout=timeout, verify=certifi.where())
+            r = _get_session().get(url, headers=headers, timeout=timeout)
+            if r.status_code == 304 and body_path is not None and meta:
+                return HttpResponse(body_path.read_text(encoding="utf-8"), 304, from_cache=True)
             r.raise_for_status()
-            return r
+            if meta_path is not None and (r.headers.get("ETag") or r.headers.get("Last-Modified")):
+                meta_path.parent.mkdir(parents=True, exist_ok=True)
+                body_path.write_text(r.text, encoding="utf-8")
+                with open(meta_path, "w", encoding="utf-8") as f:
+                    json.dump({
+                        "url": url,
+                        "etag": r.headers.get("ETag"),
+                        "last_modified": r.headers.get("Last-Modified"),
+                        "fetched_at": time.time(),
+                    }, f)
+            return HttpResponse(r.text, r.status_code)
         except Exception as e:
             last_err = e
+            status = getattr(getattr(e, "response", None), "status_code", None)
+            # 429 以外の 4xx はリトライしても変わらない
+            if status is not None and 400 <= status < 500 and status != 429:
+                break
             if i < tries - 1:
                 time.sleep(backoff ** i)
+    _negative_mark(url, last_err)
     raise last_err
 
 
@@ -70,12 +194,20 @@ class DataLoader:
         self.offline_first = offline_first
         for sd in ("prices", "fx", "vix", "futures"):
             (self.data_dir / sd).mkdir(parents=True, exist_ok=True)
+        # Stooq/FRED の条件付きGET用レスポンスキャッシュ
+        self.http_cache_dir = self.data_dir / "_http_cache"
 
     # ========= 公開API ========= #
-    def load_stock_data(self, symbol: str, *, refresh: bool = False) -> pd.DataFrame:
+    def load_stock_data(self, symbol: str, *, refresh: bool = False, incremental: bool = False) -> pd.DataFrame:
         sym = self._normalize_jp_symbol(symbol)
         spec = SaveSpec("prices", f"prices_{sym}")
-        return self._read_or_fetch(spec, fetcher=lambda: self._fetch_stock_yf(sym), refresh=refresh)
+        return self._read_or_fetch(
+            spec,
+            fetcher=lambda: self._fetch_stock_yf(sym),
+            refresh=refresh,
+            incremental=incremental,
+            tail_fetcher=lambda start: self._fetch_stock_yf(sym, start=start),
+        )
 
     def load_volume_data(self, symbol: str, *, refresh: bool = False) -> pd.DataFrame:
         df = self.load_stock_data(symbol, refresh=refresh)
@@ -90,24 +222,32 @@ class DataLoader:
         spec = SaveSpec("vix", "vix_VIXCLS")
         return self._read_or_fetch(spec, fetcher=self._fetch_vix_multi, refresh=refresh)
 
-    def load_futures_data(self, contract: str = "NK=F", *, refresh: bool = False) -> pd.DataFrame:
+    def load_futures_data(self, contract: str = "NK=F", *, refresh: bool = False, incremental: bool = False) -> pd.DataFrame:
         spec = SaveSpec("futures", f"futures_{contract}")
-        def _fetch():
+        def _fetch(start=None):
             try:
-                return self._fetch_stock_yf(contract)
+                return self._fetch_stock_yf(contract, start=start)
             except Exception:
                 # 現物指数にフォールバック
-                return self._fetch_stock_yf("^N225")
-        return self._read_or_fetch(spec, fetcher=_fetch, refresh=refresh)
+                return self._fetch_stock_yf("^N225", start=start)
+        return self._read_or_fetch(spec, fetcher=_fetch, refresh=refresh, incremental=incremental, tail_fetcher=_fetch)
 
     # ========= 取得系 ========= #
-    def _fetch_stock_yf(self, symbol: str) -> pd.DataFrame:
+    def _fetch_stock_yf(self, symbol: str, start: t.Optional[pd.Timestamp] = None) -> pd.DataFrame:
+        """
+        start を渡すとその日以降だけを取得する（差分更新用）。
+        省略時は period="max" → "1y" の順に全期間を取得。
+        """
         if yf is None:
             raise RuntimeError("yfinance が利用できません。pip install yfinance を実行してください。")
         last_err = None
-        for period in ("max", "1y"):
+        if start is not None:
+            windows = [{"start": pd.Timestamp(start).strftime("%Y-%m-%d")}]
+        else:
+            windows = [{"period": "max"}, {"period": "1y"}]
+        for window in windows:
             try:
-                df = yf.download(symbol, period=period, interval="1d", auto_adjust=False, progress=False, threads=False)
+                df = yf.download(symbol, **window, interval="1d", auto_adjust=False, progress=False, threads=False)
                 if df is not None and not df.empty:
                     df = df.reset_index()
                     # インデックス列名の判定
@@ -170,7 +310,7 @@ class DataLoader:
             raise RuntimeError(f"Stooq対応外のシンボル: {symbol}")
         stooq_sym = f"{code}.jp"
         url = f"https://stooq.com/q/d/l/?s={stooq_sym}&i=d"
-        r = _http_get_with_retry(url)
+        r = _http_get_with_retry(url, cache_dir=self.http_cache_dir)
         df = pd.read_csv(io.StringIO(r.text))
         required = {"Date", "Open", "High", "Low", "Close"}
         if not required.issubset(df.columns):
@@ -196,7 +336,7 @@ class DataLoader:
         # 1) Stooq
         try:
             url = f"https://stooq.com/q/d/l/?s={pair.lower()}&i=d"
-            r = _http_get_with_retry(url, headers={"User-Agent": "Mozilla/5.0"})
+            r = _http_get_with_retry(url, headers={"User-Agent": "Mozilla/5.0"}, cache_dir=self.http_cache_dir)
             df = pd.read_csv(io.StringIO(r.text))
             if not {"Date", "Open", "High", "Low", "Close"}.issubset(df.columns):
                 raise ValueError("Unexpected columns from Stooq")
@@ -222,7 +362,7 @@ class DataLoader:
         ]
         for url in fred_urls:
             try:
-                r = _http_get_with_retry(url, headers={"User-Agent": "Mozilla/5.0"})
+                r = _http_get_with_retry(url, headers={"User-Agent": "Mozilla/5.0"}, cache_dir=self.http_cache_dir)
                 df = pd.read_csv(io.StringIO(r.text))
                 if "DATE" in df.columns and "VIXCLS" in df.columns:
                     df.rename(columns={"DATE": DATE_COL, "VIXCLS": "close"}, inplace=True)
@@ -243,7 +383,7 @@ class DataLoader:
         # 2) Stooq (vix)
         try:
             url = "https://stooq.com/q/d/l/?s=vix&i=d"
-            r = _http_get_with_retry(url, headers={"User-Agent": "Mozilla/5.0"})
+            r = _http_get_with_retry(url, headers={"User-Agent": "Mozilla/5.0"}, cache_dir=self.http_cache_dir)
             df = pd.read_csv(io.StringIO(r.text))
             df.rename(columns={"Date": DATE_COL, "Open": "open", "High": "high", "Low": "low", "Close": "close"}, inplace=True)
             df[DATE_COL] = pd.to_datetime(df[DATE_COL], errors="coerce")
@@ -263,7 +403,20 @@ class DataLoader:
             raise RuntimeError(f"VIX取得に失敗（FRED/Stooq/yf）: {errors}")
 
     # ========= IO共通 ========= #
-    def _read_or_fetch(self, spec: SaveSpec, *, fetcher: t.Callable[[], pd.DataFrame], refresh: bool) -> pd.DataFrame:
+    def _read_or_fetch(
+        self,
+        spec: SaveSpec,
+        *,
+        fetcher: t.Callable[[], pd.DataFrame],
+        refresh: bool,
+        incremental: bool = False,
+        tail_fetcher: t.Optional[t.Callable[[pd.Timestamp], pd.DataFrame]] = None,
+    ) -> pd.DataFrame:
+        """
+        refresh=True: 全期間を取り直して保存
+        incremental=True: 保存済みCSVの最終日以降だけ tail_fetcher で取得して追記
+                          （重なり区間が一致しない／CSVが無い場合は全期間取得にフォールバック）
+        """
         path_csv = self._path(spec, "csv")
         path_pq = self._path(spec, "parquet")
 
@@ -279,6 +432,21 @@ class DataLoader:
         # offline_first: ローカルがあれば通信しない
         if (not refresh) and self.offline_first and _is_valid_csv(path_csv):
             return self._read_csv(path_csv)
+        # incremental: 保存済みCSVの末尾以降だけ取得して追記
+        if (not refresh) and incremental and tail_fetcher is not None and _is_valid_csv(path_csv):
+            cached = self._read_csv(path_csv)
+            try:
+                merged = self._append_tail(cached, tail_fetcher)
+            except Exception as e:
+                print(f"[DataLoader] 差分取得に失敗、全期間取得にフォールバック（{spec.stem}）: {e}")
+                merged = None
+            if merged is not None:
+                if len(merged) > len(cached):
+                    self._write_csv(merged, path_csv)
+                return merged
+            # 重なり区間の不一致など → 全期間を取り直す
+            refresh = True
+
         if (not refresh) and _is_valid_csv(path_csv):
             return self._read_csv(path_csv)
         if (not refresh) and path_pq.exists():
@@ -291,6 +459,46 @@ class DataLoader:
         self._write_csv(df, path_csv)
         return df
 
+    def _append_tail(
+        self,
+        cached: pd.DataFrame,
+        tail_fetcher: t.Callable[[pd.Timestamp], pd.DataFrame],
+    ) -> t.Optional[pd.DataFrame]:
+        """
+        保存済みデータの末尾 INCREMENTAL_OVERLAP_DAYS 日から取り直し、
+        重なり区間の INCREMENTAL_CHECK_COLS が保存値と一致すれば新しい日付だけを追記して返す。
+        一致しない（分割・配当で過去値が改訂された等）場合は None（全期間取り直し）。
+        配当の調整は close を変えず adj_close だけを変えるので、adj_close も必ず照合する
+        （close だけだと古い調整基準の履歴に新しいバーを継ぎ足してしまう）。
+        """
+        cached = self._normalize_df(cached)
+        if cached.empty:
+            return None
+        last = cached[DATE_COL].max()
+        start = last - pd.Timedelta(days=INCREMENTAL_OVERLAP_DAYS)
+
+        tail = tail_fetcher(start)
+        if not isinstance(tail, pd.DataFrame) or tail.empty:
+            # 新しいバーがまだ無い
+            return cached
+        tail = self._normalize_df(tail.copy())
+
+        # 重なり区間で保存済みの値と照合
+        cols = [DATE_COL, *INCREMENTAL_CHECK_COLS]
+        overlap = cached[cols].merge(tail[cols], on=DATE_COL, how="inner", suffixes=("_old", "_new"))
+        if overlap.empty:
+            return None
+        for c in INCREMENTAL_CHECK_COLS:
+            old = pd.to_numeric(overlap[f"{c}_old"], errors="coerce").to_numpy(dtype="float64")
+            new = pd.to_numeric(overlap[f"{c}_new"], errors="coerce").to_numpy(dtype="float64")
+            if not np.allclose(old, new, rtol=INCREMENTAL_RTOL, equal_nan=True):
+                return None
+
+        fresh = tail[tail[DATE_COL] > last]
+        if fresh.empty:
+            return cached
+        return self._normalize_df(pd.concat([cached, fresh], ignore_index=True))
+
     def _normalize_df(self, df: pd.DataFrame) -> pd.DataFrame:
         # date列名の確保
         if DATE_COL not in df.columns:
@@ -346,6 +554,87 @@ class DataLoader:
         return s
 
 
+def _read_equity_file(f: Path) -> pd.DataFrame:
+    """
+    data/raw/equities/{symbol}.parquet を1本読み、標準列で返す。
+
+    price_store.SCHEMA_VERSION のメタデータが付いたファイル（正規化済み）はそのまま読む。
+    付いていない旧形式のファイルだけ _repair_equity_frame で列を修復する
+    （python scripts/price_store.py --migrate-only で一度書き直せば以後は修復不要）。
+    """
+    import pyarrow.parquet as pq
+    import price_store
+
+    pf = pq.ParquetFile(f)
+    if price_store.schema_version(pf.schema_arrow) == price_store.SCHEMA_VERSION:
+        return pf.read(columns=price_store.PRICE_COLS).to_pandas()
+    return _repair_equity_frame(pd.read_parquet(f), f)
+
+
+def _repair_equity_frame(df: pd.DataFrame, f: Path) -> pd.DataFrame:
+    """
+    旧形式の銘柄ファイルの列名を修復して標準列で返す。
+    （price_store の migrate からも使う）
+    """
+    # ★ カラム名フラット化：MultiIndex や "('open','2413.T')" → "open" にする
+    if isinstance(df.columns, pd.MultiIndex):
+        df.columns = [c[0] for c in df.columns]
+    else:
+        new_cols = []
+        for c in df.columns:
+            # タプルの場合: ('open', '2413.T') → 'open'
+            if isinstance(c, tuple):
+                new_cols.append(c[0])
+            # 文字列にタプルが埋まっている場合: "('open', '2413.T')" → 'open'
+            elif isinstance(c, str) and c.startswith("(") and "," in c:
+                try:
+                    t = ast.literal_eval(c)
+                    if isinstance(t, tuple):
+                        new_cols.append(t[0])
+                    else:
+                        new_cols.append(c)
+                except Exception:
+                    new_cols.append(c)
+            else:
+                new_cols.append(c)
+        df.columns = new_cols
+
+    # 重複列（symbol が二重など）は後ろを優先して1つに
+    df = df.loc[:, ~df.columns.duplicated()]
+
+    # symbol 列が無ければファイル名から付ける
+    if "symbol" not in df.columns:
+        symbol = f.stem  # 例: 7203.T
+        df = df.copy()
+        df["symbol"] = symbol
+
+    # ★ この後に今までの必須列チェックを続ける
+    required_price_cols = ["date", "open", "high", "low", "close"]
+    missing = [c for c in required_price_cols if c not in df.columns]
+    if missing:
+        raise KeyError(f"{f}: 必須列 {missing} がありません。columns={df.columns.tolist()}")
+
+    # adj_close が無ければ close を流用
+    if "adj_close" not in df.columns:
+        df["adj_close"] = df["close"]
+
+    # volume が無ければ turnover は計算不可
+    if "volume" not in df.columns:
+        df["volume"] = pd.NA
+
+    # turnover は必ず close * volume で再計算（build_features.pyと同じロジック）
+    # 数値型に変換してから計算（NaNを避けるため）
+    if "close" in df.columns and "volume" in df.columns:
+        close_num = pd.to_numeric(df["close"], errors="coerce")
+        volume_num = pd.to_numeric(df["volume"], errors="coerce")
+        df["turnover"] = close_num * volume_num
+    else:
+        df["turnover"] = pd.NA
+
+    df["date"] = pd.to_datetime(df["date"])
+    return df[["date", "symbol", "open", "high", "low", "close", "adj_close", "volume", "turnover"]]
+
+
 def load_prices() -> pd.DataFrame:
     """
     日本株の価格データ（複数銘柄対応）。
@@ -357,7 +646,16 @@ def load_prices() -> pd.DataFrame:
 
     ファイル名の stem を symbol として使う想定。
     例: data/raw/equities/7203.T.parquet -> symbol='7203.T'
+
+    data/interim/price_store（scripts/price_store.py で作成）がソースより新しければ
+    そちらを1回の一括読み込みで使う。古い／無い場合は銘柄ファイルを1本ずつ読む。
+
+    読み込み結果はプロセス内でキャッシュし（price_cache）、元ファイルの mtime が
+    変わらない限り同じプロセス内の2回目以降はファイルを読まない（戻り値はコピー）。
     """
+    import price_cache
+    import price_store
+
     base = Path("data/raw/equities")
     files = sorted(list(base.glob("*.parquet")))
 
@@ -368,70 +666,19 @@ def load_prices() -> pd.DataFrame:
             "例: data/raw/equities/7203.T.parquet のように配置してください。"
         )
 
-    frames = []
-    for f in files:
-        df = pd.read_parquet(f)
-
-        # ★ カラム名フラット化：MultiIndex や "('open','2413.T')" → "open" にする
-        if isinstance(df.columns, pd.MultiIndex):
-            df.columns = [c[0] for c in df.columns]
-        else:
-            new_cols = []
-            for c in df.columns:
-                # タプルの場合: ('open', '2413.T') → 'open'
-                if isinstance(c, tuple):
-                    new_cols.append(c[0])
-                # 文字列にタプルが埋まっている場合: "('open', '2413.T')" → 'open'
-                elif isinstance(c, str) and c.startswith("(") and "," in c:
-                    try:
-                        t = ast.literal_eval(c)
-                        if isinstance(t, tuple):
-                            new_cols.append(t[0])
-                        else:
-                            new_cols.append(c)
-                    except Exception:
-                        new_cols.append(c)
-                else:
-                    new_cols.append(c)
-            df.columns = new_cols
-
-        # 重複列（symbol が二重など）は後ろを優先して1つに
-        df = df.loc[:, ~df.columns.duplicated()]
-
-        # symbol 列が無ければファイル名から付ける
-        if "symbol" not in df.columns:
-            symbol = f.stem  # 例: 7203.T
-            df = df.copy()
-            df["symbol"] = symbol
-
-        # ★ この後に今までの必須列チェックを続ける
-        required_price_cols = ["date", "open", "high", "low", "close"]
-        missing = [c for c in required_price_cols if c not in df.columns]
-        if missing:
-            raise KeyError(f"{f}: 必須列 {missing} がありません。columns={df.columns.tolist()}")
-
-        # adj_close が無ければ close を流用
-        if "adj_close" not in df.columns:
-            df["adj_close"] = df["close"]
-
-        # volume が無ければ turnover は計算不可
-        if "volume" not in df.columns:
-            df["volume"] = pd.NA
-
-        # turnover は必ず close * volume で再計算（build_features.pyと同じロジック）
-        # 数値型に変換してから計算（NaNを避けるため）
-        if "close" in df.columns and "volume" in df.columns:
-            close_num = pd.to_numeric(df["close"], errors="coerce")
-            volume_num = pd.to_numeric(df["volume"], errors="coerce")
-            df["turnover"] = close_num * volume_num
-        else:
-            df["turnover"] = pd.NA
-
-        df["date"] = pd.to_datetime(df["date"])
-        frames.append(df[["date", "symbol", "open", "high", "low", "close", "adj_close", "volume", "turnover"]])
+    if price_store.is_fresh(price_store.STORE_DIR, base):
+        prices = price_cache.get_or_load(
+            ("load_prices", "store"),
+            [price_store.STORE_DIR / price_store.MANIFEST_NAME],
+            price_store.load_price_store,
+        )
+    else:
+        def _load_files() -> pd.DataFrame:
+            frames = [_read_equity_file(f) for f in files]
+            out = pd.concat(frames, ignore_index=True)
+            return out.sort_values(["symbol", "date"]).reset_index(drop=True)
 
-    prices = pd.concat(frames, ignore_index=True)
-    prices = prices.sort_values(["symbol", "date"]).reset_index(drop=True)
+        prices = price_cache.get_or_load(("load_prices", "files"), files, _load_files)
 
     print("load_prices() columns:", list(prices.columns))
     print("symbols:", prices["symbol"].unique()[:10], "… (n=", prices["symbol"].nunique(), ")")
@@ -1,24 +1,20 @@
 # scripts/download_prices.py
 # ユニバース銘柄の株価を Yahoo Finance から一括ダウンロードして
 # data/raw/prices/prices_{TICKER}.csv として保存するユーティリティ
+# （bulk_downloader による並列・レート制限・バッチ取得・再開対応）
 
 from __future__ import annotations
 
 import argparse
-import time
 from datetime import date
 from pathlib import Path
-from typing import List, Optional
+from typing import List
 
 import numpy as np
 import pandas as pd
-import yfinance as yf
 
-try:
-    from tqdm import tqdm
-except ImportError:  # tqdm が無ければダミー
-    def tqdm(x, **kwargs):
-        return x
+# yfinance は bulk_downloader.yf_batch_fetcher 経由でだけ呼ぶ（_YF_LOCK で直列化するため、ここでは import しない）
+from bulk_downloader import BulkDownloader, DownloadManifest, http_csv_fetcher, yf_batch_fetcher
 
 
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
@@ -83,32 +79,52 @@ def parse_args() -> argparse.Namespace:
         "--sleep",
         type=float,
         default=0.5,
-        help="各ティッカー間のsleep秒数 (API制限対策)",
+        help="リクエスト間隔の秒数 (API制限対策)。--rate 未指定時は 1/sleep req/s",
+    )
+    p.add_argument(
+        "--rate",
+        type=float,
+        default=None,
+        help="リクエストレート上限 (req/s, トークンバケット)",
+    )
+    p.add_argument(
+        "--workers",
+        type=int,
+        default=4,
+        help="並列ワーカー数（--source-url の HTTP 取得のみ。yfinance は直列）",
+    )
+    p.add_argument(
+        "--batch-size",
+        type=int,
+        default=20,
+        help="1リクエストあたりのティッカー数 (yfinance 一括取得)",
+    )
+    p.add_argument(
+        "--retries",
+        type=int,
+        default=3,
+        help="バッチで取れなかったティッカーの個別リトライ回数",
+    )
+    p.add_argument(
+        "--manifest",
+        type=str,
+        default=None,
+        help="進捗マニフェスト (default = {outdir}/_download_manifest.json)",
+    )
+    p.add_argument(
+        "--source-url",
+        type=str,
+        default=None,
+        help="yfinance の代わりに CSV を取得する URL テンプレート (例: http://127.0.0.1:8765/{ticker}.csv)",
     )
     return p.parse_args()
 
 
-def download_one(
-    ticker: str,
-    start: str,
-    end: Optional[str],
-) -> pd.DataFrame:
+def format_price_frame(df: pd.DataFrame) -> pd.DataFrame:
     """
-    yfinance から1銘柄分の日足を取得し、
+    yf.download（単一ティッカー）形式の DataFrame を
     equity01標準カラムに整形して返す。
     """
-    end_ = end or date.today().isoformat()
-
-    df = yf.download(
-        ticker,
-        start=start,
-        end=end_,
-        interval="1d",
-        auto_adjust=False,
-        progress=False,
-        threads=False,
-    )
-
     if df.empty:
         return df
 
@@ -126,6 +142,10 @@ def download_one(
     }
     df = df.rename(columns=rename_map)
 
+    # adj_close が無いソース（Stooq 互換 CSV など）は close を流用
+    if "adj_close" not in df.columns:
+        df["adj_close"] = df["close"]
+
     # 必要な列だけに絞る
     cols = ["date", "open", "high", "low", "close", "adj_close", "volume"]
     df = df[cols]
@@ -159,26 +179,52 @@ def main() -> None:
     print(f"[download_prices] tickers      : {len(tickers)} names")
     print(f"[download_prices] period       : {args.start} → {args.end or date.today().isoformat()}")
 
-    for ticker in tqdm(tickers, desc="Downloading"):
-        out_path = outdir / f"prices_{ticker}.csv"
-        if out_path.exists() and not args.force:
-            # 既にあるならスキップ
-            continue
+    # 既存CSVは --force が無ければスキップ
+    targets = [t for t in tickers if args.force or not (outdir / f"prices_{t}.csv").exists()]
+    print(f"[download_prices] to download  : {len(targets)} names (skip {len(tickers) - len(targets)} existing)")
+
+    manifest_path = Path(args.manifest) if args.manifest else outdir / "_download_manifest.json"
+    manifest = DownloadManifest(manifest_path)
+    # 完了判定はCSVの有無が正。CSVが無い（または --force の）銘柄の "done" 記録は捨てる。
+    # "empty"（データ無し）の記録は --force が無ければ残し、再開時にスキップする
+    target_set = set(targets)
+    manifest.entries = {
+        t: e for t, e in manifest.entries.items()
+        if t not in target_set or (e.get("status") == "empty" and not args.force)
+    }
 
-        try:
-            df = download_one(ticker, start=args.start, end=args.end)
-        except Exception as e:
-            print(f"[download_prices] ERROR {ticker}: {e}")
-            time.sleep(args.sleep)
-            continue
+    if args.source_url:
+        fetch_batch = http_csv_fetcher(args.source_url)
+        batch_size = 1  # URL テンプレートは1リクエスト1ティッカー
+    else:
+        fetch_batch = yf_batch_fetcher(start=args.start, end=args.end)
+        batch_size = args.batch_size
+
+    rate = args.rate if args.rate is not None else 1.0 / max(args.sleep, 1e-3)
+    engine = BulkDownloader(
+        fetch_batch,
+        batch_size=batch_size,
+        max_workers=args.workers,
+        rate_per_sec=rate,
+        max_retries=args.retries,
+        manifest=manifest,
+    )
 
+    def _save(ticker: str, raw: pd.DataFrame) -> None:
+        df = format_price_frame(raw)
         if df.empty:
-            print(f"[download_prices] NO DATA for {ticker}")
-            time.sleep(args.sleep)
-            continue
-
-        df.to_csv(out_path, index=False)
-        time.sleep(args.sleep)
+            raise ValueError("empty after formatting")
+        df.to_csv(outdir / f"prices_{ticker}.csv", index=False)
+
+    status = engine.run(targets, _save)
+    failed = sorted(t for t, st in status.items() if st == "failed")
+    empty = sorted(t for t, st in status.items() if st == "empty")
+    print(f"[download_prices] done={sum(st == 'done' for st in status.values())} "
+          f"empty={len(empty)} failed={len(failed)} (manifest: {manifest_path})")
+    if empty:
+        print(f"[download_prices] NO DATA: {', '.join(empty[:20])}{' …' if len(empty) > 20 else ''}")
+    if failed:
+        print(f"[download_prices] ERROR: {', '.join(failed[:20])}{' …' if len(failed) > 20 else ''}")
 
     print("[download_prices] done.")
 
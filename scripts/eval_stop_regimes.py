@@ -30,6 +30,8 @@ matplotlib.use("Agg")  # 非対話的バックエンド
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
 
+import price_cache  # 同一プロセス内の再読込を省く（mtime で無効化）
+
 # 日本語フォント設定
 import platform
 import matplotlib.font_manager as fm
@@ -146,7 +148,7 @@ def load_cross4_returns() -> tuple:
             f"{cross4_path} がありません。先に ensemble_variant_cross4.py を実行してください。"
         )
     
-    df = pd.read_parquet(cross4_path)
+    df = price_cache.read_parquet(cross4_path)
     
     # 日付カラムを統一
     date_col = "trade_date" if "trade_date" in df.columns else "date"
@@ -176,7 +178,7 @@ def load_cross4_returns() -> tuple:
         # index_tpx_daily.parquetから読み込む
         tpx_path = DATA_DIR / "index_tpx_daily.parquet"
         if tpx_path.exists():
-            df_tpx = pd.read_parquet(tpx_path)
+            df_tpx = price_cache.read_parquet(tpx_path)
             tpx_date_col = "trade_date" if "trade_date" in df_tpx.columns else "date"
             df_tpx[tpx_date_col] = pd.to_datetime(df_tpx[tpx_date_col])
             df_tpx = df_tpx.set_index(tpx_date_col).sort_index()
@@ -223,7 +225,7 @@ def load_inverse_returns() -> pd.Series:
     for path in inverse_paths:
         if path.exists():
             try:
-                df = pd.read_parquet(path)
+                df = price_cache.read_parquet(path)
                 
                 # 日付カラムを確認
                 date_col = None
@@ -771,7 +773,7 @@ def load_daily_portfolio_holdings() -> pd.DataFrame:
     for path in portfolio_paths:
         if path.exists():
             try:
-                df = pd.read_parquet(path)
+                df = price_cache.read_parquet(path)
                 
                 # 日付カラムを確認
                 date_col = None
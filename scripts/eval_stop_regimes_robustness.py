@@ -34,6 +34,8 @@ import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
 from datetime import datetime
 
+import price_cache  # 同一プロセス内の再読込を省く（mtime で無効化）
+
 # 日本語フォント設定
 import platform
 import matplotlib.font_manager as fm
@@ -66,7 +68,7 @@ def load_cross4_and_topix() -> Tuple[pd.Series, pd.Series]:
     if not cross4_path.exists():
         raise FileNotFoundError(f"{cross4_path} がありません。")
     
-    df = pd.read_parquet(cross4_path)
+    df = price_cache.read_parquet(cross4_path)
     date_col = "trade_date" if "trade_date" in df.columns else "date"
     df[date_col] = pd.to_datetime(df[date_col])
     df = df.set_index(date_col).sort_index()
@@ -90,7 +92,7 @@ def load_cross4_and_topix() -> Tuple[pd.Series, pd.Series]:
     if tpx_col is None:
         tpx_path = DATA_DIR / "index_tpx_daily.parquet"
         if tpx_path.exists():
-            df_tpx = pd.read_parquet(tpx_path)
+            df_tpx = price_cache.read_parquet(tpx_path)
             tpx_date_col = "trade_date" if "trade_date" in df_tpx.columns else "date"
             df_tpx[tpx_date_col] = pd.to_datetime(df_tpx[tpx_date_col])
             df_tpx = df_tpx.set_index(tpx_date_col).sort_index()
@@ -124,7 +126,7 @@ def load_inverse_returns() -> pd.Series:
     for path in inverse_paths:
         if path.exists():
             try:
-                df = pd.read_parquet(path)
+                df = price_cache.read_parquet(path)
                 date_col = None
                 for col in ["date", "trade_date", "datetime"]:
                     if col in df.columns:
@@ -15,11 +15,20 @@ feature_builder.py
 - adv_20d: 20営業日平均売買代金
 """
 
+import sys
 from dataclasses import dataclass, field
+from pathlib import Path
 from typing import List, Dict
 import numpy as np
 import pandas as pd
 
+# プロジェクトルートをパスに追加（core パッケージ）
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+from core.cross_section import Segments, zscore  # noqa: E402
+
 
 @dataclass
 class FeatureBuilderConfig:
@@ -54,21 +63,6 @@ class FeatureBuilderConfig:
     symbol_col: str = "symbol"            # 銘柄識別
 
 
-def _cross_sectional_zscore(
-    df: pd.DataFrame, col: str, group_col: str
-) -> pd.Series:
-    """
-    クロスセクション Z-score を計算するユーティリティ関数
-    """
-    def _z(x: pd.Series) -> pd.Series:
-        if x.std(ddof=0) == 0:
-            # すべて同じ値の場合は 0 に揃える
-            return pd.Series(0.0, index=x.index)
-        return (x - x.mean()) / x.std(ddof=0)
-
-    return df.groupby(group_col)[col].transform(_z)
-
-
 def build_feature_matrix(
     df: pd.DataFrame, config: FeatureBuilderConfig
 ) -> pd.DataFrame:
@@ -78,6 +72,9 @@ def build_feature_matrix(
     - penalty 付与
     - 総合スコア feature_score 計算
 
+    日付ごとの集計（平均・標準偏差・分位点）は core.cross_section のカーネルで
+    全日付を一度に計算する（日付ごとの Python コールバックは呼ばない）。
+
     Parameters
     ----------
     df : pd.DataFrame
@@ -95,6 +92,8 @@ def build_feature_matrix(
         - feature_score (ペナルティ適用後スコア)
     """
     df = df.copy()
+    seg = Segments.from_keys(df[config.group_col].to_numpy())
+    seg_date = seg if config.group_col == "date" else Segments.from_keys(df["date"].to_numpy())
 
     # --- 1. Z-score の計算 ---
     for col in config.zscore_cols:
@@ -102,29 +101,25 @@ def build_feature_matrix(
             raise KeyError(f"必要なカラムがありません: {col}")
 
         zcol = f"z_{col}"
-        df[zcol] = _cross_sectional_zscore(df, col, config.group_col)
+        df[zcol] = zscore(seg, df[col].to_numpy(dtype="float64"), ddof=0)
 
     # ---- Zスコアのクリップ（±3σ） ----
     z_cols = ["z_ret_5d", "z_ret_20d", "z_vol_20d", "z_adv_20d"]
     for c in z_cols:
         if c in df.columns:
             # 日次クロスセクションで ±3σ にクリップ（極端値で暴れないように）
-            df[c] = df.groupby("date")[c].transform(lambda s: s.clip(-3.0, 3.0))
+            df[c] = np.where(seg_date.valid, np.clip(df[c].to_numpy(), -3.0, 3.0), np.nan)
 
     # --- 2. 流動性ペナルティ (ADVの下位20%) ---
     # 日次クロスセクションで下位20%を "低流動性" とみなす
-    adv_q = df.groupby("date")["adv_20d"].transform(
-        lambda s: s.quantile(0.2)
-    )
-    df["pen_liquidity"] = 0.0
-    df.loc[df["adv_20d"] < adv_q, "pen_liquidity"] = -0.5
+    adv = df["adv_20d"].to_numpy(dtype="float64")
+    adv_q = seg_date.broadcast(seg_date.quantile(adv, 0.2))
+    df["pen_liquidity"] = np.where(adv < adv_q, -0.5, 0.0)
 
     # --- 3. ボラペナルティ (VOLの上位20%) ---
-    vol_q = df.groupby("date")["vol_20d"].transform(
-        lambda s: s.quantile(0.8)
-    )
-    df["pen_vol"] = 0.0
-    df.loc[df["vol_20d"] > vol_q, "pen_vol"] = -0.5
+    vol = df["vol_20d"].to_numpy(dtype="float64")
+    vol_q = seg_date.broadcast(seg_date.quantile(vol, 0.8))
+    df["pen_vol"] = np.where(vol > vol_q, -0.5, 0.0)
 
     # --- 4. トータルペナルティ ---
     df["penalty_total"] = df["pen_liquidity"] + df["pen_vol"]
@@ -0,0 +1,311 @@
+"""
+feature_engine.py
+
+[役割]
+- features/ のレジストリに宣言された特徴量を、依存関係（DAG）の順に計算する
+  - 要求された特徴量とその依存だけを計算する（resolve）
+  - 価格は (symbol, date) 順の長い形式から1回だけ 行番号×銘柄 の行列に詰め、
+    各特徴量の計算関数（列ごとのカーネル）に渡し、最後に長い形式へ戻す
+- 特徴量ごとのキャッシュ
+  - キー = 特徴量の宣言（名前・version・window・dtype・計算関数のソース）＋ 入力のキー
+    入力が基本列（close / volume / mkt_ret_1d）ならその中身と (symbol, date) 軸のハッシュ
+  - 特徴量を追加・変更しても、影響を受けない特徴量はキャッシュから読む
+  - キーは入力の全行で決まるので、効くのは同じ入力での作り直し（--full の再実行など）だけ。
+    日次の差分更新（--incremental）は入力の期間が毎日変わるので毎回計算し直す
+
+[キャッシュ]
+  data/interim/feature_cache/<feature>/<key>.npy   # 長い形式の1列（特徴量ごとに新しい順に数個残す）
+
+使い方:
+  prices = feature_engine.add_price_features(prices)            # 既定の価格系特徴量を追加
+  prices = feature_engine.add_price_features(prices, names=feature_engine.required_features(["z_downvol"]))
+"""
+from __future__ import annotations
+
+import hashlib
+import inspect
+import sys
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+# プロジェクトルートをパスに追加（features パッケージ）
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+from features import REGISTRY  # noqa: E402
+from features.kernels import SymbolPanel  # noqa: E402
+from features.registry import BASE_COLUMNS, FeatureRegistry, FeatureSpec  # noqa: E402
+
+FEATURE_CACHE_DIR = Path("data/interim/feature_cache")
+CACHE_KEEP_PER_FEATURE = 4
+
+# daily_feature_scores に載せる価格系特徴量（既定で計算するもの）
+PRICE_FEATURES = (
+    "ret_1d",
+    "ret_5d",
+    "ret_20d",
+    "vol_20d",
+    "turnover",
+    "adv_20d",
+    "downside_ret_1d",
+    "downside_vol_60d",
+    "down_beta_252d",
+    "beta_252d",
+)
+
+# feature_builder（feature_raw）が必ず使う特徴量
+BUILDER_FEATURES = ("ret_5d", "ret_20d", "vol_20d", "adv_20d")
+
+# スコアリング Variant の設定で特徴量を参照するキー
+VARIANT_COLUMN_KEYS = ("vol_col", "beta_col", "vol_down_col", "beta_down_col")
+
+
+def _sha1(*parts) -> str:
+    h = hashlib.sha1()
+    for p in parts:
+        if isinstance(p, np.ndarray):
+            h.update(np.ascontiguousarray(p).tobytes())
+        else:
+            h.update(repr(p).encode("utf-8"))
+        h.update(b"\x00")
+    return h.hexdigest()
+
+
+def _func_source(spec: FeatureSpec) -> str:
+    try:
+        return inspect.getsource(spec.func)
+    except (OSError, TypeError):
+        return spec.func.__qualname__
+
+
+def spec_fingerprint(spec: FeatureSpec) -> str:
+    """特徴量の宣言（名前・version・window・dtype・計算関数のソース）のハッシュ"""
+    return _sha1(spec.name, spec.version, spec.window, spec.dtype, _func_source(spec))
+
+
+def features_fingerprint(names: Optional[Iterable[str]] = None, registry: FeatureRegistry = REGISTRY) -> str:
+    """names（None なら PRICE_FEATURES）とその依存の宣言をまとめたハッシュ"""
+    specs = registry.resolve(list(PRICE_FEATURES if names is None else names))
+    return _sha1([(s.name, spec_fingerprint(s), s.inputs) for s in specs])
+
+
+class FeatureEngine:
+    """
+    レジストリの特徴量を計算する。last_stats に直近の compute でキャッシュから読んだもの／計算したものが入る。
+    """
+
+    def __init__(
+        self,
+        registry: FeatureRegistry = REGISTRY,
+        cache_dir: Optional[Path] = FEATURE_CACHE_DIR,
+        keep_per_feature: int = CACHE_KEEP_PER_FEATURE,
+    ) -> None:
+        self.registry = registry
+        self.cache_dir = Path(cache_dir) if cache_dir is not None else None
+        self.keep_per_feature = keep_per_feature
+        self.last_stats: Dict[str, List[str]] = {"cached": [], "computed": []}
+
+    # ---- キャッシュ ---- #
+    def _cache_path(self, name: str, key: str) -> Optional[Path]:
+        if self.cache_dir is None:
+            return None
+        return self.cache_dir / name / f"{key}.npy"
+
+    def _cache_load(self, name: str, key: str, n: int) -> Optional[np.ndarray]:
+        path = self._cache_path(name, key)
+        if path is None or not path.exists():
+            return None
+        try:
+            arr = np.load(path)
+        except Exception:
+            return None
+        if arr.shape != (n,):
+            return None
+        path.touch()  # 最近使ったものを残す
+        return arr
+
+    def _cache_store(self, name: str, key: str, arr: np.ndarray) -> None:
+        path = self._cache_path(name, key)
+        if path is None:
+            return
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # 書きかけのファイルが下の *.npy の掃除に入らないように、一時ファイルは .npy.tmp にする
+            tmp = path.with_name(path.name + ".tmp")
+            with open(tmp, "wb") as f:
+                np.save(f, arr)
+            tmp.replace(path)
+            self._cache_evict(path.parent)
+        except OSError as e:
+            print(f"[feature_engine] 警告: キャッシュ保存に失敗 ({name}): {e}")
+
+    def _cache_evict(self, feature_dir: Path) -> None:
+        """特徴量ごとに mtime の新しい keep_per_feature 個だけ残す（他のプロセスが先に消したものは飛ばす）"""
+        files = []
+        for p in feature_dir.glob("*.npy"):
+            try:
+                files.append((p.stat().st_mtime, p))
+            except FileNotFoundError:
+                continue
+        files.sort(key=lambda t: t[0], reverse=True)
+        for _, p in files[self.keep_per_feature:]:
+            p.unlink(missing_ok=True)
+
+    # ---- 計算 ---- #
+    def compute(
+        self,
+        symbols,
+        dates,
+        base: Dict[str, np.ndarray],
+        names: Optional[Iterable[str]] = None,
+    ) -> Dict[str, np.ndarray]:
+        """
+        (symbol, date) 順の配列から names（None なら PRICE_FEATURES）の特徴量を計算し、
+        長い形式の配列の dict で返す。base は基本列 {close, volume, (mkt_ret_1d)}。
+        """
+        names = list(PRICE_FEATURES if names is None else names)
+        specs = self.registry.resolve(names)
+        symbols = np.asarray(symbols)
+        n = len(symbols)
+        panel = SymbolPanel.from_symbols(symbols)
+
+        layout_key = _sha1(
+            pd.util.hash_array(symbols.astype(object)),
+            np.asarray(pd.to_datetime(dates).values.astype("datetime64[ns]").view("int64")),
+        )
+        keys: Dict[str, str] = {}
+        long: Dict[str, np.ndarray] = {}
+        for col, values in base.items():
+            arr = pd.to_numeric(pd.Series(np.asarray(values)), errors="coerce").to_numpy(dtype="float64")
+            long[col] = arr
+            keys[col] = _sha1("base", col, layout_key, arr)
+
+        wide: Dict[str, np.ndarray] = {}
+
+        def _wide(col: str) -> np.ndarray:
+            if col not in wide:
+                if col not in long:
+                    raise KeyError(f"入力 '{col}' がありません（基本列: {list(base)}）")
+                wide[col] = panel.to_wide(long[col])
+            return wide[col]
+
+        self.last_stats = {"cached": [], "computed": []}
+        for spec in specs:
+            missing = [d for d in spec.inputs if d in BASE_COLUMNS and d not in base]
+            if missing:
+                raise KeyError(f"feature '{spec.name}' の入力 {missing} がありません")
+            key = _sha1("feature", spec_fingerprint(spec), [keys[d] for d in spec.inputs])
+            keys[spec.name] = key
+
+            arr = self._cache_load(spec.name, key, n)
+            if arr is not None:
+                long[spec.name] = arr
+                self.last_stats["cached"].append(spec.name)
+                continue
+
+            out = spec.func(panel, {d: _wide(d) for d in spec.inputs})
+            wide[spec.name] = out
+            arr = panel.to_long(out).astype(spec.dtype, copy=False)
+            long[spec.name] = arr
+            self._cache_store(spec.name, key, arr)
+            self.last_stats["computed"].append(spec.name)
+
+        return {name: long[name] for name in names}
+
+
+def required_features(
+    variants: Optional[Iterable[str]] = None,
+    registry: FeatureRegistry = REGISTRY,
+) -> List[str]:
+    """
+    指定したスコアリング Variant（None なら SCORING_VARIANTS 全部）の計算に必要な特徴量名。
+    BUILDER_FEATURES ＋ 各 Variant が参照する列（"*_z" は build_features で元の列から作るので元の列）。
+    """
+    from core.scoring_engine import SCORING_VARIANTS
+
+    names = list(SCORING_VARIANTS) if variants is None else list(variants)
+    unknown = [v for v in names if v not in SCORING_VARIANTS]
+    if unknown:
+        raise KeyError(f"未知のスコアリング Variant: {unknown}")
+
+    out = list(BUILDER_FEATURES)
+    for v in names:
+        cfg = SCORING_VARIANTS[v]
+        for key in VARIANT_COLUMN_KEYS:
+            col = cfg.get(key) if isinstance(cfg, dict) else getattr(cfg, key, None)
+            if not col:
+                continue
+            if col not in registry and col.endswith("_z") and col[:-2] in registry:
+                col = col[:-2]
+            if col in registry and col not in out:
+                out.append(col)
+    return out
+
+
+_ENGINE: Optional[FeatureEngine] = None
+
+
+def get_engine() -> FeatureEngine:
+    """プロセス共有のエンジン（既定のレジストリ・キャッシュ）"""
+    global _ENGINE
+    if _ENGINE is None:
+        _ENGINE = FeatureEngine()
+    return _ENGINE
+
+
+def compute_price_features(
+    symbols,
+    close,
+    volume,
+    mkt_ret: Optional[Iterable[float]] = None,
+    *,
+    dates=None,
+    names: Optional[Iterable[str]] = None,
+    engine: Optional[FeatureEngine] = None,
+) -> Dict[str, np.ndarray]:
+    """
+    (symbol, date) 順の配列から価格系特徴量を計算し、長い形式の配列の dict で返す。
+    names を省略すると PRICE_FEATURES（mkt_ret が無ければ down_beta_252d / beta_252d を除く）。
+    dates を渡さない場合はキャッシュを使わない。
+    """
+    base = {"close": close, "volume": volume}
+    if mkt_ret is not None:
+        base["mkt_ret_1d"] = mkt_ret
+    if names is None:
+        names = [
+            f for f in PRICE_FEATURES
+            if all(d in base or d not in BASE_COLUMNS
+                   for s in REGISTRY.resolve([f]) for d in s.inputs)
+        ]
+    if engine is None:
+        engine = get_engine() if dates is not None else FeatureEngine(cache_dir=None)
+    if dates is None:
+        dates = np.zeros(len(np.asarray(symbols)), dtype="datetime64[ns]")
+    return engine.compute(symbols, dates, base, names)
+
+
+def add_price_features(
+    prices: pd.DataFrame,
+    mkt_col: Optional[str] = "mkt_ret_1d",
+    names: Optional[Iterable[str]] = None,
+    engine: Optional[FeatureEngine] = None,
+) -> pd.DataFrame:
+    """
+    prices（symbol, date 順に並べ済み）に価格系特徴量の列を追加して返す。
+    mkt_col が prices にあれば down_beta_252d / beta_252d も計算する。
+    """
+    mkt = prices[mkt_col].to_numpy(dtype="float64") if mkt_col and mkt_col in prices.columns else None
+    cols = compute_price_features(
+        prices["symbol"].to_numpy(),
+        prices["close"].to_numpy(),
+        prices["volume"].to_numpy(),
+        mkt_ret=mkt,
+        dates=prices["date"].to_numpy(),
+        names=names,
+        engine=engine,
+    )
+    return prices.assign(**cols)
@@ -0,0 +1,338 @@
+"""
+feature_store.py
+
+[役割]
+- daily_feature_scores（全銘柄×営業日の特徴量・スコア）の保存先
+  - フル再構築: ディレクトリを丸ごと作り直す（write_features）
+  - 差分追加: 新しい日付の行を該当する月のパーティションに追加する（append_features）
+  - 読み込み: 期間・列を指定して必要なパーティション・列だけを読む（read_features）
+- パーティションは年月単位。各パーティションは中身のハッシュ（content_hash）と
+  特徴量設定のハッシュ（config_hash）を manifest と parquet のメタデータに持つ
+
+[レイアウト]
+  data/processed/daily_feature_scores/
+    _manifest.json
+    year=2016/month=01/part.parquet
+    year=2016/month=02/part.parquet
+    ...
+
+旧形式の単一ファイル（data/processed/daily_feature_scores.parquet）しか無い場合は、
+read_features はそちらを読む。
+
+[省メモリ形式]
+ファイルは float64 のまま保存し、read_features(compact=True) で読み込み時にだけ変換する。
+  float64 → float32 / symbol・size_bucket・sector → category / session（int32 の営業日 ordinal）を追加
+バックテスト側は compact=True で読む。
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import shutil
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+FEATURE_DIR = Path("data/processed/daily_feature_scores")
+LEGACY_PATH = Path("data/processed/daily_feature_scores.parquet")
+MANIFEST_NAME = "_manifest.json"
+PART_FILE = "part.parquet"
+
+# manifest のレイアウト番号（1 = 追加ごとの part-YYYYMMDD_YYYYMMDD、2 = 年月パーティション）
+LAYOUT_VERSION = 2
+# parquet のスキーマメタデータに入れるキー
+META_KEY = b"feature_store"
+
+# compact=True で category にする文字列列・追加する営業日 ordinal 列
+CATEGORY_COLUMNS = ("symbol", "size_bucket", "sector")
+SESSION_COLUMN = "session"
+
+
+def read_manifest(feature_dir: Path = FEATURE_DIR) -> Optional[dict]:
+    path = Path(feature_dir) / MANIFEST_NAME
+    if not path.exists():
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return None
+
+
+def _write_manifest(feature_dir: Path, manifest: dict) -> None:
+    tmp = Path(feature_dir) / (MANIFEST_NAME + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    tmp.replace(Path(feature_dir) / MANIFEST_NAME)
+
+
+def content_hash(df: pd.DataFrame) -> str:
+    """列名・dtype・値（行順込み）のハッシュ"""
+    h = hashlib.sha1()
+    h.update(repr([(str(c), str(t)) for c, t in df.dtypes.items()]).encode("utf-8"))
+    h.update(np.ascontiguousarray(pd.util.hash_pandas_object(df, index=False).to_numpy()).tobytes())
+    return h.hexdigest()
+
+
+def _month_path(month: str) -> str:
+    year, mm = month.split("-")
+    return f"year={year}/month={mm}/{PART_FILE}"
+
+
+def _write_partition(
+    feature_dir: Path,
+    month: str,
+    df: pd.DataFrame,
+    config_hash: Optional[str],
+    mode: str,
+) -> dict:
+    """1か月分を書き（tmp → 置き換え）、manifest のエントリを返す"""
+    rel = _month_path(month)
+    path = Path(feature_dir) / rel
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    d = pd.to_datetime(df["date"])
+    entry = {
+        "file": rel,
+        "month": month,
+        "date_min": str(d.min().date()),
+        "date_max": str(d.max().date()),
+        "n_rows": int(len(df)),
+        "content_hash": content_hash(df),
+        "config_hash": config_hash,
+        "mode": mode,
+        "written_at": time.time(),
+    }
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    meta = dict(table.schema.metadata or {})
+    meta[META_KEY] = json.dumps(
+        {k: entry[k] for k in ("month", "content_hash", "config_hash")}
+    ).encode("utf-8")
+    table = table.replace_schema_metadata(meta)
+
+    tmp = path.with_name(path.name + ".tmp")
+    pq.write_table(table, tmp)
+    tmp.replace(path)
+    return entry
+
+
+def _split_months(df: pd.DataFrame) -> Dict[str, pd.DataFrame]:
+    """行順を保ったまま年月ごとに分ける"""
+    months = pd.to_datetime(df["date"]).dt.strftime("%Y-%m").to_numpy()
+    return {m: df.iloc[idx] for m, idx in pd.Series(months).groupby(months, sort=True).indices.items()}
+
+
+def write_features(
+    df: pd.DataFrame,
+    feature_dir: Path = FEATURE_DIR,
+    *,
+    config_hash: Optional[str] = None,
+) -> Path:
+    """フル再構築: 一時ディレクトリに年月パーティションを書いてから差し替える"""
+    feature_dir = Path(feature_dir)
+    if df.empty:
+        raise ValueError("features が空です")
+    tmp_dir = feature_dir.with_name(feature_dir.name + ".tmp")
+    if tmp_dir.exists():
+        shutil.rmtree(tmp_dir)
+    tmp_dir.mkdir(parents=True)
+
+    partitions = [
+        _write_partition(tmp_dir, month, part, config_hash, "full")
+        for month, part in _split_months(df).items()
+    ]
+    manifest = {
+        "layout": LAYOUT_VERSION,
+        "columns": [str(c) for c in df.columns],
+        "config_hash": config_hash,
+        "partitions": partitions,
+        "date_max": str(pd.to_datetime(df["date"]).max().date()),
+        "built_at": time.time(),
+    }
+    _write_manifest(tmp_dir, manifest)
+
+    if feature_dir.exists():
+        shutil.rmtree(feature_dir)
+    tmp_dir.rename(feature_dir)
+    return feature_dir
+
+
+def append_features(
+    df_new: pd.DataFrame,
+    feature_dir: Path = FEATURE_DIR,
+    *,
+    config_hash: Optional[str] = None,
+) -> Optional[List[Path]]:
+    """
+    差分追加: 既存の最終日より後の行を該当する年月パーティションに追加する
+    （既存の月は読み直して書き換え、新しい月はパーティションを作る）。
+    レイアウト・列構成・config_hash が既存と違う場合は ValueError（フル再構築が必要）。
+    """
+    feature_dir = Path(feature_dir)
+    manifest = read_manifest(feature_dir)
+    if manifest is None:
+        raise FileNotFoundError(f"feature store がありません: {feature_dir}（先にフル再構築してください）")
+    if manifest.get("layout") != LAYOUT_VERSION:
+        raise ValueError(
+            f"feature store のレイアウトが古い形式です（build_features.py --full で再構築してください）: {feature_dir}"
+        )
+    if [str(c) for c in df_new.columns] != manifest["columns"]:
+        raise ValueError(
+            "列構成が既存の feature store と異なります（build_features.py --full で再構築してください）: "
+            f"{list(df_new.columns)} != {manifest['columns']}"
+        )
+    if config_hash is not None and manifest.get("config_hash") not in (None, config_hash):
+        raise ValueError(
+            "特徴量設定が既存の feature store と異なります（build_features.py --full で再構築してください）: "
+            f"{config_hash} != {manifest['config_hash']}"
+        )
+
+    last = pd.Timestamp(manifest["date_max"])
+    df_new = df_new[pd.to_datetime(df_new["date"]) > last]
+    if df_new.empty:
+        return None
+
+    entries = {p["month"]: p for p in manifest["partitions"]}
+    written = []
+    for month, part in _split_months(df_new).items():
+        if month in entries:
+            old = pd.read_parquet(feature_dir / entries[month]["file"])
+            part = pd.concat([old, part], ignore_index=True)
+        entries[month] = _write_partition(feature_dir, month, part, config_hash, "append")
+        written.append(feature_dir / entries[month]["file"])
+
+    manifest["partitions"] = [entries[m] for m in sorted(entries)]
+    manifest["date_max"] = str(pd.to_datetime(df_new["date"]).max().date())
+    if config_hash is not None:
+        manifest["config_hash"] = config_hash
+    _write_manifest(feature_dir, manifest)
+    return written
+
+
+def last_date(feature_dir: Path = FEATURE_DIR) -> Optional[pd.Timestamp]:
+    manifest = read_manifest(feature_dir)
+    if manifest is None or not manifest.get("date_max"):
+        return None
+    return pd.Timestamp(manifest["date_max"])
+
+
+def partitions(feature_dir: Path = FEATURE_DIR, *, start=None, end=None) -> List[dict]:
+    """manifest のパーティション（[start, end] と重なるものだけ）"""
+    manifest = read_manifest(feature_dir)
+    if manifest is None:
+        return []
+    out = []
+    for p in manifest["partitions"]:
+        if start is not None and pd.Timestamp(p["date_max"]) < pd.Timestamp(start):
+            continue
+        if end is not None and pd.Timestamp(p["date_min"]) > pd.Timestamp(end):
+            continue
+        out.append(p)
+    return out
+
+
+def partition_files(feature_dir: Path = FEATURE_DIR, *, start=None, end=None) -> List[Path]:
+    return [Path(feature_dir) / p["file"] for p in partitions(feature_dir, start=start, end=end)]
+
+
+def _compact_table(table: pa.Table) -> pa.Table:
+    """Arrow のまま float64 → float32、文字列の CATEGORY_COLUMNS → dictionary（pandas では category）"""
+    arrays, fields = [], []
+    for field, col in zip(table.schema, table.columns):
+        if pa.types.is_float64(field.type):
+            col = col.cast(pa.float32())
+        elif field.name in CATEGORY_COLUMNS and (pa.types.is_string(field.type) or pa.types.is_large_string(field.type)):
+            col = col.dictionary_encode()
+        arrays.append(col)
+        fields.append(pa.field(field.name, col.type))
+    return pa.Table.from_arrays(arrays, schema=pa.schema(fields))
+
+
+def _add_sessions(df: pd.DataFrame) -> pd.DataFrame:
+    """date → int32 の営業日 ordinal（カレンダー外・非営業日は -1）"""
+    if "date" not in df.columns or df.empty:
+        return df
+    from trading_calendar import get_calendar
+
+    try:
+        df[SESSION_COLUMN] = get_calendar().ordinals(df["date"]).astype("int32")
+    except (ValueError, FileNotFoundError) as e:
+        print(f"[feature_store] 警告: session 列を作れません: {e}")
+    return df
+
+
+def read_features(
+    columns: Optional[Iterable[str]] = None,
+    *,
+    start=None,
+    end=None,
+    compact: bool = False,
+    feature_dir: Path = FEATURE_DIR,
+) -> pd.DataFrame:
+    """
+    feature store を読む（パーティションは年月順に連結）。
+    start / end（両端含む）と重なるパーティションだけを開き、columns の列だけを読む。
+    compact=True なら省メモリ形式（モジュール先頭の説明を参照）に変換して返す。
+    store が無く旧形式の単一ファイルがあればそちらを読む。
+    """
+    cols = list(columns) if columns is not None else None
+    if read_manifest(feature_dir) is not None:
+        files = partition_files(feature_dir, start=start, end=end)
+        if not files:
+            manifest = read_manifest(feature_dir)
+            return pd.DataFrame({c: [] for c in (cols or manifest["columns"])})
+        dataset = ds.dataset([str(f) for f in files], format="parquet")
+        flt = None
+        if start is not None:
+            flt = ds.field("date") >= pa.scalar(pd.Timestamp(start), type=pa.timestamp("ns"))
+        if end is not None:
+            f_end = ds.field("date") <= pa.scalar(pd.Timestamp(end), type=pa.timestamp("ns"))
+            flt = f_end if flt is None else (flt & f_end)
+        table = dataset.to_table(columns=cols, filter=flt)
+    elif LEGACY_PATH.exists():
+        # 期間で絞るときは columns に date が無くても date を読み、絞ったあとで落とす
+        filter_by_date = start is not None or end is not None
+        read_cols = cols
+        if cols is not None and filter_by_date and "date" not in cols:
+            read_cols = [*cols, "date"]
+        table = pq.read_table(LEGACY_PATH, columns=read_cols)
+        if filter_by_date:
+            dates = table.column("date")
+            mask = None
+            if start is not None:
+                mask = pc.greater_equal(dates, pa.scalar(pd.Timestamp(start), type=dates.type))
+            if end is not None:
+                m_end = pc.less_equal(dates, pa.scalar(pd.Timestamp(end), type=dates.type))
+                mask = m_end if mask is None else pc.and_(mask, m_end)
+            table = table.filter(mask)
+        if read_cols is not cols:
+            table = table.drop(["date"])
+    else:
+        raise FileNotFoundError(
+            f"{feature_dir} がありません。先に build_features.py を実行してください。"
+        )
+
+    if not compact:
+        return table.to_pandas()
+    return _add_sessions(_compact_table(table).to_pandas())
+
+
+def columns(feature_dir: Path = FEATURE_DIR) -> List[str]:
+    """store の列名（manifest が無ければ旧形式ファイルのスキーマ）"""
+    manifest = read_manifest(feature_dir)
+    if manifest is not None:
+        return list(manifest["columns"])
+    if LEGACY_PATH.exists():
+        return list(pq.read_schema(LEGACY_PATH).names)
+    return []
+
+
+def exists(feature_dir: Path = FEATURE_DIR) -> bool:
+    return bool(partition_files(feature_dir)) or LEGACY_PATH.exists()
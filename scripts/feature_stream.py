@@ -0,0 +1,344 @@
+"""
+feature_stream.py
+
+[役割]
+- 日次運用向けのストリーミング特徴量計算
+  - 銘柄ごとに直近の値をリングバッファで持ち、ローリング統計は逐次更新する
+    vol_20d / downside_vol_60d : Welford（追加・削除）
+    adv_20d                    : 売買代金の累積和
+    down_beta_252d / beta_252d : Σm, Σr, Σr·m, Σm², 件数
+  - 新しい日の足が来たら、その日に行がある銘柄だけを O(銘柄数) で更新し、
+    build_features（feature_engine）と同じ定義の価格系特徴量を返す
+  - 状態は data/interim/feature_stream/ に保存し、翌日に読み直して続きから更新する
+
+[定義（バッチ版と同じ）]
+- 窓は「銘柄ごとの行」単位（欠損日は行が無いので窓に入らない）
+- ret_*: close を直前値で埋めてからの pct_change / turnover = close * volume
+- downside_ret_1d: ret_1d < 0 の日だけ ret_1d（それ以外・欠損は 0）
+- 累積誤差を抑えるため、RESYNC_EVERY 回ごとにリングバッファから統計を計算し直す
+
+対象はバッチ版の PRICE_FEATURES（feature_engine）。features/ に特徴量を足した場合はここにも足す
+（宣言のハッシュを状態に記録し、変わっていたら状態を作り直す）。
+"""
+from __future__ import annotations
+
+import json
+import shutil
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+import feature_engine
+
+STATE_DIR = Path("data/interim/feature_stream")
+STATE_FILE = "state.npz"
+META_FILE = "state.json"
+
+# リングバッファの長さ（銘柄ごとの行数）
+CLOSE_WINDOW = 21      # ret_20d に 20 行前の close が要る
+RET_WINDOW = 252       # down_beta_252d / beta_252d（vol_20d・downside_vol_60d もここから取り出す）
+TURNOVER_WINDOW = 20   # adv_20d
+
+VOL_WINDOW, VOL_MIN = 20, 5
+DVOL_WINDOW, DVOL_MIN = 60, 20
+ADV_WINDOW, ADV_MIN = 20, 5
+BETA_WINDOW, BETA_MIN = 252, 60
+
+RESYNC_EVERY = 21
+
+STREAM_FEATURES = (
+    "ret_1d",
+    "ret_5d",
+    "ret_20d",
+    "vol_20d",
+    "turnover",
+    "adv_20d",
+    "downside_ret_1d",
+    "downside_vol_60d",
+    "down_beta_252d",
+    "beta_252d",
+)
+
+# 銘柄ごとの状態（配列名 → (1銘柄あたりの形, 初期値)）
+_FIELDS = {
+    "rows": ((), 0),
+    "last_close": ((), np.nan),
+    "close_ring": ((CLOSE_WINDOW,), np.nan),
+    "ret_ring": ((RET_WINDOW,), np.nan),
+    "mkt_ring": ((RET_WINDOW,), np.nan),
+    "to_ring": ((TURNOVER_WINDOW,), np.nan),
+    # vol_20d（Welford）
+    "vol_n": ((), 0.0), "vol_mean": ((), 0.0), "vol_m2": ((), 0.0),
+    # downside_vol_60d（Welford）
+    "dvol_n": ((), 0.0), "dvol_mean": ((), 0.0), "dvol_m2": ((), 0.0),
+    # adv_20d
+    "adv_n": ((), 0.0), "adv_sum": ((), 0.0),
+    # down_beta_252d（下落日のみ）
+    "db_n": ((), 0.0), "db_nan": ((), 0.0), "db_sx": ((), 0.0), "db_sy": ((), 0.0),
+    "db_sxy": ((), 0.0), "db_sxx": ((), 0.0),
+    # beta_252d
+    "b_n": ((), 0.0), "b_sx": ((), 0.0), "b_sy": ((), 0.0), "b_sxy": ((), 0.0), "b_sxx": ((), 0.0),
+}
+
+
+def _welford(n, mean, m2, x, mask, sign):
+    """mask の銘柄について x を追加（sign=+1）／削除（sign=-1）した (n, mean, m2)"""
+    n1 = n + sign * mask
+    with np.errstate(invalid="ignore", divide="ignore"):
+        d = x - mean
+        mean1 = np.where(mask, np.where(n1 > 0, mean + sign * d / n1, 0.0), mean)
+        m2_1 = np.where(mask, np.where(n1 > 0, m2 + sign * d * (x - mean1), 0.0), m2)
+    return n1, mean1, m2_1
+
+
+def _downside(r):
+    return np.where(r < 0, r, 0.0)
+
+
+class StreamState:
+    """
+    銘柄ごとのリングバッファとローリング統計。
+    update(date, bars) で1営業日ぶん進め、その日の特徴量を返す。
+    """
+
+    def __init__(self, symbols=(), fingerprint: Optional[str] = None) -> None:
+        self.symbols = pd.Index([], dtype=object)
+        self.arrays: Dict[str, np.ndarray] = {
+            k: np.full((0,) + shape, init, dtype="int64" if k == "rows" else "float64")
+            for k, (shape, init) in _FIELDS.items()
+        }
+        self.last_date: Optional[pd.Timestamp] = None
+        self.n_updates = 0
+        self.fingerprint = fingerprint or feature_engine.features_fingerprint(STREAM_FEATURES)
+        self._add_symbols(symbols)
+
+    # ---- 銘柄 ---- #
+    def _add_symbols(self, symbols) -> None:
+        new = pd.Index(pd.unique(np.asarray(symbols, dtype=object))).difference(self.symbols, sort=False)
+        if len(new) == 0:
+            return
+        self.symbols = self.symbols.append(pd.Index(new, dtype=object))
+        for k, (shape, init) in _FIELDS.items():
+            a = self.arrays[k]
+            pad = np.full((len(new),) + shape, init, dtype=a.dtype)
+            self.arrays[k] = np.concatenate([a, pad], axis=0)
+
+    # ---- 更新 ---- #
+    def update(self, date, bars: pd.DataFrame) -> pd.DataFrame:
+        """
+        date の足（symbol, close, volume, mkt_ret_1d）で状態を1行進め、
+        bars と同じ行順で STREAM_FEATURES を付けた DataFrame を返す。
+        """
+        date = pd.Timestamp(date)
+        if self.last_date is not None and date <= self.last_date:
+            raise ValueError(f"date は状態の最終日 {self.last_date.date()} より後である必要があります: {date.date()}")
+        if bars["symbol"].duplicated().any():
+            raise ValueError(f"{date.date()} に同じ銘柄の行が複数あります")
+
+        self._add_symbols(bars["symbol"])
+        i = self.symbols.get_indexer(bars["symbol"])
+        a = self.arrays
+        c = pd.to_numeric(bars["close"], errors="coerce").to_numpy(dtype="float64")
+        v = pd.to_numeric(bars["volume"], errors="coerce").to_numpy(dtype="float64")
+        m = (
+            pd.to_numeric(bars["mkt_ret_1d"], errors="coerce").to_numpy(dtype="float64")
+            if "mkt_ret_1d" in bars.columns else np.full(len(bars), np.nan)
+        )
+        t = a["rows"][i]
+
+        # --- リターン（close は直前値で埋める）--- #
+        cf = np.where(np.isnan(c), a["last_close"][i], c)
+
+        def _ret(k):
+            prev = a["close_ring"][i, (t - k) % CLOSE_WINDOW]
+            with np.errstate(invalid="ignore", divide="ignore"):
+                return np.where(t >= k, cf / prev - 1.0, np.nan)
+
+        r = _ret(1)
+        out = {"ret_1d": r, "ret_5d": _ret(5), "ret_20d": _ret(20)}
+        a["close_ring"][i, t % CLOSE_WINDOW] = cf
+        a["last_close"][i] = cf
+
+        # --- vol_20d: 20 行前の ret を外して r を入れる --- #
+        r_old = np.where(t >= VOL_WINDOW, a["ret_ring"][i, (t - VOL_WINDOW) % RET_WINDOW], np.nan)
+        n, mu, m2 = a["vol_n"][i], a["vol_mean"][i], a["vol_m2"][i]
+        n, mu, m2 = _welford(n, mu, m2, r_old, ~np.isnan(r_old), -1)
+        n, mu, m2 = _welford(n, mu, m2, r, ~np.isnan(r), +1)
+        a["vol_n"][i], a["vol_mean"][i], a["vol_m2"][i] = n, mu, m2
+
+        # --- downside_vol_60d --- #
+        dr = _downside(r)
+        has_old = t >= DVOL_WINDOW
+        dr_old = _downside(a["ret_ring"][i, (t - DVOL_WINDOW) % RET_WINDOW])
+        n, mu, m2 = a["dvol_n"][i], a["dvol_mean"][i], a["dvol_m2"][i]
+        n, mu, m2 = _welford(n, mu, m2, dr_old, has_old, -1)
+        n, mu, m2 = _welford(n, mu, m2, dr, np.ones(len(i), dtype=bool), +1)
+        a["dvol_n"][i], a["dvol_mean"][i], a["dvol_m2"][i] = n, mu, m2
+
+        # --- adv_20d --- #
+        to = c * v
+        to_old = np.where(t >= TURNOVER_WINDOW, a["to_ring"][i, t % TURNOVER_WINDOW], np.nan)
+        a["adv_n"][i] += (~np.isnan(to)).astype(float) - (~np.isnan(to_old)).astype(float)
+        a["adv_sum"][i] += np.nan_to_num(to) - np.nan_to_num(to_old)
+        a["to_ring"][i, t % TURNOVER_WINDOW] = to
+
+        # --- ベータ: 252 行前の (r, m) を外して (r, m) を入れる --- #
+        slot = t % RET_WINDOW
+        old_ok = t >= BETA_WINDOW
+        r_out = np.where(old_ok, a["ret_ring"][i, slot], np.nan)
+        m_out = np.where(old_ok, a["mkt_ring"][i, slot], np.nan)
+        for rr, mm, sign in ((r_out, m_out, -1.0), (r, m, +1.0)):
+            down = mm < 0
+            dy = down & ~np.isnan(rr)
+            a["db_n"][i] += sign * down
+            a["db_nan"][i] += sign * (down & np.isnan(rr))
+            a["db_sx"][i] += sign * np.where(down, mm, 0.0)
+            a["db_sy"][i] += sign * np.where(dy, rr, 0.0)
+            a["db_sxy"][i] += sign * np.where(dy, rr * mm, 0.0)
+            a["db_sxx"][i] += sign * np.where(down, mm * mm, 0.0)
+            valid = np.isfinite(rr) & np.isfinite(mm)
+            a["b_n"][i] += sign * valid
+            a["b_sx"][i] += sign * np.where(valid, mm, 0.0)
+            a["b_sy"][i] += sign * np.where(valid, rr, 0.0)
+            a["b_sxy"][i] += sign * np.where(valid, rr * mm, 0.0)
+            a["b_sxx"][i] += sign * np.where(valid, mm * mm, 0.0)
+        a["ret_ring"][i, slot] = r
+        a["mkt_ring"][i, slot] = m
+        a["rows"][i] = t + 1
+
+        self.last_date = date
+        self.n_updates += 1
+        if self.n_updates % RESYNC_EVERY == 0:
+            self.resync()
+
+        out.update(self._values(i))
+        out["turnover"] = to
+        out["downside_ret_1d"] = dr
+        df = bars.reset_index(drop=True).copy()
+        for k in STREAM_FEATURES:
+            df[k] = out[k]
+        return df
+
+    def _values(self, i) -> Dict[str, np.ndarray]:
+        """状態から i の銘柄のローリング統計を計算する"""
+        a = self.arrays
+        with np.errstate(invalid="ignore", divide="ignore"):
+            vn = a["vol_n"][i]
+            vol = np.where(vn >= VOL_MIN, np.sqrt(np.maximum(a["vol_m2"][i], 0.0) / (vn - 1)), np.nan)
+            dn = a["dvol_n"][i]
+            dvol = np.where(dn >= DVOL_MIN, np.sqrt(np.maximum(a["dvol_m2"][i], 0.0) / (dn - 1)), np.nan)
+            an = a["adv_n"][i]
+            adv = np.where(an >= ADV_MIN, a["adv_sum"][i] / an, np.nan)
+
+            n, sx, sy = a["db_n"][i], a["db_sx"][i], a["db_sy"][i]
+            cov = (a["db_sxy"][i] - sx * sy / n) / (n - 1)
+            var = (a["db_sxx"][i] - sx * sx / n) / n
+            ok = (n >= BETA_MIN) & (a["db_nan"][i] == 0) & (var > 0)
+            down_beta = np.where(ok, cov / var, np.nan)
+
+            n, sx, sy, sxx = a["b_n"][i], a["b_sx"][i], a["b_sy"][i], a["b_sxx"][i]
+            cov = a["b_sxy"][i] - sx * sy / n
+            var = sxx - sx * sx / n
+            ok = (n >= BETA_MIN) & (var > 1e-12 * np.maximum(sxx, 1e-300))
+            beta = np.where(ok, cov / var, np.nan)
+        return {"vol_20d": vol, "downside_vol_60d": dvol, "adv_20d": adv,
+                "down_beta_252d": down_beta, "beta_252d": beta}
+
+    def resync(self) -> None:
+        """リングバッファから全銘柄のローリング統計を計算し直す（逐次更新の累積誤差を消す）"""
+        a = self.arrays
+        rows = a["rows"]
+
+        def _window(ring, size, window):
+            # 各銘柄の直近 window 行（古い行・未到達の行は NaN）
+            k = np.arange(window)
+            pos = (rows[:, None] - 1 - k[None, :]) % size
+            vals = np.take_along_axis(ring, pos, axis=1)
+            return np.where(k[None, :] < rows[:, None], vals, np.nan)
+
+        def _moments(x):
+            n = (~np.isnan(x)).sum(axis=1).astype(float)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                mean = np.where(n > 0, np.nansum(x, axis=1) / n, 0.0)
+            m2 = np.nansum((x - mean[:, None]) ** 2, axis=1)
+            return n, mean, m2
+
+        r20 = _window(a["ret_ring"], RET_WINDOW, VOL_WINDOW)
+        a["vol_n"], a["vol_mean"], a["vol_m2"] = _moments(r20)
+
+        r60 = _window(a["ret_ring"], RET_WINDOW, DVOL_WINDOW)
+        d60 = np.where(np.arange(DVOL_WINDOW)[None, :] < rows[:, None], _downside(r60), np.nan)
+        a["dvol_n"], a["dvol_mean"], a["dvol_m2"] = _moments(d60)
+
+        to = _window(a["to_ring"], TURNOVER_WINDOW, ADV_WINDOW)
+        a["adv_n"] = (~np.isnan(to)).sum(axis=1).astype(float)
+        a["adv_sum"] = np.nansum(to, axis=1)
+
+        rr = _window(a["ret_ring"], RET_WINDOW, BETA_WINDOW)
+        mm = _window(a["mkt_ring"], RET_WINDOW, BETA_WINDOW)
+        down = mm < 0
+        dy = down & ~np.isnan(rr)
+        a["db_n"] = down.sum(axis=1).astype(float)
+        a["db_nan"] = (down & np.isnan(rr)).sum(axis=1).astype(float)
+        a["db_sx"] = np.where(down, mm, 0.0).sum(axis=1)
+        a["db_sy"] = np.where(dy, rr, 0.0).sum(axis=1)
+        a["db_sxy"] = np.where(dy, rr * mm, 0.0).sum(axis=1)
+        a["db_sxx"] = np.where(down, mm * mm, 0.0).sum(axis=1)
+        valid = np.isfinite(rr) & np.isfinite(mm)
+        a["b_n"] = valid.sum(axis=1).astype(float)
+        a["b_sx"] = np.where(valid, mm, 0.0).sum(axis=1)
+        a["b_sy"] = np.where(valid, rr, 0.0).sum(axis=1)
+        a["b_sxy"] = np.where(valid, rr * mm, 0.0).sum(axis=1)
+        a["b_sxx"] = np.where(valid, mm * mm, 0.0).sum(axis=1)
+
+    # ---- 保存・読み込み ---- #
+    def save(self, state_dir: Path = STATE_DIR) -> Path:
+        state_dir = Path(state_dir)
+        tmp_dir = state_dir.with_name(state_dir.name + ".tmp")
+        if tmp_dir.exists():
+            shutil.rmtree(tmp_dir)
+        tmp_dir.mkdir(parents=True)
+        np.savez(tmp_dir / STATE_FILE, **self.arrays)
+        meta = {
+            "symbols": [str(s) for s in self.symbols],
+            "last_date": str(self.last_date.date()) if self.last_date is not None else None,
+            "n_updates": self.n_updates,
+            "fingerprint": self.fingerprint,
+            "saved_at": time.time(),
+        }
+        with open(tmp_dir / META_FILE, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+        if state_dir.exists():
+            shutil.rmtree(state_dir)
+        tmp_dir.rename(state_dir)
+        return state_dir
+
+
+def load_state(state_dir: Path = STATE_DIR) -> Optional[StreamState]:
+    """保存済みの状態（無い・特徴量の宣言が変わっていれば None）"""
+    state_dir = Path(state_dir)
+    if not (state_dir / META_FILE).exists():
+        return None
+    with open(state_dir / META_FILE, "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    state = StreamState()
+    if meta.get("fingerprint") != state.fingerprint:
+        print("[feature_stream] 特徴量の宣言が変わったため状態を作り直します")
+        return None
+    with np.load(state_dir / STATE_FILE) as z:
+        state.arrays = {k: z[k] for k in _FIELDS}
+    state.symbols = pd.Index(meta["symbols"], dtype=object)
+    state.last_date = pd.Timestamp(meta["last_date"]) if meta.get("last_date") else None
+    state.n_updates = int(meta.get("n_updates", 0))
+    return state
+
+
+def replay(prices: pd.DataFrame, state: Optional[StreamState] = None) -> StreamState:
+    """prices（symbol, date, close, volume, mkt_ret_1d）を日付順に流して状態を作る"""
+    state = state or StreamState()
+    for date, bars in prices.groupby("date", sort=True):
+        state.update(date, bars.sort_values("symbol"))
+    return state
@@ -1,15 +1,92 @@
 # scripts/fetch_prices.py
 
+import argparse
+
 import pandas as pd
-import yfinance as yf
 from pathlib import Path
 
+from bulk_downloader import BulkDownloader, DownloadManifest, yf_batch_fetcher
+from price_store import ingest_prices, write_equity_file
+
 INPUT_CSV = Path("data/raw/jpx_listings/20251031.csv")
 OUTPUT_DIR = Path("data/raw/equities")
 OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+MANIFEST_PATH = OUTPUT_DIR / "_fetch_manifest.json"
+
+
+def to_equity_frame(tkr: str, data: pd.DataFrame) -> pd.DataFrame:
+    """yf.download（単一ティッカー）形式の DataFrame を parquet 保存用の標準列に整理する"""
+    data = data.reset_index()
+
+    # MultiIndexの列をフラット化（yf.download()がMultiIndexを返す場合がある）
+    if isinstance(data.columns, pd.MultiIndex):
+        # MultiIndexの場合は最初のレベルだけを使う
+        data.columns = [col[0] if isinstance(col, tuple) and len(col) > 0 else str(col) for col in data.columns]
+
+    # 列名の正規化（大文字小文字を考慮）
+    rename_map = {}
+    for col in data.columns:
+        col_str = str(col).strip()
+        if col_str.lower() in ("date", "datetime"):
+            rename_map[col] = "date"
+        elif col_str == "Open":
+            rename_map[col] = "open"
+        elif col_str == "High":
+            rename_map[col] = "high"
+        elif col_str == "Low":
+            rename_map[col] = "low"
+        elif col_str == "Close":
+            rename_map[col] = "close"
+        elif col_str in ("Adj Close", "AdjClose", "Adj_Close"):
+            rename_map[col] = "adj_close"
+        elif col_str == "Volume":
+            rename_map[col] = "volume"
+
+    if rename_map:
+        data.rename(columns=rename_map, inplace=True)
+
+    # デバッグ: 列名を確認
+    if "close" not in data.columns or "volume" not in data.columns:
+        print(f"[DEBUG] {tkr}: 列名確認 - columns={list(data.columns)}")
+
+    data["symbol"] = tkr
+
+    # turnover は必ず close * volume で計算
+    if "close" in data.columns and "volume" in data.columns:
+        try:
+            # locを使って確実にSeriesを取得
+            close_series = data.loc[:, "close"]
+            volume_series = data.loc[:, "volume"]
+
+            # 数値型に変換してから計算
+            close_num = pd.to_numeric(close_series, errors="coerce")
+            volume_num = pd.to_numeric(volume_series, errors="coerce")
+            data["turnover"] = close_num * volume_num
+        except Exception as e:
+            print(f"[WARN] {tkr}: turnover計算エラー: {e}")
+            print(f"  close列の型: {type(data.get('close'))}, volume列の型: {type(data.get('volume'))}")
+            print(f"  列名: {list(data.columns)}")
+            data["turnover"] = None
+    else:
+        print(f"[WARN] {tkr}: closeまたはvolume列が見つかりません。columns={list(data.columns)}")
+        data["turnover"] = None
+
+    # 必要な列だけに整理
+    cols = ["date", "symbol", "open", "high", "low", "close", "adj_close", "volume", "turnover"]
+    return data[cols]
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Fetch 10y daily prices for listed tickers into data/raw/equities.")
+    p.add_argument("--workers", type=int, default=4, help="並列ワーカー数（yfinance は直列で取得するため無視される）")
+    p.add_argument("--batch-size", type=int, default=20, help="1リクエストあたりのティッカー数")
+    p.add_argument("--rate", type=float, default=2.0, help="リクエストレート上限 (req/s)")
+    p.add_argument("--resume", action="store_true", help="前回の _fetch_manifest.json から再開する")
+    return p.parse_args()
 
 
 def main():
+    args = parse_args()
     df = pd.read_csv(INPUT_CSV)
 
     # ticker列が存在するか確認
@@ -24,7 +101,7 @@ def main():
         "1569.T",  # TOPIX Inverse（-1x）
         "1356.T",  # TOPIX Double Inverse（-2x）
     ]
-    
+
     # 重複を避けて追加（ユニーク化）
     tickers = pd.Index(tickers).union(pd.Index(additional_tickers)).unique()
     tickers = sorted(tickers)  # ソートして一貫性を保つ
@@ -32,93 +109,38 @@ def main():
     print(f"取得対象銘柄数: {len(tickers)}")
     print("例:", tickers[:10])
 
-    for tkr in tickers:
-        print(f"\n=== Fetching {tkr} ===")
-
-        try:
-            data = yf.download(
-                tkr,
-                period="10y",
-                interval="1d",
-                auto_adjust=False,
-                progress=False
-            )
-        except Exception as e:
-            print(f"[ERROR] {tkr}: {e}")
-            continue
-
-        if data.empty:
+    # 進捗マニフェスト（--resume 時のみ前回分を引き継ぐ）
+    if not args.resume and MANIFEST_PATH.exists():
+        MANIFEST_PATH.unlink()
+    manifest = DownloadManifest(MANIFEST_PATH)
+
+    def _save(tkr: str, data: pd.DataFrame) -> None:
+        data = to_equity_frame(tkr, data)
+        # 正規化スキーマ（版付き）で保存 → load_prices は列修復をせずに読める
+        write_equity_file(data, OUTPUT_DIR / f"{tkr}.parquet")
+
+    engine = BulkDownloader(
+        yf_batch_fetcher(period="10y"),
+        batch_size=args.batch_size,
+        max_workers=args.workers,
+        rate_per_sec=args.rate,
+        manifest=manifest,
+    )
+    status = engine.run(tickers, _save)
+
+    for tkr, st in sorted(status.items()):
+        if st == "failed":
+            print(f"[ERROR] {tkr}: {manifest.entries.get(tkr, {}).get('error')}")
+        elif st == "empty":
             print(f"[EMPTY] No data for {tkr}")
-            continue
-
-        # parquet 形式に整理
-        data = data.reset_index()
-        
-        # MultiIndexの列をフラット化（yf.download()がMultiIndexを返す場合がある）
-        if isinstance(data.columns, pd.MultiIndex):
-            # MultiIndexの場合は最初のレベルだけを使う
-            data.columns = [col[0] if isinstance(col, tuple) and len(col) > 0 else str(col) for col in data.columns]
-        
-        # 列名の正規化（大文字小文字を考慮）
-        rename_map = {}
-        for col in data.columns:
-            col_str = str(col).strip()
-            if col_str.lower() in ("date", "datetime"):
-                rename_map[col] = "date"
-            elif col_str == "Open":
-                rename_map[col] = "open"
-            elif col_str == "High":
-                rename_map[col] = "high"
-            elif col_str == "Low":
-                rename_map[col] = "low"
-            elif col_str == "Close":
-                rename_map[col] = "close"
-            elif col_str in ("Adj Close", "AdjClose", "Adj_Close"):
-                rename_map[col] = "adj_close"
-            elif col_str == "Volume":
-                rename_map[col] = "volume"
-        
-        if rename_map:
-            data.rename(columns=rename_map, inplace=True)
-        
-        # デバッグ: 列名を確認
-        if "close" not in data.columns or "volume" not in data.columns:
-            print(f"[DEBUG] {tkr}: 列名確認 - columns={list(data.columns)}")
-
-        data["symbol"] = tkr
-        
-        # turnover は必ず close * volume で計算
-        if "close" in data.columns and "volume" in data.columns:
-            try:
-                # locを使って確実にSeriesを取得
-                close_series = data.loc[:, "close"]
-                volume_series = data.loc[:, "volume"]
-                
-                # 数値型に変換してから計算
-                close_num = pd.to_numeric(close_series, errors="coerce")
-                volume_num = pd.to_numeric(volume_series, errors="coerce")
-                data["turnover"] = close_num * volume_num
-            except Exception as e:
-                print(f"[WARN] {tkr}: turnover計算エラー: {e}")
-                print(f"  close列の型: {type(data.get('close'))}, volume列の型: {type(data.get('volume'))}")
-                print(f"  列名: {list(data.columns)}")
-                data["turnover"] = None
-        else:
-            print(f"[WARN] {tkr}: closeまたはvolume列が見つかりません。columns={list(data.columns)}")
-            data["turnover"] = None
-
-        # 必要な列だけに整理
-        cols = ["date", "symbol", "open", "high", "low", "close", "adj_close", "volume", "turnover"]
-        data = data[cols]
-
-        # 保存
-        out_path = OUTPUT_DIR / f"{tkr}.parquet"
-        data.to_parquet(out_path, index=False)
-        print(f"[OK] Saved → {out_path}")
+    print(f"[OK] Saved {sum(st == 'done' for st in status.values())} files → {OUTPUT_DIR}")
 
     print("\n=== 完了：parquet生成しました ===")
 
+    # 銘柄ファイルを更新したので集約ストアも作り直す（load_prices の高速パス）
+    store = ingest_prices(OUTPUT_DIR)
+    print(f"=== price store 更新: {store} ===")
+
 
 if __name__ == "__main__":
     main()
-
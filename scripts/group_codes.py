@@ -0,0 +1,116 @@
+"""
+group_codes.py
+
+[役割]
+- スコアリングのグループ（日付 / 日付×セクター / 日付×サイズバケット）を整数コードで持つ
+  - sector は JPX 上場銘柄一覧（LISTINGS_CSV）から1回だけ結合する
+  - コードは daily_feature_scores の列（GROUP_CODE_COLUMNS）として保存し、
+    compute_scores_all(group_codes=...) に渡せば複数キーの groupby（文字列の factorize）をしない
+- コードは日付ごとに決まる値なので、差分追加したパーティションとも矛盾しない
+    gc_date        = 1970-01-01 からの日数
+    gc_date_sector = gc_date * セクター数 + セクター番号（セクター不明は -1）
+    gc_date_size   = gc_date * 3 + サイズバケット番号（Large=0 / Mid=1 / Small=2）
+"""
+from __future__ import annotations
+
+import hashlib
+import sys
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+# プロジェクトルートをパスに追加（core パッケージ）
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+from core.cross_section import Segments  # noqa: E402
+from scoring_engine import SIZE_BUCKET_DTYPE, ScoringEngineConfig  # noqa: E402
+
+LISTINGS_CSV = Path("data/raw/jpx_listings/20251031.csv")
+SECTOR_COL = "sector"
+
+# group_cols → 保存するコード列
+GROUP_CODE_COLUMNS: Dict[Tuple[str, ...], str] = {
+    ("date",): "gc_date",
+    ("date", "sector"): "gc_date_sector",
+    ("date", "size_bucket"): "gc_date_size",
+}
+
+
+@lru_cache(maxsize=None)
+def load_sectors(path: Path = LISTINGS_CSV) -> pd.Series:
+    """ticker → sector（一覧が無ければ空）"""
+    path = Path(path)
+    if not path.exists():
+        print(f"[group_codes] 警告: {path} がありません。sector は不明扱いになります")
+        return pd.Series(dtype="object")
+    df = pd.read_csv(path, usecols=["ticker", "sector"]).dropna()
+    return df.drop_duplicates("ticker").set_index("ticker")["sector"].astype(str)
+
+
+def sector_categories(path: Path = LISTINGS_CSV) -> pd.Index:
+    """セクター名（昇順。位置がセクター番号）"""
+    return pd.Index(sorted(load_sectors(path).unique()))
+
+
+def fingerprint(path: Path = LISTINGS_CSV) -> str:
+    """銘柄 → セクターの対応のハッシュ（feature_config_hash に入れる）"""
+    sectors = load_sectors(path).sort_index()
+    payload = "\n".join(f"{k},{v}" for k, v in sectors.items())
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def day_codes(dates) -> np.ndarray:
+    """日付 → 1970-01-01 からの日数（NaT は -1）"""
+    d = pd.to_datetime(pd.Series(dates)).to_numpy(dtype="datetime64[D]")
+    out = d.astype(np.int64)
+    return np.where(np.isnat(d), -1, out)
+
+
+def size_bucket_codes(seg: Segments, liquidity) -> np.ndarray:
+    """
+    scoring_engine.assign_size_bucket と同じ規則のサイズバケット番号（SIZE_BUCKET_DTYPE の順）。
+    日付ごとに 1/3・2/3 分位で区切る。非 NaN が3件未満の日・NaN の行は Mid。
+    """
+    x = np.asarray(liquidity, dtype="float64")
+    q1 = seg.broadcast(seg.quantile(x, 1 / 3))
+    q2 = seg.broadcast(seg.quantile(x, 2 / 3))
+    enough = seg.broadcast(seg.count(x)) >= 3
+    large, mid, small = (SIZE_BUCKET_DTYPE.categories.get_loc(b) for b in ("Large", "Mid", "Small"))
+    out = np.full(len(x), mid, dtype=np.int64)
+    out = np.where(enough & (x >= q2), large, out)
+    out = np.where(enough & (x < q1), small, out)
+    return out
+
+
+def _combine(day: np.ndarray, key: np.ndarray, n_keys: int) -> np.ndarray:
+    return np.where((day >= 0) & (key >= 0), day * n_keys + key, -1)
+
+
+def add_group_codes(df: pd.DataFrame, listings: Path = LISTINGS_CSV) -> pd.DataFrame:
+    """df に sector 列と GROUP_CODE_COLUMNS の列を付ける（df をそのまま更新して返す）"""
+    day = day_codes(df["date"])
+
+    cats = sector_categories(listings)
+    df[SECTOR_COL] = df["symbol"].map(load_sectors(listings))
+    sector = cats.get_indexer(df[SECTOR_COL])
+
+    liquidity_col = ScoringEngineConfig().liquidity_col
+    bucket = size_bucket_codes(Segments.from_codes(day), df[liquidity_col].to_numpy())
+
+    df[GROUP_CODE_COLUMNS[("date",)]] = day
+    df[GROUP_CODE_COLUMNS[("date", "sector")]] = _combine(day, sector, max(len(cats), 1))
+    df[GROUP_CODE_COLUMNS[("date", "size_bucket")]] = _combine(day, bucket, len(SIZE_BUCKET_DTYPE.categories))
+    return df
+
+
+def codes_for(df: pd.DataFrame, group_cols: Iterable[str]) -> Optional[np.ndarray]:
+    """group_cols に対応する保存済みのコード列（無ければ None → groupby のキーで計算する）"""
+    col = GROUP_CODE_COLUMNS.get(tuple(group_cols))
+    if col is None or col not in df.columns:
+        return None
+    return df[col].to_numpy()
@@ -8,7 +8,7 @@ feature_builder.py は変更せず、投資ホライゾンの違いは
 リバランス頻度で吸収する。
 """
 from pathlib import Path
-from typing import List, Tuple, Dict
+from typing import List, Tuple, Dict, Optional
 
 import pandas as pd
 import numpy as np
@@ -17,6 +17,9 @@ from scoring_engine import ScoringEngineConfig, build_daily_portfolio
 from event_guard import EventGuard
 from weights_cleaning import clean_target_weights
 import data_loader
+import feature_store
+import score_cache
+from price_panel import PricePanel, load_matching_panel
 
 
 # バックテストモード: "z_lin" / "rank" / "z_clip_rank" / "z_lowvol" / "z_downvol" / "z_downbeta" / "z_downcombo"
@@ -82,17 +85,42 @@ def get_mode_suffix() -> str:
         raise ValueError(f"Unknown BACKTEST_MODE: {BACKTEST_MODE}")
 
 
-def build_features_shared() -> Tuple[pd.DataFrame, pd.DataFrame]:
+def backtest_feature_columns(score_col: Optional[str] = None) -> List[str]:
+    """
+    バックテストが feature store から読む列
+    （score_col 省略時は現在の BACKTEST_MODE のスコア列。ポートフォリオ構築に必要な列だけ）
+    """
+    cfg = ScoringEngineConfig(score_col=score_col or get_score_col_for_horizon(1))
+    cols = [cfg.date_col, "symbol", cfg.score_col, cfg.liquidity_col]
+    available = set(feature_store.columns())
+    if cfg.size_bucket_col in available:
+        cols.append(cfg.size_bucket_col)
+    return list(dict.fromkeys(cols))
+
+
+def build_features_shared(
+    columns: Optional[List[str]] = None,
+    start=None,
+    end=None,
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
     """
     共有 feature を一度だけ構築（既存の build_features.py の出力を利用）
+    columns / start / end を指定すると、その列・期間のパーティションだけを読む。
+    feature は feature_store の省メモリ形式（compact=True）で返す。
+    store に無い score_* 列は score_cache（パーティション × Variant 設定ごとのキャッシュ）から作る。
     """
-    feat_path = Path("data/processed/daily_feature_scores.parquet")
-    if not feat_path.exists():
-        raise FileNotFoundError(
-            f"{feat_path} がありません。先に build_features.py を実行してください。"
-        )
-    
-    df_feat = pd.read_parquet(feat_path)
+    # store に無い score 列（--variants で一部だけ作った store など）は score_cache から足す
+    missing = score_cache.missing_variants(columns)
+    if columns is not None and missing:
+        columns = [c for c in columns if c not in {f"score_{v}" for v in missing}]
+
+    # data/processed/daily_feature_scores/（無ければ旧形式の単一ファイル）
+    # 省メモリ形式（float32 / category / int32 session）で読む
+    df_feat = feature_store.read_features(columns, start=start, end=end, compact=True)
+    if missing:
+        scores = score_cache.load_scores(missing, start=start, end=end)
+        for v in missing:
+            df_feat[f"score_{v}"] = scores[f"score_{v}"].to_numpy(dtype="float32")
     df_prices = data_loader.load_prices()
     
     return df_feat, df_prices
@@ -102,6 +130,7 @@ def backtest_with_horizon(
     features: pd.DataFrame,
     prices: pd.DataFrame,
     holding_horizon: int,
+    panel: Optional[PricePanel] = None,
 ) -> pd.DataFrame:
     """
     ラダー方式でバックテストを実行（ウィンドウ重複方式）
@@ -114,6 +143,8 @@ def backtest_with_horizon(
         features: 全銘柄×営業日の特徴量（daily_feature_scores.parquet）
         prices: 全銘柄×営業日の価格
         holding_horizon: 1, 5, 10, 20, 60 など（保持期間）
+        panel: 日付×銘柄の価格パネル（price_panel.load_matching_panel(prices) など）。
+            明示的に渡したときだけ使い、prices と日付・銘柄が一致しなければ ValueError。省略時は prices から pivot で作る
     
     Returns:
         日次ポートフォリオリターンのDataFrame
@@ -125,20 +156,29 @@ def backtest_with_horizon(
     features["date"] = pd.to_datetime(features["date"])
     features = features.sort_values("date")
     trade_dates = sorted(features["date"].unique())
-    
-    # 価格データを準備
-    prices["date"] = pd.to_datetime(prices["date"])
-    prices = prices.sort_values(["symbol", "date"])
-    
-    # 価格データを日付×銘柄のピボットテーブルに変換（高速化のため）
-    prices_pivot = prices.pivot_table(
-        index="date", 
-        columns="symbol", 
-        values="close"
-    )
-    
-    # 翌日のリターンを計算（close-to-close）
-    prices_ret = prices_pivot.pct_change().shift(-1)
+    # 日付ごとの行位置（営業日ごとの全行スキャンを避ける）
+    rows_by_date = features.groupby("date", sort=False).indices
+    
+    # 価格パネル（日付×銘柄）: 呼び出し側が渡した memmap を共有し、無ければ prices から pivot で作る
+    if panel is not None:
+        panel.check_matches(prices)
+        prices_pivot = panel.frame("close")
+        # 翌日のリターン（close-to-close, pct_change().shift(-1) と同じ定義）
+        prices_ret = panel.frame("ret_fwd_1d")
+    else:
+        # 価格データを準備
+        prices["date"] = pd.to_datetime(prices["date"])
+        prices = prices.sort_values(["symbol", "date"])
+
+        # 価格データを日付×銘柄のピボットテーブルに変換（高速化のため）
+        prices_pivot = prices.pivot_table(
+            index="date",
+            columns="symbol",
+            values="close"
+        )
+
+        # 翌日のリターンを計算（close-to-close）
+        prices_ret = prices_pivot.pct_change().shift(-1)
     
     # ポートフォリオ構築用の設定（horizon に応じてスコア列を切り替え）
     score_col = get_score_col_for_horizon(holding_horizon)
@@ -155,7 +195,10 @@ def backtest_with_horizon(
     
     for t_idx, t in enumerate(trade_dates[:-1]):  # t のウェイトで (t+1) のリターンを取る前提
         # 1) 当日の signal / features から raw weight を構築
-        today_feat = features[features["date"] == t].copy()
+        pos = rows_by_date.get(t)
+        if pos is None:
+            continue
+        today_feat = features.iloc[pos]  # iloc は新しいフレームを返す（build_daily_portfolio 側でもコピーする）
         
         if today_feat.empty:
             continue
@@ -761,7 +804,12 @@ def print_h1_statistics(df_alpha: pd.DataFrame) -> None:
     print("\n" + "=" * 60)
 
 
-def run_horizon_ensemble(horizons: List[int] = [1, 5, 10, 20, 60], debug_h1_only: bool = False) -> None:
+def run_horizon_ensemble(
+    horizons: List[int] = [1, 5, 10, 20, 60],
+    debug_h1_only: bool = False,
+    start=None,
+    end=None,
+) -> None:
     """
     全体実行
     """
@@ -779,9 +827,12 @@ def run_horizon_ensemble(horizons: List[int] = [1, 5, 10, 20, 60], debug_h1_only
     
     # 1. shared feature & price load
     print("\n[STEP 1] 共有featureと価格データを読み込み中...")
-    features, prices = build_features_shared()
+    features, prices = build_features_shared(backtest_feature_columns(), start=start, end=end)
     print(f"  Features: {len(features)} rows")
     print(f"  Prices: {len(prices)} rows")
+    # 日付×銘柄の価格パネル（price_store 取り込み時に作った memmap）。全 horizon で共有する
+    panel = load_matching_panel(prices)
+    print(f"  Price panel: {'memmap' if panel is not None else 'なし（pivot で作成）'}")
     
     # 2. horizon別バックテスト
     summary_rows = []
@@ -789,7 +840,7 @@ def run_horizon_ensemble(horizons: List[int] = [1, 5, 10, 20, 60], debug_h1_only
     for h in horizons:
         print(f"\n[STEP 2-{h}] H{h} バックテスト実行中...")
         try:
-            df_pt = backtest_with_horizon(features, prices, h)
+            df_pt = backtest_with_horizon(features, prices, h, panel=panel)
             # ファイル名にモードとラダー/非ラダーを含める
             suffix_mode = get_mode_suffix()
             pt_path = Path(f"data/processed/paper_trade_h{h}_ladder_{suffix_mode}.parquet")
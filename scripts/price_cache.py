@@ -0,0 +1,205 @@
+"""
+price_cache.py
+
+[役割]
+- プロセス内で共有する DataFrame キャッシュ（価格・リターン系ファイル向け）
+  - キー = 読み込み元ファイルの (パス, mtime_ns, size) ＋ 呼び出し側のキー
+    → ファイルが更新されれば自動的に読み直す
+  - LRU（件数・推定バイト数の上限）で古いものから捨てる
+  - 任意で Arrow(feather) スナップショットをディスクに残し、別プロセスからも再利用できる
+    （ディレクトリの合計が SNAPSHOT_MAX_BYTES を超えたら、最後に使った時刻（mtime）が古いものから消す）
+
+1回のパイプライン実行の中で load_prices() や同じ parquet を何度も読む箇所
+（build_features_shared / paper_trade / eval_stop_regimes* / calc_minimum_capital）で使う。
+
+戻り値は常にコピー（呼び出し側が列を書き換えてもキャッシュは汚れない）。
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Hashable, Iterable, Optional, Sequence, Tuple
+
+import pandas as pd
+import pyarrow.feather as feather
+
+CACHE_MAX_ENTRIES = 32
+CACHE_MAX_BYTES = 2 * 1024 ** 3  # 2GB
+SNAPSHOT_DIR = Path("data/interim/frame_cache")
+SNAPSHOT_MAX_BYTES = 4 * 1024 ** 3  # 4GB（ディスク上のスナップショットの合計）
+
+# True にすると get_or_load の既定でディスクスナップショットを使う
+SNAPSHOT = False
+
+
+def _signature(sources: Iterable[Path]) -> Tuple[Tuple[str, int, int], ...]:
+    sig = []
+    for p in sources:
+        p = Path(p)
+        try:
+            st = p.stat()
+            sig.append((str(p.resolve()), st.st_mtime_ns, st.st_size))
+        except FileNotFoundError:
+            sig.append((str(p), -1, -1))
+    return tuple(sig)
+
+
+def _frame_nbytes(df: pd.DataFrame) -> int:
+    try:
+        return int(df.memory_usage(index=True, deep=False).sum())
+    except Exception:
+        return 0
+
+
+class FrameCache:
+    """(key, ファイル署名) → DataFrame の LRU キャッシュ（スレッドセーフ）"""
+
+    def __init__(
+        self,
+        max_entries: int = CACHE_MAX_ENTRIES,
+        max_bytes: int = CACHE_MAX_BYTES,
+        snapshot_dir: Path = SNAPSHOT_DIR,
+        snapshot_max_bytes: int = SNAPSHOT_MAX_BYTES,
+    ) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.snapshot_dir = Path(snapshot_dir)
+        self.snapshot_max_bytes = snapshot_max_bytes
+        self._entries: "OrderedDict[Hashable, Tuple[tuple, pd.DataFrame, int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _evict_locked(self) -> None:
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            _, (_, _, nbytes) = self._entries.popitem(last=False)
+            self._bytes -= nbytes
+
+    def evict_snapshots(self) -> None:
+        """
+        スナップショットの合計が snapshot_max_bytes 以下になるまで、mtime の古いものから消す。
+        （ソースが更新されるたびに別名のスナップショットが増えるため）
+        """
+        if not self.snapshot_dir.exists():
+            return
+        files = []
+        for p in self.snapshot_dir.glob("*.feather"):
+            try:
+                st = p.stat()
+            except FileNotFoundError:
+                continue
+            files.append((st.st_mtime, st.st_size, p))
+        total = sum(size for _, size, _ in files)
+        for _, size, p in sorted(files, key=lambda t: t[0]):
+            if total <= self.snapshot_max_bytes:
+                break
+            p.unlink(missing_ok=True)
+            total -= size
+
+    def get_or_load(
+        self,
+        key: Hashable,
+        sources: Sequence[Path],
+        loader: Callable[[], pd.DataFrame],
+        *,
+        snapshot: Optional[bool] = None,
+    ) -> pd.DataFrame:
+        """
+        sources の署名が前回と同じならキャッシュのコピーを返し、変わっていれば loader() で読み直す。
+        snapshot=True なら、プロセス内キャッシュに無いときディスクの feather スナップショットを先に探す。
+        """
+        sig = _signature(sources)
+        with self._lock:
+            hit = self._entries.get(key)
+            if hit is not None and hit[0] == sig:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return hit[1].copy()
+            self.misses += 1
+
+        use_snapshot = SNAPSHOT if snapshot is None else snapshot
+        df = None
+        snap_path = None
+        tmp = None
+        if use_snapshot:
+            digest = hashlib.sha1(repr((key, sig)).encode("utf-8")).hexdigest()
+            snap_path = self.snapshot_dir / f"{digest}.feather"
+            if snap_path.exists():
+                try:
+                    df = pd.read_feather(snap_path)
+                    snap_path.touch()  # 最近使ったものを残す
+                except Exception:
+                    df = None
+        if df is None:
+            df = loader()
+            if snap_path is not None:
+                try:
+                    snap_path.parent.mkdir(parents=True, exist_ok=True)
+                    # 一時ファイルはプロセス・スレッドごとに別名（*.feather の掃除にも入らない）
+                    tmp = snap_path.with_name(f"{snap_path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+                    # pyarrow で書くとインデックス（DatetimeIndex など）も pandas メタデータ付きで保存され、
+                    # pd.read_feather で復元される（DataFrame.to_feather は既定の RangeIndex しか書けない）
+                    feather.write_feather(df, tmp)
+                    tmp.replace(snap_path)
+                    self.evict_snapshots()
+                except Exception as e:
+                    print(f"[price_cache] 警告: スナップショット保存に失敗: {e}")
+                    if tmp is not None:
+                        tmp.unlink(missing_ok=True)
+
+        nbytes = _frame_nbytes(df)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+            self._entries[key] = (sig, df, nbytes)
+            self._bytes += nbytes
+            self._evict_locked()
+        return df.copy()
+
+
+_CACHE = FrameCache()
+
+
+def get_or_load(
+    key: Hashable,
+    sources: Sequence[Path],
+    loader: Callable[[], pd.DataFrame],
+    *,
+    snapshot: Optional[bool] = None,
+) -> pd.DataFrame:
+    """プロセス共有キャッシュ経由で読み込む（FrameCache.get_or_load を参照）"""
+    return _CACHE.get_or_load(key, sources, loader, snapshot=snapshot)
+
+
+def read_parquet(path, columns: Optional[Sequence[str]] = None) -> pd.DataFrame:
+    """pd.read_parquet のキャッシュ版（パス＋列が同じでファイルが未更新なら再読込しない）"""
+    path = Path(path)
+    cols = tuple(columns) if columns is not None else None
+    return get_or_load(
+        ("read_parquet", str(path.resolve()), cols),
+        [path],
+        lambda: pd.read_parquet(path, columns=list(cols) if cols is not None else None),
+    )
+
+
+def clear() -> None:
+    _CACHE.clear()
+
+
+def stats() -> dict:
+    return {
+        "entries": len(_CACHE._entries),
+        "bytes": _CACHE._bytes,
+        "hits": _CACHE.hits,
+        "misses": _CACHE.misses,
+    }
@@ -0,0 +1,248 @@
+"""
+price_panel.py
+
+[役割]
+- 長い形式の価格（load_prices の出力）を 日付×銘柄 の密行列に変換し、
+  フィールドごとに .npy として永続化する
+    close / ret_fwd_1d は float64（P&L を pivot の従来実装と同じ精度にする）
+    adj_close / volume / turnover は float32
+- サイドカー（dates.npy / symbols.json / _manifest.json）で軸を復元し、
+  np.load(mmap_mode="r") でゼロコピーに読み出す
+
+バックテスト（backtest_with_horizon / backtest_non_ladder）は毎回
+pivot_table → pct_change().shift(-1) を作り直していたが、
+並列で走らせる多数のジョブが同じ memmap を共有できるようにする。
+バックテストは呼び出し側が panel を明示的に渡したときだけ使う（渡した prices と日付・銘柄が一致するか確認する）。
+run_horizon_ensemble / backtest_non_ladder.main は load_matching_panel(prices) で1回だけ読んで渡す。
+パネルは price_store.ingest_prices（価格の取り込み）のたびに作り直す。
+
+[レイアウト]
+  data/interim/price_panel/
+    _manifest.json
+    dates.npy          # int64 (ns)
+    symbols.json
+    close.npy, adj_close.npy, volume.npy, turnover.npy, ret_fwd_1d.npy
+
+使い方:
+  python scripts/price_panel.py        # load_prices() からパネルを作成（price store が古ければ取り込みから）
+"""
+from __future__ import annotations
+
+import json
+import shutil
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+import price_store
+
+PANEL_DIR = Path("data/interim/price_panel")
+MANIFEST_NAME = "_manifest.json"
+
+PANEL_FIELDS = ("close", "adj_close", "volume", "turnover", "ret_fwd_1d")
+# P&L に使うので float64 で持つフィールド（それ以外は from_prices の dtype）
+FLOAT64_FIELDS = ("close", "ret_fwd_1d")
+
+
+@dataclass
+class PricePanel:
+    """
+    日付×銘柄 の密行列の束。arrays の各要素は shape=(len(dates), len(symbols))。
+    """
+    dates: pd.DatetimeIndex
+    symbols: pd.Index
+    arrays: Dict[str, np.ndarray]
+
+    def frame(self, field: str) -> pd.DataFrame:
+        """field の行列を DataFrame として包む（コピーしない）"""
+        if field not in self.arrays:
+            raise KeyError(f"panel に {field} がありません: {list(self.arrays)}")
+        return pd.DataFrame(self.arrays[field], index=self.dates, columns=self.symbols, copy=False)
+
+    @classmethod
+    def from_prices(cls, prices: pd.DataFrame, dtype=np.float32) -> "PricePanel":
+        """
+        長い形式の価格から作る。
+        close と ret_fwd_1d はバックテストの従来実装（pivot_table → pct_change().shift(-1)）と同じ式・float64 で作る。
+        """
+        prices = prices.copy()
+        prices["date"] = pd.to_datetime(prices["date"])
+
+        close = prices.pivot_table(index="date", columns="symbol", values="close")
+        ret_fwd = close.pct_change().shift(-1)
+
+        arrays = {
+            "close": close.to_numpy(dtype=np.float64),
+            "ret_fwd_1d": ret_fwd.to_numpy(dtype=np.float64),
+        }
+        for field in ("adj_close", "volume", "turnover"):
+            if field in prices.columns:
+                wide = (
+                    prices.assign(**{field: pd.to_numeric(prices[field], errors="coerce")})
+                    .pivot_table(index="date", columns="symbol", values=field, dropna=False)
+                    .reindex(index=close.index, columns=close.columns)
+                )
+            else:
+                wide = pd.DataFrame(np.nan, index=close.index, columns=close.columns)
+            arrays[field] = wide.to_numpy(dtype=dtype)
+
+        return cls(dates=pd.DatetimeIndex(close.index), symbols=pd.Index(close.columns), arrays=arrays)
+
+    def check_matches(self, prices: pd.DataFrame) -> None:
+        """
+        prices（長い形式）と日付・銘柄がパネルと一致しなければ ValueError。
+        絞り込んだ・ずらした prices を渡したのに別のパネルでバックテストする、を防ぐ。
+        """
+        dates = pd.DatetimeIndex(pd.to_datetime(prices["date"]).unique()).sort_values()
+        symbols = pd.Index(prices["symbol"].unique()).sort_values()
+        if not dates.equals(self.dates) or not symbols.equals(self.symbols.sort_values()):
+            raise ValueError(
+                "price panel の日付・銘柄が prices と一致しません"
+                f"（panel: {len(self.dates)} 日 × {len(self.symbols)} 銘柄, prices: {len(dates)} 日 × {len(symbols)} 銘柄）。"
+                "panel を渡さずに prices から計算するか、prices から作った panel を渡してください"
+            )
+
+    def save(self, panel_dir: Path = PANEL_DIR, source: Optional[dict] = None) -> Path:
+        panel_dir = Path(panel_dir)
+        tmp_dir = panel_dir.with_name(panel_dir.name + ".tmp")
+        if tmp_dir.exists():
+            shutil.rmtree(tmp_dir)
+        tmp_dir.mkdir(parents=True)
+
+        np.save(tmp_dir / "dates.npy", self.dates.asi8)
+        with open(tmp_dir / "symbols.json", "w", encoding="utf-8") as f:
+            json.dump([str(s) for s in self.symbols], f, ensure_ascii=False)
+        for field, arr in self.arrays.items():
+            np.save(tmp_dir / f"{field}.npy", np.ascontiguousarray(arr))
+
+        manifest = {
+            "fields": list(self.arrays),
+            "shape": [len(self.dates), len(self.symbols)],
+            "dtypes": {field: str(arr.dtype) for field, arr in self.arrays.items()},
+            "built_at": time.time(),
+            "source": source or {},
+        }
+        with open(tmp_dir / MANIFEST_NAME, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+        if panel_dir.exists():
+            shutil.rmtree(panel_dir)
+        tmp_dir.rename(panel_dir)
+        return panel_dir
+
+
+def read_manifest(panel_dir: Path = PANEL_DIR) -> Optional[dict]:
+    path = Path(panel_dir) / MANIFEST_NAME
+    if not path.exists():
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return None
+
+
+def is_fresh(panel_dir: Path = PANEL_DIR) -> bool:
+    """
+    パネルが price_store の現行版から作られたものか。
+    （price_store 自体が銘柄ファイルと同期していることも確認する）
+    """
+    manifest = read_manifest(panel_dir)
+    store_manifest = price_store.read_manifest()
+    if manifest is None or store_manifest is None:
+        return False
+    if not price_store.is_fresh():
+        return False
+    # close / ret_fwd_1d を float32 で持っていた古いパネルは作り直す
+    dtypes = manifest.get("dtypes", {})
+    if any(dtypes.get(field) != "float64" for field in FLOAT64_FIELDS):
+        return False
+    return manifest.get("source", {}).get("store_built_at") == store_manifest.get("built_at")
+
+
+def load_price_panel(panel_dir: Path = PANEL_DIR, mmap_mode: Optional[str] = "r") -> PricePanel:
+    """
+    永続化したパネルを読む。mmap_mode="r" なら各 .npy はメモリマップ（読み取り専用）。
+    """
+    panel_dir = Path(panel_dir)
+    manifest = read_manifest(panel_dir)
+    if manifest is None:
+        raise FileNotFoundError(f"price panel not found: {panel_dir}（python scripts/price_panel.py で作成）")
+
+    dates = pd.DatetimeIndex(np.load(panel_dir / "dates.npy").astype("datetime64[ns]"))
+    with open(panel_dir / "symbols.json", "r", encoding="utf-8") as f:
+        symbols = pd.Index(json.load(f))
+    arrays = {
+        field: np.load(panel_dir / f"{field}.npy", mmap_mode=mmap_mode)
+        for field in manifest.get("fields", PANEL_FIELDS)
+    }
+    return PricePanel(dates=dates, symbols=symbols, arrays=arrays)
+
+
+def load_price_panel_if_fresh(panel_dir: Path = PANEL_DIR) -> Optional[PricePanel]:
+    """新しいパネルがあれば memmap で返し、無ければ None（呼び出し側で pivot にフォールバック）"""
+    if not is_fresh(panel_dir):
+        return None
+    try:
+        return load_price_panel(panel_dir)
+    except Exception as e:
+        print(f"[price_panel] 警告: パネル読み込み失敗のため pivot にフォールバック: {e}")
+        return None
+
+
+def load_matching_panel(prices: pd.DataFrame, panel_dir: Path = PANEL_DIR) -> Optional[PricePanel]:
+    """
+    load_price_panel_if_fresh() のパネルが prices と日付・銘柄で一致すれば返す。
+    無い・一致しない場合は None（バックテストは prices から pivot する）。
+    """
+    panel = load_price_panel_if_fresh(panel_dir)
+    if panel is None:
+        return None
+    try:
+        panel.check_matches(prices)
+    except ValueError as e:
+        print(f"[price_panel] 警告: {e}")
+        return None
+    return panel
+
+
+def build_price_panel(
+    panel_dir: Path = PANEL_DIR,
+    prices: Optional[pd.DataFrame] = None,
+    store_manifest: Optional[dict] = None,
+) -> Path:
+    """
+    パネルを作って保存する。prices を省略すると load_prices() から作る。
+    store_manifest は prices の元になった price store の manifest（省略時は現在のもの）。
+    """
+    if store_manifest is None:
+        store_manifest = price_store.read_manifest()
+    if prices is None:
+        import data_loader
+
+        prices = data_loader.load_prices()
+    panel = PricePanel.from_prices(prices)
+    source = {"store_built_at": store_manifest.get("built_at") if store_manifest else None}
+    return panel.save(panel_dir, source=source)
+
+
+def main() -> None:
+    t0 = time.time()
+    if not price_store.is_fresh():
+        # 取り込みでパネルも作り直す
+        print("[price_panel] price store が古い／無いため作り直します")
+        price_store.ingest_prices()
+        out = PANEL_DIR
+    else:
+        out = build_price_panel()
+    manifest = read_manifest(out) or {}
+    print(f"[price_panel] wrote {out} shape={manifest.get('shape')} fields={manifest.get('fields')} "
+          f"in {time.time() - t0:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
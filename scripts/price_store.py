@@ -0,0 +1,322 @@
+"""
+price_store.py
+
+[役割]
+- data/raw/equities/*.parquet（1銘柄1ファイル）を一度だけ読み込み、
+  固定スキーマの日付パーティション Parquet データセットに集約する（ingest）
+- 集約済みデータセットを「1回の一括読み込み＋列射影」でロードする（loader）
+
+[レイアウト]
+  data/interim/price_store/
+    _manifest.json          # ingest 時のメタ情報（ソースの指紋 / 行数など）
+    year=2016/part-0.parquet
+    year=2017/part-0.parquet
+    ...
+
+data_loader.load_prices() は、ストアがソースより新しければこちらを使い、
+古い／存在しない場合は従来どおり銘柄ファイルを1本ずつ読む。
+
+[銘柄ファイルのスキーマ版]
+- 銘柄ファイルは PRICE_SCHEMA 固定の型で書き、Parquet のキー値メタデータに
+  SCHEMA_VERSION を記録する（write_equity_file）
+- 版が一致するファイルは読み込み時の列修復（MultiIndex / "('open','2413.T')" の展開、
+  重複列除去、turnover 再計算）を丸ごと省く
+- 旧形式のファイルは ingest 時に一度だけ正規化して書き直す（migrate_equity_files）
+
+使い方:
+  python scripts/price_store.py            # 旧形式を正規化 → data/interim/price_store と price_panel を作成
+  python scripts/price_store.py --migrate-only   # 銘柄ファイルの正規化だけ行う
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import shutil
+import time
+from pathlib import Path
+from typing import Iterable, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+SOURCE_DIR = Path("data/raw/equities")
+STORE_DIR = Path("data/interim/price_store")
+MANIFEST_NAME = "_manifest.json"
+
+PRICE_COLS = ["date", "symbol", "open", "high", "low", "close", "adj_close", "volume", "turnover"]
+
+# 固定スキーマ（volume は欠損を許すため float64 で保持）
+PRICE_SCHEMA = pa.schema(
+    [
+        ("date", pa.timestamp("ns")),
+        ("symbol", pa.string()),
+        ("open", pa.float64()),
+        ("high", pa.float64()),
+        ("low", pa.float64()),
+        ("close", pa.float64()),
+        ("adj_close", pa.float64()),
+        ("volume", pa.float64()),
+        ("turnover", pa.float64()),
+    ]
+)
+
+# 銘柄ファイルの正規化スキーマ版（列・型・turnover の定義を変えたら上げる）
+SCHEMA_VERSION = 1
+SCHEMA_META_KEY = b"equity01.price_schema_version"
+
+_PARTITIONING = ds.partitioning(pa.schema([("year", pa.int16())]), flavor="hive")
+
+
+def _source_files(src_dir: Path) -> List[Path]:
+    return sorted(Path(src_dir).glob("*.parquet"))
+
+
+def _source_signature(files: Sequence[Path]) -> dict:
+    """
+    ソースファイル群の軽量な指紋（stat のみ、中身は読まない）。
+    files_hash は (ファイル名, サイズ, mtime_ns) を名前順に並べた sha1 で、
+    古い mtime のファイルへの差し替え・同数での入れ替え・同じ秒内の書き直しも検出する。
+    """
+    entries = []
+    for f in sorted(files, key=lambda p: p.name):
+        st = f.stat()
+        entries.append((f.name, st.st_size, st.st_mtime_ns))
+    h = hashlib.sha1()
+    for name, size, mtime_ns in entries:
+        h.update(f"{name}\0{size}\0{mtime_ns}\n".encode("utf-8"))
+    return {
+        "n_files": len(entries),
+        "max_mtime": max(e[2] for e in entries) / 1e9 if entries else 0.0,
+        "files_hash": h.hexdigest(),
+    }
+
+
+def read_manifest(store_dir: Path = STORE_DIR) -> Optional[dict]:
+    path = Path(store_dir) / MANIFEST_NAME
+    if not path.exists():
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return None
+
+
+def is_fresh(store_dir: Path = STORE_DIR, src_dir: Path = SOURCE_DIR) -> bool:
+    """
+    ストアがソース（銘柄ファイル群）と同期しているか。
+    ingest 時の files_hash（名前・サイズ・mtime_ns の指紋）と一致するかだけを見るので、ファイルは開かない。
+    files_hash の無い古いマニフェストは古いものとして扱う（次の ingest で付く）。
+    """
+    manifest = read_manifest(store_dir)
+    if manifest is None:
+        return False
+    sig = _source_signature(_source_files(src_dir))
+    src = manifest.get("source", {})
+    return sig["n_files"] > 0 and src.get("files_hash") == sig["files_hash"]
+
+
+def _to_table(prices: pd.DataFrame) -> pa.Table:
+    df = prices[PRICE_COLS].copy()
+    df["date"] = pd.to_datetime(df["date"]).astype("datetime64[ns]")
+    df["symbol"] = df["symbol"].astype(str)
+    for c in PRICE_COLS[2:]:
+        df[c] = pd.to_numeric(df[c], errors="coerce").astype("float64")
+    table = pa.Table.from_pandas(df, schema=PRICE_SCHEMA, preserve_index=False)
+    years = pa.array(df["date"].dt.year.to_numpy(dtype="int16"), type=pa.int16())
+    return table.append_column("year", years)
+
+
+def schema_version(schema: pa.Schema) -> Optional[int]:
+    """Parquet スキーマのメタデータから正規化スキーマ版を読む（無ければ None）"""
+    meta = schema.metadata or {}
+    raw = meta.get(SCHEMA_META_KEY)
+    if raw is None:
+        return None
+    try:
+        return int(raw.decode("utf-8"))
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def write_equity_file(df: pd.DataFrame, path: Path) -> Path:
+    """
+    1銘柄分の価格を正規化スキーマ（PRICE_SCHEMA + SCHEMA_VERSION）で書く。
+    turnover は close * volume で作り直す。一時ファイル経由で差し替える。
+    """
+    path = Path(path)
+    df = df.copy()
+    if "adj_close" not in df.columns:
+        df["adj_close"] = df["close"]
+    if "volume" not in df.columns:
+        df["volume"] = np.nan
+    df["turnover"] = pd.to_numeric(df["close"], errors="coerce") * pd.to_numeric(df["volume"], errors="coerce")
+    df = df.sort_values("date")
+
+    table = _to_table(df).drop(["year"])
+    table = table.replace_schema_metadata({SCHEMA_META_KEY: str(SCHEMA_VERSION).encode("utf-8")})
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    pq.write_table(table, tmp)
+    tmp.replace(path)
+    return path
+
+
+def migrate_equity_files(src_dir: Path = SOURCE_DIR) -> int:
+    """
+    SCHEMA_VERSION の付いていない銘柄ファイルを修復して正規化スキーマで書き直す。
+    戻り値: 書き直したファイル数（既に最新版のファイルは開くだけで読まない）
+    """
+    from data_loader import _repair_equity_frame
+
+    n = 0
+    for f in _source_files(src_dir):
+        if schema_version(pq.read_schema(f)) == SCHEMA_VERSION:
+            continue
+        write_equity_file(_repair_equity_frame(pd.read_parquet(f), f), f)
+        n += 1
+    return n
+
+
+def write_price_store(prices: pd.DataFrame, store_dir: Path = STORE_DIR, source: Optional[dict] = None) -> Path:
+    """
+    長い形式の価格 DataFrame を年パーティションのデータセットとして書き出す。
+    一時ディレクトリに書いてから差し替えるので、途中で落ちても既存ストアは壊れない。
+    """
+    store_dir = Path(store_dir)
+    tmp_dir = store_dir.with_name(store_dir.name + ".tmp")
+    if tmp_dir.exists():
+        shutil.rmtree(tmp_dir)
+
+    table = _to_table(prices.sort_values(["date", "symbol"]))
+    ds.write_dataset(
+        table,
+        tmp_dir,
+        format="parquet",
+        partitioning=_PARTITIONING,
+        basename_template="part-{i}.parquet",
+        existing_data_behavior="overwrite_or_ignore",
+    )
+
+    manifest = {
+        "schema": [f"{f.name}:{f.type}" for f in PRICE_SCHEMA],
+        "n_rows": int(table.num_rows),
+        "n_symbols": int(prices["symbol"].nunique()),
+        "date_min": str(pd.to_datetime(prices["date"]).min().date()) if len(prices) else None,
+        "date_max": str(pd.to_datetime(prices["date"]).max().date()) if len(prices) else None,
+        "built_at": time.time(),
+        "source": source or {},
+    }
+    with open(tmp_dir / MANIFEST_NAME, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    if store_dir.exists():
+        shutil.rmtree(store_dir)
+    tmp_dir.rename(store_dir)
+    return store_dir
+
+
+def ingest_prices(
+    src_dir: Path = SOURCE_DIR,
+    store_dir: Path = STORE_DIR,
+    migrate: bool = True,
+    build_panel: bool = True,
+) -> Path:
+    """
+    data/raw/equities/*.parquet を読み込んでストアを作り直す。
+    migrate=True なら先に旧形式の銘柄ファイルを正規化スキーマへ書き直す。
+    build_panel=True なら読み込んだ価格から price_panel（日付×銘柄の memmap）も作り直す。
+    """
+    from data_loader import _read_equity_file
+
+    files = _source_files(src_dir)
+    if not files:
+        raise FileNotFoundError(f"no parquet files found under {src_dir}.")
+    if migrate:
+        n = migrate_equity_files(src_dir)
+        if n:
+            print(f"[price_store] migrated {n} files to schema v{SCHEMA_VERSION}")
+
+    # stat は読み込み前に取る（読み込み中の更新は次回 ingest 対象にする）
+    signature = _source_signature(files)
+    prices = pd.concat([_read_equity_file(f) for f in files], ignore_index=True)
+    out = write_price_store(prices, store_dir, source={"dir": str(src_dir), **signature})
+    if build_panel:
+        from price_panel import build_price_panel
+
+        build_price_panel(prices=prices, store_manifest=read_manifest(out))
+    return out
+
+
+def load_price_store(
+    columns: Optional[Iterable[str]] = None,
+    *,
+    start=None,
+    end=None,
+    symbols: Optional[Iterable[str]] = None,
+    store_dir: Path = STORE_DIR,
+) -> pd.DataFrame:
+    """
+    ストアを1回の dataset スキャンで読み込む。
+
+    Parameters
+    ----------
+    columns : 読み込む列（None なら PRICE_COLS 全部）。date / symbol は常に含める
+    start, end : 日付範囲（両端含む）。年パーティションと行グループ統計で読み飛ばす
+    symbols : 銘柄の絞り込み
+    """
+    store_dir = Path(store_dir)
+    if read_manifest(store_dir) is None:
+        raise FileNotFoundError(f"price store not found: {store_dir}（python scripts/price_store.py で作成）")
+
+    cols = list(columns) if columns is not None else list(PRICE_COLS)
+    for key in ("symbol", "date"):
+        if key not in cols:
+            cols.insert(0, key)
+
+    dataset = ds.dataset(store_dir, format="parquet", partitioning=_PARTITIONING)
+
+    flt = None
+    if start is not None:
+        start = pd.Timestamp(start)
+        flt = (ds.field("year") >= start.year) & (ds.field("date") >= pa.scalar(start, type=pa.timestamp("ns")))
+    if end is not None:
+        end = pd.Timestamp(end)
+        f_end = (ds.field("year") <= end.year) & (ds.field("date") <= pa.scalar(end, type=pa.timestamp("ns")))
+        flt = f_end if flt is None else (flt & f_end)
+    if symbols is not None:
+        f_sym = ds.field("symbol").isin(list(symbols))
+        flt = f_sym if flt is None else (flt & f_sym)
+
+    table = dataset.to_table(columns=cols, filter=flt)
+    df = table.to_pandas()
+    return df.sort_values(["symbol", "date"]).reset_index(drop=True)[cols]
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Ingest per-symbol price parquet files into a partitioned price store.")
+    p.add_argument("--src", type=str, default=str(SOURCE_DIR), help="per-symbol parquet directory")
+    p.add_argument("--out", type=str, default=str(STORE_DIR), help="output dataset directory")
+    p.add_argument("--migrate-only", action="store_true", help="銘柄ファイルの正規化だけ行い、ストアは作らない")
+    p.add_argument("--no-panel", action="store_true", help="price_panel（日付×銘柄の memmap）を作り直さない")
+    return p.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    t0 = time.time()
+    if args.migrate_only:
+        n = migrate_equity_files(Path(args.src))
+        print(f"[price_store] migrated {n} files to schema v{SCHEMA_VERSION} in {time.time() - t0:.2f}s")
+        return
+    out = ingest_prices(Path(args.src), Path(args.out), build_panel=not args.no_panel)
+    manifest = read_manifest(out) or {}
+    print(f"[price_store] wrote {out} rows={manifest.get('n_rows')} symbols={manifest.get('n_symbols')} "
+          f"({manifest.get('date_min')} → {manifest.get('date_max')}) in {time.time() - t0:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
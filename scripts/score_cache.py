@@ -0,0 +1,309 @@
+"""
+score_cache.py
+
+[役割]
+- feature store のパーティション（年月）ごとに score 列をキャッシュする
+  - キー = パーティションの content_hash ＋ Variant 設定の正規化ハッシュ（variant_hash）
+    （Variant 名ではなく設定の中身で決まるので、名前が違っても同じ設定なら共有する）
+  - スコアは日付ごとのクロスセクションなので、月単位で計算しても全期間で計算した値と同じ
+- 複数プロセスから同時に呼んでも、同じキーはロックを取って1回だけ計算する
+- ディスク上の合計サイズが max_bytes を超えたら、最後に使った時刻（mtime）が古いものから消す（LRU）
+
+[レイアウト]
+  data/interim/score_cache/
+    <key>.npy      # パーティションの行順の float64
+    <key>.npy.tmp  # 書き込み中
+    <key>.lock     # 計算中のロック（空ファイル。evict では消さない）
+
+使い方:
+    scores = score_cache.load_scores(["z_downcombo"], start="2020-01-01")
+    # → date, symbol, score_z_downcombo
+    scores = score_cache.load_scores({"z_downcombo_l7": {**SCORING_VARIANTS["z_downcombo"], "lambda_vol_down": 0.7}})
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import sys
+from contextlib import ExitStack, contextmanager
+from dataclasses import asdict, is_dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Mapping, Optional, Union
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+try:
+    import fcntl
+except ImportError:  # Windows ではロック無し（同じキーを複数プロセスが計算することがある）
+    fcntl = None
+
+# プロジェクトルートをパスに追加（core パッケージ）
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+from core.scoring_engine import (  # noqa: E402
+    SCORING_VARIANTS,
+    ScoringVariantConfig,
+    compile_variant,
+    score_variants,
+)
+import build_features  # noqa: E402
+import feature_engine  # noqa: E402
+import feature_store  # noqa: E402
+import group_codes  # noqa: E402
+
+SCORE_CACHE_DIR = Path("data/interim/score_cache")
+CACHE_MAX_BYTES = 512 * 1024 * 1024
+# スコア計算のロジックを変えたら上げる（古いキャッシュを使わないように）
+CACHE_VERSION = 1
+
+VariantSpec = Union[Iterable[str], Mapping[str, Union[ScoringVariantConfig, dict]]]
+
+
+def variant_hash(
+    cfg: ScoringVariantConfig | dict,
+    *,
+    base_col: str = build_features.SCORE_BASE_COL,
+    group_cols: Iterable[str] = build_features.SCORE_GROUP_COLS,
+    ascending: bool = build_features.SCORE_ASCENDING,
+) -> str:
+    """Variant 設定（type・clip・lambda・参照列など）＋ base_col / group_cols / 順位の向き の正規化ハッシュ"""
+    cfg_dict = asdict(cfg) if is_dataclass(cfg) else dict(cfg)
+    # dataclass の未使用フィールド（None）と dict の未指定キーを同じ扱いにする
+    cfg_dict = {k: v for k, v in cfg_dict.items() if v is not None}
+    payload = {
+        "version": CACHE_VERSION,
+        "cfg": cfg_dict,
+        "base_col": base_col,
+        "group_cols": list(group_cols),
+        "ascending": bool(ascending),
+    }
+    return hashlib.sha1(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def _check_columns(specs: dict, store_columns: List[str]) -> None:
+    """
+    Variant が参照する列（vol_col など）が store に無いと、その項が 0 扱いの別物のスコアになるのでエラーにする
+    （build_features.py --variants で一部の Variant だけ作った store など）
+    """
+    available = set(store_columns)
+    for name, cfg in specs.items():
+        cfg_dict = asdict(cfg) if is_dataclass(cfg) else cfg
+        missing = [cfg_dict[k] for k in feature_engine.VARIANT_COLUMN_KEYS
+                   if cfg_dict.get(k) and cfg_dict[k] not in available]
+        if missing:
+            raise KeyError(
+                f"Variant {name} の参照列が feature store にありません: {missing}"
+                "（build_features.py --full で全 Variant 分を作り直してください）"
+            )
+
+
+def _resolve_variants(variants: Optional[VariantSpec]) -> Dict[str, Union[ScoringVariantConfig, dict]]:
+    if variants is None:
+        return dict(SCORING_VARIANTS)
+    if isinstance(variants, Mapping):
+        return dict(variants)
+    names = list(variants)
+    unknown = [v for v in names if v not in SCORING_VARIANTS]
+    if unknown:
+        raise KeyError(f"未知のスコアリング Variant: {unknown}")
+    return {v: SCORING_VARIANTS[v] for v in names}
+
+
+class ScoreCache:
+    """
+    パーティション単位の score キャッシュ。last_stats に直近の load でキャッシュから読んだもの／計算したものが入る。
+    """
+
+    def __init__(
+        self,
+        cache_dir: Path = SCORE_CACHE_DIR,
+        max_bytes: int = CACHE_MAX_BYTES,
+        feature_dir: Path = feature_store.FEATURE_DIR,
+    ) -> None:
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.feature_dir = Path(feature_dir)
+        self.last_stats: Dict[str, List[str]] = {"cached": [], "computed": []}
+
+    # ---- キャッシュ ---- #
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.npy"
+
+    def _load(self, key: str, n: int) -> Optional[np.ndarray]:
+        path = self._path(key)
+        if not path.exists():
+            return None
+        try:
+            arr = np.load(path)
+        except Exception:
+            return None
+        if arr.shape != (n,):
+            return None
+        path.touch()  # 最近使ったものを残す
+        return arr
+
+    def _store(self, key: str, arr: np.ndarray) -> None:
+        path = self._path(key)
+        try:
+            # 一時ファイルは evict の *.npy に入らない名前にする（書きかけを消さない）
+            tmp = path.with_name(path.name + ".tmp")
+            with open(tmp, "wb") as f:
+                np.save(f, arr)
+            tmp.replace(path)
+        except OSError as e:
+            print(f"[score_cache] 警告: キャッシュ保存に失敗 ({key}): {e}")
+
+    @contextmanager
+    def _lock(self, key: str):
+        """同じキーを計算するプロセスを1つにする（fcntl が無ければロック無し）"""
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        if fcntl is None:
+            yield
+            return
+        lock_path = self.cache_dir / f"{key}.lock"
+        with open(lock_path, "w") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def evict(self) -> None:
+        """
+        合計サイズが max_bytes 以下になるまで、mtime の古いものから消す。
+        .lock は消さない（他のプロセスが持っているロックのファイルを消すと、
+        次に来たプロセスが別のファイルでロックを取れてしまい、1回だけの計算にならない）
+        """
+        if not self.cache_dir.exists():
+            return
+        files = []
+        for p in self.cache_dir.glob("*.npy"):
+            try:
+                st = p.stat()
+            except FileNotFoundError:
+                continue
+            files.append((st.st_mtime, st.st_size, p))
+        total = sum(size for _, size, _ in files)
+        for _, size, p in sorted(files, key=lambda t: t[0]):
+            if total <= self.max_bytes:
+                break
+            p.unlink(missing_ok=True)
+            total -= size
+
+    # ---- 計算 ---- #
+    @staticmethod
+    def _key(part: dict, vhash: str) -> str:
+        return hashlib.sha1(f"{part['content_hash']}:{vhash}".encode("utf-8")).hexdigest()
+
+    def _score_partition(self, part: dict, specs: dict, hashes: Dict[str, str], store_columns: List[str]) -> Dict[str, np.ndarray]:
+        """1パーティションの score（キャッシュに無い Variant だけ、まとめて1回計算する）"""
+        n = int(part["n_rows"])
+        keys = {name: self._key(part, hashes[name]) for name in specs}
+        out: Dict[str, np.ndarray] = {}
+        for name, key in keys.items():
+            arr = self._load(key, n)
+            if arr is not None:
+                out[name] = arr
+                self.last_stats["cached"].append(f"{name}:{part['month']}")
+        todo = [name for name in specs if name not in out]
+        if not todo:
+            return out
+
+        with ExitStack() as stack:
+            # キーの順にロックを取る（デッドロックしない）。待っている間に他のプロセスが書いたものはそれを使う
+            for name in sorted(todo, key=keys.get):
+                stack.enter_context(self._lock(keys[name]))
+            for name in list(todo):
+                arr = self._load(keys[name], n)
+                if arr is not None:
+                    out[name] = arr
+                    todo.remove(name)
+                    self.last_stats["cached"].append(f"{name}:{part['month']}")
+            if not todo:
+                return out
+
+            group_cols = build_features.SCORE_GROUP_COLS
+            cols = ["date", *group_cols]
+            for name in todo:
+                plan = compile_variant(
+                    name, specs[name],
+                    base_col=build_features.SCORE_BASE_COL,
+                    ascending=build_features.SCORE_ASCENDING,
+                    columns=store_columns,
+                )
+                cols.extend(plan.columns)
+            code_col = group_codes.GROUP_CODE_COLUMNS.get(tuple(group_cols))
+            if code_col in store_columns:
+                cols.append(code_col)
+            df = pq.read_table(self.feature_dir / part["file"], columns=list(dict.fromkeys(cols))).to_pandas()
+            scores = score_variants(
+                df, {name: specs[name] for name in todo}, build_features.SCORE_BASE_COL,
+                group_cols=group_cols,
+                ascending=build_features.SCORE_ASCENDING,
+                group_codes=group_codes.codes_for(df, group_cols),
+            )
+            for name, arr in scores.items():
+                self._store(keys[name], arr)
+                out[name] = arr
+                self.last_stats["computed"].append(f"{name}:{part['month']}")
+        return out
+
+    def load(self, variants: Optional[VariantSpec] = None, *, start=None, end=None) -> pd.DataFrame:
+        """
+        variants（Variant 名のリスト、または 名前 → 設定 の dict。None なら SCORING_VARIANTS 全部）の
+        score_<name> 列を date, symbol と一緒に返す（行順は feature_store.read_features と同じ）。
+        """
+        specs = _resolve_variants(variants)
+        self.last_stats = {"cached": [], "computed": []}
+        parts = feature_store.partitions(self.feature_dir, start=start, end=end)
+        store_columns = feature_store.columns(self.feature_dir)
+        if not parts:
+            return pd.DataFrame({c: [] for c in ["date", "symbol", *(f"score_{v}" for v in specs)]})
+
+        _check_columns(specs, store_columns)
+        hashes = {name: variant_hash(cfg) for name, cfg in specs.items()}
+        frames = []
+        for part in parts:
+            df = pq.read_table(self.feature_dir / part["file"], columns=["date", "symbol"]).to_pandas()
+            scores = self._score_partition(part, specs, hashes, store_columns)
+            for name in specs:
+                df[f"score_{name}"] = scores[name]
+            if start is not None:
+                df = df[df["date"] >= pd.Timestamp(start)]
+            if end is not None:
+                df = df[df["date"] <= pd.Timestamp(end)]
+            frames.append(df)
+        self.evict()
+        return pd.concat(frames, ignore_index=True)
+
+
+def missing_variants(columns: Optional[Iterable[str]] = None, feature_dir: Path = feature_store.FEATURE_DIR) -> List[str]:
+    """
+    columns（None なら全 Variant の score 列）のうち、feature store に無い score_<Variant> の Variant 名。
+    """
+    available = set(feature_store.columns(feature_dir))
+    wanted = list(columns) if columns is not None else [f"score_{v}" for v in SCORING_VARIANTS]
+    return [
+        c[len("score_"):] for c in wanted
+        if c.startswith("score_") and c not in available and c[len("score_"):] in SCORING_VARIANTS
+    ]
+
+
+_CACHE: Optional[ScoreCache] = None
+
+
+def get_cache() -> ScoreCache:
+    """プロセス共有のキャッシュ（既定のディレクトリ）"""
+    global _CACHE
+    if _CACHE is None:
+        _CACHE = ScoreCache()
+    return _CACHE
+
+
+def load_scores(variants: Optional[VariantSpec] = None, *, start=None, end=None) -> pd.DataFrame:
+    """get_cache().load(...) の省略形"""
+    return get_cache().load(variants, start=start, end=end)
@@ -15,6 +15,8 @@ import numpy as np
 import pandas as pd
 
 SizeBucket = Literal["Large", "Mid", "Small"]
+# size_bucket 列は category（この順 = 出力の並び順）
+SIZE_BUCKET_DTYPE = pd.CategoricalDtype(["Large", "Mid", "Small"])
 
 
 @dataclass
@@ -63,7 +65,7 @@ def _cross_sectional_zscore(df: pd.DataFrame, col: str, group_cols: List[str]) -
             return pd.Series(0.0, index=x.index)
         return (x - x.mean()) / x.std(ddof=0)
 
-    return df.groupby(group_cols)[col].transform(_z)
+    return df.groupby(group_cols, observed=True)[col].transform(_z)
 
 
 def assign_size_bucket(
@@ -97,8 +99,9 @@ def assign_size_bucket(
         return bucket
 
     df[config.size_bucket_col] = (
-        df.groupby(config.date_col)[config.liquidity_col]
+        df.groupby(config.date_col, observed=True)[config.liquidity_col]
         .transform(_bucket_for_day)
+        .astype(SIZE_BUCKET_DTYPE)
     )
 
     return df
@@ -131,11 +134,11 @@ def build_daily_portfolio(
         if c not in df_features.columns:
             raise KeyError(f"必須カラム {c} がありません。columns={df_features.columns.tolist()}")
 
-    df = df_features.copy()
-
-    # 1. size bucket を付与（まだ無ければ）
-    if config.size_bucket_col not in df.columns:
-        df = assign_size_bucket(df, config)
+    # 1. size bucket を付与（まだ無ければ）。assign_size_bucket はコピーを返すので入力を二重にコピーしない
+    if config.size_bucket_col not in df_features.columns:
+        df = assign_size_bucket(df_features, config)
+    else:
+        df = df_features.copy()
 
     # 2. bucket 内 Z-score
     df["z_score_bucket"] = _cross_sectional_zscore(
@@ -166,7 +169,7 @@ def build_daily_portfolio(
                 g["z_score_bucket"] = (x - mu) / sigma
             return g
 
-        day_df = day_df.groupby(config.size_bucket_col, group_keys=False).apply(z_in_bucket)
+        day_df = day_df.groupby(config.size_bucket_col, group_keys=False, observed=True).apply(z_in_bucket)
 
         # 閾値で「弱いスコア」を切る（動きを出すポイント）
         min_z = config.min_zscore
@@ -226,7 +229,7 @@ def build_daily_portfolio(
 
         return day_df
 
-    df = df.groupby(config.date_col, group_keys=False).apply(_select_for_day)
+    df = df.groupby(config.date_col, group_keys=False, observed=True).apply(_select_for_day)
 
     # 出力カラムを整理
     out_cols = [
@@ -0,0 +1,326 @@
+"""
+trading_calendar.py
+
+[役割]
+- JPX（東証）の営業日カレンダーを1回だけ作り、全ステージで共有する
+  - 観測済み期間: TOPIX 日足（data/processed/index_tpx_daily.parquet）の日付をそのまま営業日とする
+  - それ以外（観測前・将来）: 平日から祝日（内閣府の規則）と年末年始（12/31〜1/3）を除く
+- 営業日に 0,1,2,... の通し番号（ordinal）を振り、暦日→ordinal の配列を持つことで
+  次／前の営業日・k 営業日先・営業日判定を O(1)（配列参照）で返す
+- SQ 日（毎月第2金曜、休業日なら前営業日）と祝日フラグ
+
+[保存先]
+  data/calendar/jpx_sessions.parquet   # date, ordinal, is_sq, is_major_sq, observed
+
+使い方:
+  python scripts/trading_calendar.py        # カレンダーを作って保存
+  >>> from trading_calendar import get_calendar
+  >>> cal = get_calendar()
+  >>> cal.offset("2025-12-30", 1)            # 1営業日先（年末年始を飛ばす）
+"""
+from __future__ import annotations
+
+import datetime as dt
+from functools import lru_cache
+from pathlib import Path
+from typing import Iterable, List, Optional, Set
+
+import numpy as np
+import pandas as pd
+
+CALENDAR_DIR = Path("data/calendar")
+CALENDAR_PATH = CALENDAR_DIR / "jpx_sessions.parquet"
+TPX_PATH = Path("data/processed/index_tpx_daily.parquet")
+
+# 規則ベースで作る範囲（観測期間の前後）
+RULE_START = dt.date(2000, 1, 1)
+FUTURE_YEARS = 3
+
+MAJOR_SQ_MONTHS = (3, 6, 9, 12)
+
+_DAY = np.timedelta64(1, "D")
+
+
+# -------------------- 祝日（規則ベース） -------------------- #
+def _nth_weekday(year: int, month: int, weekday: int, n: int) -> dt.date:
+    """year/month の第 n weekday（月曜=0）"""
+    first = dt.date(year, month, 1)
+    return first + dt.timedelta(days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+
+
+def _equinox_days(year: int) -> tuple:
+    """春分日・秋分日（1980〜2099 の近似式）"""
+    k = year - 1980
+    spring = int(20.8431 + 0.242194 * k - k // 4)
+    autumn = int(23.2488 + 0.242194 * k - k // 4)
+    return dt.date(year, 3, spring), dt.date(year, 9, autumn)
+
+
+def jp_holidays(year: int) -> Set[dt.date]:
+    """
+    国民の祝日（振替休日・国民の休日を含む）。2000年以降の規則で計算する。
+    """
+    d = dt.date
+    hol = {d(year, 1, 1), d(year, 2, 11), d(year, 4, 29), d(year, 5, 3), d(year, 5, 5), d(year, 11, 3), d(year, 11, 23)}
+    hol.add(_nth_weekday(year, 1, 0, 2))  # 成人の日
+    spring, autumn = _equinox_days(year)
+    hol |= {spring, autumn}
+    if year >= 2020:
+        hol.add(d(year, 2, 23))  # 天皇誕生日
+    elif 1989 <= year <= 2018:
+        hol.add(d(year, 12, 23))
+    if year >= 2007:
+        hol.add(d(year, 5, 4))  # みどりの日
+
+    # 海の日・スポーツの日・山の日（2020/2021 は五輪で移動）
+    if year == 2020:
+        hol |= {d(2020, 7, 23), d(2020, 7, 24), d(2020, 8, 10)}
+    elif year == 2021:
+        hol |= {d(2021, 7, 22), d(2021, 7, 23), d(2021, 8, 9)}  # 8/8 は日曜 → 8/9 振替
+    else:
+        hol.add(_nth_weekday(year, 7, 0, 3) if year >= 2003 else d(year, 7, 20))
+        hol.add(_nth_weekday(year, 10, 0, 2))
+        if year >= 2016:
+            hol.add(d(year, 8, 11))
+    hol.add(_nth_weekday(year, 9, 0, 3) if year >= 2003 else d(year, 9, 15))  # 敬老の日
+
+    if year == 2019:  # 改元
+        hol |= {d(2019, 4, 30), d(2019, 5, 1), d(2019, 5, 2), d(2019, 10, 22)}
+
+    # 振替休日: 日曜の祝日 → 次の祝日でない日
+    for h in sorted(hol):
+        if h.weekday() == 6:
+            sub = h + dt.timedelta(days=1)
+            while sub in hol:
+                sub += dt.timedelta(days=1)
+            hol.add(sub)
+    # 国民の休日: 祝日に挟まれた平日
+    for h in sorted(hol):
+        mid = h + dt.timedelta(days=1)
+        if mid not in hol and (h + dt.timedelta(days=2)) in hol and mid.weekday() < 6:
+            hol.add(mid)
+    return hol
+
+
+def exchange_holidays(year: int) -> Set[dt.date]:
+    """東証の休業日（祝日＋年末年始 12/31, 1/2, 1/3）"""
+    return jp_holidays(year) | {dt.date(year, 12, 31), dt.date(year, 1, 2), dt.date(year, 1, 3)}
+
+
+def rule_sessions(start: dt.date, end: dt.date) -> pd.DatetimeIndex:
+    """規則ベースの営業日（平日 − 休業日）"""
+    days = pd.bdate_range(start, end)
+    closed: Set[dt.date] = set()
+    for y in range(start.year, end.year + 1):
+        closed |= exchange_holidays(y)
+    keep = ~np.isin(days.date, np.array(sorted(closed), dtype=object))
+    return days[keep]
+
+
+# -------------------- カレンダー本体 -------------------- #
+class TradingCalendar:
+    """
+    営業日カレンダー。sessions は昇順の DatetimeIndex（時刻なし）。
+
+    内部に「暦日 → その日以前で最後の営業日の ordinal」の配列を持ち、
+    営業日判定・前後の営業日・k 営業日先を配列参照で返す。範囲外の日付は ValueError。
+    """
+
+    def __init__(self, sessions: Iterable, observed_until: Optional[pd.Timestamp] = None) -> None:
+        self.sessions = pd.DatetimeIndex(pd.to_datetime(list(sessions))).normalize().unique().sort_values()
+        if len(self.sessions) == 0:
+            raise ValueError("sessions が空です")
+        self.observed_until = observed_until
+
+        days = self.sessions.values.astype("datetime64[D]")
+        self._day0 = days[0]
+        span = int((days[-1] - days[0]) / _DAY) + 1
+        offsets = ((days - self._day0) / _DAY).astype(np.int64)
+
+        is_session = np.zeros(span, dtype=bool)
+        is_session[offsets] = True
+        # その日以前で最後の営業日の ordinal
+        last_le = np.full(span, -1, dtype=np.int64)
+        last_le[offsets] = np.arange(len(offsets))
+        self._last_le = np.maximum.accumulate(last_le)
+        self._is_session = is_session
+
+        self.is_sq, self.is_major_sq = self._sq_flags()
+
+    # ---- 内部 ---- #
+    def _day_index(self, dates) -> np.ndarray:
+        d = np.asarray(pd.DatetimeIndex(pd.to_datetime(dates)).values.astype("datetime64[D]"))
+        idx = ((d - self._day0) / _DAY).astype(np.int64)
+        if len(idx) and (idx.min() < 0 or idx.max() >= len(self._is_session)):
+            raise ValueError(
+                f"カレンダー範囲外の日付があります（{self.sessions[0].date()} 〜 {self.sessions[-1].date()}）"
+            )
+        return idx
+
+    def _sq_flags(self) -> tuple:
+        """第2金曜（休業日なら直前の営業日）を SQ とする"""
+        is_sq = np.zeros(len(self.sessions), dtype=bool)
+        is_major = np.zeros(len(self.sessions), dtype=bool)
+        first, last = self.sessions[0], self.sessions[-1]
+        for p in pd.period_range(first, last, freq="M"):
+            fri = pd.Timestamp(_nth_weekday(p.year, p.month, 4, 2))
+            if fri < first or fri > last:
+                continue
+            o = int(self._last_le[self._day_index([fri])[0]])
+            if o < 0:
+                continue
+            is_sq[o] = True
+            if p.month in MAJOR_SQ_MONTHS:
+                is_major[o] = True
+        return is_sq, is_major
+
+    # ---- ベクトル版 ---- #
+    def ordinals(self, dates) -> np.ndarray:
+        """営業日の ordinal（営業日でない日は -1）"""
+        idx = self._day_index(dates)
+        return np.where(self._is_session[idx], self._last_le[idx], -1)
+
+    def rollback_ordinals(self, dates) -> np.ndarray:
+        """その日以前で最後の営業日の ordinal（範囲の先頭より前は -1）"""
+        return self._last_le[self._day_index(dates)]
+
+    def offsets(self, dates, k: int) -> pd.DatetimeIndex:
+        """
+        各日付から k 営業日先（k<0 なら前）の営業日。
+        営業日でない日付は、k>0 なら直前の営業日、k<=0 なら直後の営業日を起点にする
+        （→ offsets(休日, 1) = 次の営業日、offsets(休日, -1) = 前の営業日、offsets(休日, 0) = 次の営業日）。
+        範囲外になる要素は NaT。
+        """
+        idx = self._day_index(dates)
+        base = self._last_le[idx].copy()
+        off = ~self._is_session[idx]
+        if k <= 0:
+            base = np.where(off, base + 1, base)
+        target = base + int(k)
+        ok = (target >= 0) & (target < len(self.sessions)) & (base >= 0)
+        out = np.full(len(idx), np.datetime64("NaT"), dtype="datetime64[ns]")
+        out[ok] = self.sessions.values[target[ok]]
+        return pd.DatetimeIndex(out)
+
+    def next_sessions(self, dates) -> pd.DatetimeIndex:
+        """各日付より後の最初の営業日"""
+        return self.offsets(dates, 1)
+
+    def prev_sessions(self, dates) -> pd.DatetimeIndex:
+        """各日付より前の最後の営業日"""
+        return self.offsets(dates, -1)
+
+    # ---- スカラー版 ---- #
+    def is_session(self, date) -> bool:
+        return bool(self._is_session[self._day_index([date])[0]])
+
+    def ordinal(self, date) -> int:
+        o = int(self.ordinals([date])[0])
+        if o < 0:
+            raise KeyError(f"{pd.Timestamp(date).date()} は営業日ではありません")
+        return o
+
+    def offset(self, date, k: int) -> pd.Timestamp:
+        return self.offsets([date], k)[0]
+
+    def next_session(self, date) -> pd.Timestamp:
+        return self.offset(date, 1)
+
+    def prev_session(self, date) -> pd.Timestamp:
+        return self.offset(date, -1)
+
+    def is_holiday(self, date) -> bool:
+        """平日だが休業日（祝日・年末年始・臨時休場）"""
+        return pd.Timestamp(date).weekday() < 5 and not self.is_session(date)
+
+    def session_is_sq(self, date, major_only: bool = False) -> bool:
+        o = self.ordinal(date)
+        return bool(self.is_major_sq[o] if major_only else self.is_sq[o])
+
+    def sessions_in_range(self, start, end) -> pd.DatetimeIndex:
+        """start〜end（両端含む）の営業日"""
+        i = self._day_index([start])[0]
+        lo = int(self._last_le[i]) + (0 if self._is_session[i] else 1)
+        hi = int(self.rollback_ordinals([end])[0])
+        return self.sessions[lo:hi + 1]
+
+    def sq_dates(self, major_only: bool = False) -> pd.DatetimeIndex:
+        return self.sessions[self.is_major_sq if major_only else self.is_sq]
+
+    def to_frame(self) -> pd.DataFrame:
+        observed = (
+            self.sessions <= self.observed_until
+            if self.observed_until is not None
+            else np.zeros(len(self.sessions), dtype=bool)
+        )
+        return pd.DataFrame({
+            "date": self.sessions,
+            "ordinal": np.arange(len(self.sessions), dtype=np.int32),
+            "is_sq": self.is_sq,
+            "is_major_sq": self.is_major_sq,
+            "observed": observed,
+        })
+
+
+# -------------------- 構築・保存 -------------------- #
+def observed_sessions(tpx_path: Path = TPX_PATH) -> pd.DatetimeIndex:
+    """TOPIX 日足の日付（実際に取引があった日）"""
+    if not Path(tpx_path).exists():
+        return pd.DatetimeIndex([])
+    df = pd.read_parquet(tpx_path, columns=["trade_date"])
+    return pd.DatetimeIndex(pd.to_datetime(df["trade_date"])).normalize().unique().sort_values()
+
+
+def build_calendar(tpx_path: Path = TPX_PATH, future_years: int = FUTURE_YEARS) -> TradingCalendar:
+    """観測済み営業日（TOPIX）＋ 観測範囲外は規則ベースで補ったカレンダーを作る"""
+    obs = observed_sessions(tpx_path)
+    today = dt.date.today()
+    end = dt.date(max(today.year, obs[-1].year if len(obs) else today.year) + future_years, 12, 31)
+    rule = rule_sessions(RULE_START, end)
+    if len(obs) == 0:
+        return TradingCalendar(rule)
+    parts: List[pd.DatetimeIndex] = [rule[rule < obs[0]], obs, rule[rule > obs[-1]]]
+    return TradingCalendar(parts[0].append(parts[1]).append(parts[2]), observed_until=obs[-1])
+
+
+def save_calendar(cal: TradingCalendar, path: Path = CALENDAR_PATH) -> Path:
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    cal.to_frame().to_parquet(path, index=False)
+    return path
+
+
+def load_calendar(path: Path = CALENDAR_PATH, tpx_path: Path = TPX_PATH) -> TradingCalendar:
+    """
+    保存済みカレンダーを読む。無い／TOPIX 日足の方が新しい場合は作り直して保存する。
+    """
+    path = Path(path)
+    if path.exists() and (not Path(tpx_path).exists() or path.stat().st_mtime >= Path(tpx_path).stat().st_mtime):
+        df = pd.read_parquet(path)
+        obs = df.loc[df["observed"], "date"]
+        return TradingCalendar(df["date"], observed_until=obs.max() if len(obs) else None)
+    cal = build_calendar(tpx_path)
+    try:
+        save_calendar(cal, path)
+    except OSError as e:
+        print(f"[trading_calendar] 警告: カレンダー保存に失敗: {e}")
+    return cal
+
+
+@lru_cache(maxsize=1)
+def get_calendar() -> TradingCalendar:
+    """プロセス共有のカレンダー（初回のみ読み込み）"""
+    return load_calendar()
+
+
+def main() -> None:
+    cal = build_calendar()
+    out = save_calendar(cal)
+    print(f"[trading_calendar] wrote {out}: {len(cal.sessions)} sessions "
+          f"({cal.sessions[0].date()} → {cal.sessions[-1].date()}, observed until "
+          f"{cal.observed_until.date() if cal.observed_until is not None else None})")
+    print(f"[trading_calendar] SQ: {int(cal.is_sq.sum())} (major {int(cal.is_major_sq.sum())})")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,9 @@ import argparse, sys, os, json, math, logging, datetime as dt
 from pathlib import Path
 import pandas as pd
 import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
 from typing import Optional, List, Dict
 
 
@@ -28,6 +31,8 @@ def parse_args():
     ap.add_argument("--asof", default=None)       # 例: 2025-09-30 / today
     ap.add_argument("--lookback", type=int, default=None)
     ap.add_argument("--top_ratio", type=float, default=None)
+    ap.add_argument("--history", action="store_true",
+                    help="全日付のポイントインタイム・ユニバース（メンバーシップのビットマップ）を作る")
     return ap.parse_args()
 
 def _resolve_asof(asof_opt: Optional[str]):
@@ -44,45 +49,151 @@ def load_listings(csv_path: str) -> pd.DataFrame:
         raise ValueError(f"listings missing columns: {missing}")
     return df
 
+PRICE_WINDOW_COLS = ["date", "close", "volume"]
+
+
+def _sessions_before(end: pd.Timestamp, n: int) -> pd.Timestamp:
+    """end から n 営業日前（JPX カレンダー。範囲外なら BDay で近似）"""
+    from trading_calendar import get_calendar
+    try:
+        start = get_calendar().offset(end, -n)
+    except ValueError:
+        start = pd.NaT
+    if pd.isna(start):
+        start = end - pd.tseries.offsets.BDay(n)
+    return start
+
+
+def _window_pad(lookback: int) -> int:
+    """ローカル価格を読む窓の長さ（lookback の20%増し、営業日）"""
+    return int(math.ceil(lookback * 1.2))
+
+
+def _window_starts(ends, lookback: int) -> pd.DatetimeIndex:
+    """各 asof について load_prices_local が読む窓の始点（_sessions_before のベクトル版）"""
+    from trading_calendar import get_calendar
+    ends = pd.DatetimeIndex(ends)
+    pad = _window_pad(lookback)
+    try:
+        starts = get_calendar().offsets(ends, -pad).to_numpy()
+    except ValueError:
+        return pd.DatetimeIndex([_sessions_before(e, pad) for e in ends])
+    for i in np.flatnonzero(pd.isna(starts)):
+        starts[i] = (ends[i] - pd.tseries.offsets.BDay(pad)).to_datetime64()
+    return pd.DatetimeIndex(starts)
+
+
+def build_price_file_index(prices_dir: str) -> Dict[str, Path]:
+    """
+    prices_dir を1回だけ走査して ticker → ファイル の索引を作る。
+    優先順: {ticker}.parquet > {ticker}.csv > prices_{ticker}.parquet > prices_{ticker}.*
+    """
+    rank: Dict[str, tuple] = {}
+    index: Dict[str, Path] = {}
+    try:
+        entries = list(os.scandir(prices_dir))
+    except FileNotFoundError:
+        return index
+    for e in entries:
+        if not e.is_file():
+            continue
+        stem, dot, ext = e.name.rpartition(".")
+        if not dot:
+            continue
+        if stem.startswith("prices_"):
+            t, r = stem[len("prices_"):], (2 if ext == "parquet" else 3)
+        elif ext in ("parquet", "csv"):
+            t, r = stem, (0 if ext == "parquet" else 1)
+        else:
+            continue
+        key = (r, e.name)
+        if t not in rank or key < rank[t]:
+            rank[t] = key
+            index[t] = Path(e.path)
+    return index
+
+
+def _read_price_window(path: Path, start: Optional[pd.Timestamp], end: Optional[pd.Timestamp]) -> pd.DataFrame:
+    """
+    1ファイルから date/close/volume の3列だけを読む。
+    parquet で date が timestamp 型なら日付範囲も行グループ単位で読み飛ばす（述語プッシュダウン）。
+    start / end が None ならその側は絞らない。
+    """
+    if path.suffix == ".parquet":
+        schema = pq.read_schema(path)
+        if not set(PRICE_WINDOW_COLS) <= set(schema.names):
+            return pd.read_parquet(path)  # 列名が旧形式のファイルは全体を読む
+        filters = []
+        if pa.types.is_timestamp(schema.field("date").type):
+            date_type = schema.field("date").type
+            if start is not None:
+                filters.append(("date", ">=", pa.scalar(start, type=date_type)))
+            if end is not None:
+                filters.append(("date", "<=", pa.scalar(end, type=date_type)))
+        filters = filters or None
+        return pq.read_table(path, columns=PRICE_WINDOW_COLS, filters=filters).to_pandas()
+
+    try:
+        table = pacsv.read_csv(
+            path,
+            convert_options=pacsv.ConvertOptions(
+                include_columns=PRICE_WINDOW_COLS,
+                column_types={"date": pa.string()},
+            ),
+        )
+        return table.to_pandas()
+    except (pa.ArrowInvalid, KeyError):
+        return pd.read_csv(path)
+
+
 def load_prices_local(prices_dir: str, tickers: List[str], asof: str, lookback: int) -> Dict[str, pd.DataFrame]:
-    from glob import glob
     out = {}
     end = pd.to_datetime(asof)
     # 余裕を持って読む（lookbackの20%増し）→整数に丸める
-    pad = int(math.ceil(lookback * 1.2))
-    start = end - pd.tseries.offsets.BDay(pad)
+    start = _sessions_before(end, _window_pad(lookback))
+    index = build_price_file_index(prices_dir)
     for t in tickers:
-        # 優先: {ticker}.parquet / {ticker}.csv
-        p_parq = Path(prices_dir)/f"{t}.parquet"
-        p_csv  = Path(prices_dir)/f"{t}.csv"
-
-        df = None
-        if p_parq.exists():
-            df = pd.read_parquet(p_parq)
-        elif p_csv.exists():
-            df = pd.read_csv(p_csv)
-        else:
-            # フォールバック: prices_{ticker}.*
-            g = glob(str(Path(prices_dir)/f"prices_{t}.*"))
-            if g:
-                p = Path(g[0])
-                df = pd.read_parquet(p) if p.suffix==".parquet" else pd.read_csv(p)
+        p = index.get(t)
+        if p is None:
+            continue
+
+        out[t] = clip_price_window(_read_price_window(p, start, end), start, end)
+    return out
+
+def clip_price_window(df: pd.DataFrame, start: pd.Timestamp, end: pd.Timestamp) -> pd.DataFrame:
+    """start〜end（両端含む）の date/close/volume 行だけにする（load_prices_local の窓）"""
+    dates = pd.to_datetime(df["date"])
+    mask = (dates<=end) & (dates>=start)
+    df = df.loc[mask, ["date","close","volume"]].dropna()
+    df["date"] = dates[mask]
+    # 返却直前: 型を整える
+    df["close"] = pd.to_numeric(df.get("close"), errors="coerce")
+    df["volume"] = pd.to_numeric(df.get("volume"), errors="coerce")
+    return df
 
-        if df is None:
+def load_price_history_local(prices_dir: str, tickers: List[str], end: Optional[str] = None) -> Dict[str, pd.DataFrame]:
+    """ユニバース履歴用: 各銘柄の date/close/volume を全期間（end まで）読む"""
+    out = {}
+    end_ts = pd.to_datetime(end) if end else None
+    index = build_price_file_index(prices_dir)
+    for t in tickers:
+        p = index.get(t)
+        if p is None:
             continue
-        df["date"] = pd.to_datetime(df["date"])
-        mask = (df["date"]<=end) & (df["date"]>=start)
-        df = df.loc[mask, ["date","close","volume"]].dropna()
-        # 返却直前: 型を整える
-        df["close"] = pd.to_numeric(df.get("close"), errors="coerce")
-        df["volume"] = pd.to_numeric(df.get("volume"), errors="coerce")
-        out[t] = df
+        df = _read_price_window(p, None, end_ts)
+        df["date"] = pd.to_datetime(df["date"], errors="coerce")
+        if end_ts is not None:
+            df = df[df["date"] <= end_ts]
+        df = df.loc[:, ["date", "close", "volume"]].dropna()
+        df["close"] = pd.to_numeric(df["close"], errors="coerce")
+        df["volume"] = pd.to_numeric(df["volume"], errors="coerce")
+        out[t] = df.dropna()
     return out
 
 def load_prices_yf(tickers: List[str], asof: str, lookback: int) -> Dict[str, pd.DataFrame]:
     import yfinance as yf
     end = pd.to_datetime(asof) + pd.Timedelta(days=1)
-    start = end - pd.tseries.offsets.BDay(int(math.ceil(lookback * 2)))
+    start = _sessions_before(end, int(math.ceil(lookback * 2)))
     out: Dict[str, pd.DataFrame] = {}
 
     for t in tickers:
@@ -172,6 +283,85 @@ def compute_liquidity(df: pd.DataFrame, lookback: int) -> float:
 
     return float(np.nanmean(turn.values))
 
+def compute_liquidity_all(prices: Dict[str, pd.DataFrame], lookback: int) -> pd.Series:
+    """
+    全銘柄の平均売買代金（直近 lookback 本の close*volume の平均）を1回のグループ集計で求める。
+    compute_liquidity を銘柄ごとに呼ぶのと同じ値（行数が lookback//2 未満の銘柄は除外、
+    値が NaN / 0 以下の銘柄も除外）。戻り値: index=ticker の Series（ticker 昇順）
+    """
+    frames = {t: df for t, df in prices.items()
+              if isinstance(df, pd.DataFrame) and {"date", "close", "volume"} <= set(df.columns)}
+    if not frames:
+        return pd.Series(dtype="float64", name="avg_turnover")
+
+    long = pd.concat(
+        [df[["date", "close", "volume"]] for df in frames.values()],
+        keys=list(frames), names=["ticker", None],
+    ).reset_index(level=0)
+    long = long.sort_values(["ticker", "date"], kind="mergesort")
+
+    g = long.groupby("ticker", sort=True)
+    n_rows = g.size()
+    # 銘柄ごとの後ろ N 本
+    tail = long[g.cumcount(ascending=False).to_numpy() < lookback]
+    turn = pd.to_numeric(tail["close"], errors="coerce") * pd.to_numeric(tail["volume"], errors="coerce")
+    liq = turn.groupby(tail["ticker"].to_numpy(), sort=True).mean()  # NaN は除いて平均（全部 NaN なら NaN）
+
+    liq = liq[n_rows.reindex(liq.index) >= lookback // 2]
+    liq = liq[liq.notna() & (liq > 0)]
+    liq.name = "avg_turnover"
+    liq.index.name = "ticker"
+    return liq
+
+
+def select_top_liquidity(liq: pd.Series, top_ratio: float) -> pd.DataFrame:
+    """
+    平均売買代金の上位 ceil(N*top_ratio) 銘柄を argpartition で選び、降順に並べて返す。
+    （同値は ticker 昇順）
+    """
+    n = len(liq)
+    k = max(1, int(math.ceil(n * top_ratio)))
+    values = liq.to_numpy(dtype="float64")
+    tickers = liq.index.to_numpy()
+    if k < n:
+        idx = np.argpartition(-values, k - 1)[:k]
+    else:
+        idx = np.arange(n)
+    order = idx[np.lexsort((tickers[idx], -values[idx]))]
+    uni = pd.DataFrame({"ticker": tickers[order], "avg_turnover": values[order]})
+    uni["liquidity_rank"] = np.arange(1, len(uni) + 1)
+    return uni
+
+
+def build_history(cfg: dict, tickers: List[str], asof: str, lookback: int, top_ratio: float) -> Path:
+    """
+    ローカル価格（inputs.prices_dir）から全日付のユニバース履歴を1回のローリング計算で作って保存する。
+    rebalance_months があればリバランス月末のメンバーを次のリバランスまで据え置く。
+    """
+    from universe_history import build_universe_history, check_last_rebalance
+
+    prices = load_price_history_local(cfg["inputs"]["prices_dir"], tickers, end=asof)
+    logging.info(f"history: loaded {len(prices)}/{len(tickers)} tickers from {cfg['inputs']['prices_dir']}")
+    if not prices:
+        logging.error("No local prices for universe history. Aborting.")
+        sys.exit(2)
+
+    rebalance_months = cfg.get("rebalance_months")
+    hist = build_universe_history(prices, lookback, top_ratio, rebalance_months=rebalance_months)
+    # 最後のリバランス日のメンバーが通常の（asof 指定の）選定と同じか確かめてから保存する
+    checked = check_last_rebalance(hist, prices, lookback, top_ratio, rebalance_months=rebalance_months)
+    if checked is not None:
+        logging.info(f"history: members at {checked.date()} match compute_liquidity_all/select_top_liquidity")
+    out_dir = Path(cfg["output"]["dir"]) / "history"
+    hist.save(out_dir, meta={"asof": asof, "lookback": lookback, "top_ratio": top_ratio,
+                             "rebalance_months": rebalance_months})
+    counts = np.unpackbits(hist.bits, axis=1, count=len(hist.tickers)).sum(axis=1)
+    print(json.dumps({"history_dir": str(out_dir), "n_dates": len(hist.dates), "n_tickers": len(hist.tickers),
+                      "members_last": int(counts[-1]) if len(counts) else 0}, ensure_ascii=False, indent=2))
+    logging.info(f"Done. wrote {out_dir}")
+    return out_dir
+
+
 def main():
     args = parse_args()
     cfg = read_yaml(args.config)
@@ -192,6 +382,10 @@ def main():
     logging.info(f"個別株銘柄数: {len(tickers)}銘柄")
     source = cfg["inputs"].get("source","auto").lower()
 
+    if args.history:
+        build_history(cfg, tickers, asof, lookback, top_ratio)
+        sys.exit(0)
+
     prices = {}
     if source in ("local","auto"):
         prices.update(load_prices_local(cfg["inputs"]["prices_dir"], tickers, asof, lookback))
@@ -201,25 +395,15 @@ def main():
         if missing:
             prices.update(load_prices_yf(missing, asof, lookback))
 
-    recs=[]
-    for t in tickers:
-        df = prices.get(t)
-        if df is None or len(df)<lookback//2:
-            continue
-        liq = compute_liquidity(df, lookback)
-        if pd.notna(liq) and liq>0:
-            recs.append({"ticker":t, "avg_turnover": liq})
-
-    uni = pd.DataFrame(recs)
-    if uni.empty:
+    # 全銘柄の平均売買代金を一括で計算
+    liq = compute_liquidity_all({t: prices[t] for t in tickers if t in prices}, lookback)
+    if liq.empty:
         logging.error("No liquidity data computed. Aborting.")
         sys.exit(2)
 
-    uni = uni.sort_values("avg_turnover", ascending=False).reset_index(drop=True)
-    k = max(1, int(math.ceil(len(uni)*top_ratio)))
     # top_ratioに基づいて上位k銘柄のみを選択
-    uni = uni.head(k).reset_index(drop=True)
-    uni["liquidity_rank"] = np.arange(1, len(uni)+1)
+    uni = select_top_liquidity(liq, top_ratio)
+    k = len(uni)
     uni["asof"] = asof
 
     # 出力
@@ -0,0 +1,345 @@
+"""
+universe_history.py
+
+[役割]
+- 流動性上位ユニバースを「全日付ぶん」一度のローリング計算で作る（ポイントインタイム）
+  - 銘柄ごとに自分の行だけで ADV を求めてから 日付×銘柄 に並べ、
+    各日付で上位 ceil(N*top_ratio) 銘柄をメンバーとする（universe_builder と同じ読み込み窓・ADV・選定規則。
+    日付の和集合の上で rolling すると、休場・上場前後の穴で窓が銘柄ごとの直近 N 本にならない。
+    窓より古い行は使わないので、売買が止まった銘柄は窓を外れた日からメンバーにならない）
+  - rebalance_months を指定すると、各リバランス月の最終営業日のメンバーを
+    次のリバランス日まで据え置く（最初のリバランス日より前はメンバーなし）
+- メンバーシップは 日付×銘柄 のビットマップ（np.packbits）で保存する
+
+[レイアウト]
+  data/intermediate/universe/history/
+    _manifest.json
+    dates.npy        # int64 (ns)
+    tickers.json
+    members.npy      # uint8, shape=(len(dates), ceil(len(tickers)/8))
+
+バックテスト側は load_universe_history().mask_frame(dates, symbols) で
+ウェイト行列と同じ形の bool マスクを得て掛ける。
+
+使い方:
+  python scripts/universe_builder.py --config configs/universe.yml --history
+  python scripts/universe_history.py --self-check   # 合成データで universe_builder との一致を確かめる
+"""
+from __future__ import annotations
+
+import json
+import shutil
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+HISTORY_DIR = Path("data/intermediate/universe/history")
+MANIFEST_NAME = "_manifest.json"
+
+
+@dataclass
+class UniverseHistory:
+    """
+    日付×銘柄 のメンバーシップ（ビットマップ）。
+    bits[i] は dates[i] 時点のメンバーを tickers 順に packbits したもの。
+    """
+    dates: pd.DatetimeIndex
+    tickers: pd.Index
+    bits: np.ndarray
+
+    @classmethod
+    def from_members(cls, members: pd.DataFrame) -> "UniverseHistory":
+        """bool の 日付×銘柄 DataFrame から作る"""
+        arr = members.fillna(False).to_numpy(dtype=bool)
+        return cls(
+            dates=pd.DatetimeIndex(members.index),
+            tickers=pd.Index(members.columns),
+            bits=np.packbits(arr, axis=1),
+        )
+
+    def _row(self, date) -> int:
+        """date 以前で最も新しい日付の行番号（無ければ -1）"""
+        return int(self.dates.searchsorted(pd.Timestamp(date), side="right")) - 1
+
+    def mask_at(self, date) -> np.ndarray:
+        """date 時点のメンバー（tickers 順の bool 配列）"""
+        i = self._row(date)
+        if i < 0:
+            return np.zeros(len(self.tickers), dtype=bool)
+        return np.unpackbits(self.bits[i], count=len(self.tickers)).astype(bool)
+
+    def members_at(self, date) -> list:
+        return self.tickers[self.mask_at(date)].tolist()
+
+    def to_frame(self) -> pd.DataFrame:
+        """密な bool 行列に展開する"""
+        arr = np.unpackbits(self.bits, axis=1, count=len(self.tickers)).astype(bool)
+        return pd.DataFrame(arr, index=self.dates, columns=self.tickers)
+
+    def mask_frame(self, dates: Iterable, symbols: Sequence[str]) -> pd.DataFrame:
+        """
+        任意の 日付×銘柄 に揃えた bool マスク（各日付は直近のメンバーシップを使う）。
+        履歴に無い銘柄・最初の日付より前は False。
+        """
+        dates = pd.DatetimeIndex(pd.to_datetime(list(dates)))
+        rows = self.dates.searchsorted(dates, side="right") - 1
+        col_pos = self.tickers.get_indexer(pd.Index(symbols))
+
+        out = np.zeros((len(dates), len(col_pos)), dtype=bool)
+        valid_rows = rows >= 0
+        valid_cols = col_pos >= 0
+        if valid_rows.any() and valid_cols.any():
+            # 必要な行だけ展開する
+            uniq, inv = np.unique(rows[valid_rows], return_inverse=True)
+            dense = np.unpackbits(self.bits[uniq], axis=1, count=len(self.tickers)).astype(bool)
+            sub = dense[inv][:, col_pos[valid_cols]]
+            out[np.ix_(np.flatnonzero(valid_rows), np.flatnonzero(valid_cols))] = sub
+        return pd.DataFrame(out, index=dates, columns=pd.Index(symbols))
+
+    def save(self, out_dir: Path = HISTORY_DIR, meta: Optional[dict] = None) -> Path:
+        out_dir = Path(out_dir)
+        tmp_dir = out_dir.with_name(out_dir.name + ".tmp")
+        if tmp_dir.exists():
+            shutil.rmtree(tmp_dir)
+        tmp_dir.mkdir(parents=True)
+
+        np.save(tmp_dir / "dates.npy", self.dates.asi8)
+        np.save(tmp_dir / "members.npy", self.bits)
+        with open(tmp_dir / "tickers.json", "w", encoding="utf-8") as f:
+            json.dump([str(t) for t in self.tickers], f, ensure_ascii=False)
+        manifest = {
+            "n_dates": len(self.dates),
+            "n_tickers": len(self.tickers),
+            "date_min": str(self.dates.min().date()) if len(self.dates) else None,
+            "date_max": str(self.dates.max().date()) if len(self.dates) else None,
+            "built_at": time.time(),
+            **(meta or {}),
+        }
+        with open(tmp_dir / MANIFEST_NAME, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+        if out_dir.exists():
+            shutil.rmtree(out_dir)
+        tmp_dir.rename(out_dir)
+        return out_dir
+
+
+def load_universe_history(history_dir: Path = HISTORY_DIR) -> UniverseHistory:
+    history_dir = Path(history_dir)
+    if not (history_dir / MANIFEST_NAME).exists():
+        raise FileNotFoundError(
+            f"universe history not found: {history_dir}"
+            "（python scripts/universe_builder.py --config configs/universe.yml --history で作成）"
+        )
+    dates = pd.DatetimeIndex(np.load(history_dir / "dates.npy").astype("datetime64[ns]"))
+    with open(history_dir / "tickers.json", "r", encoding="utf-8") as f:
+        tickers = pd.Index(json.load(f))
+    bits = np.load(history_dir / "members.npy")
+    return UniverseHistory(dates=dates, tickers=tickers, bits=bits)
+
+
+def turnover_long(prices: Dict[str, pd.DataFrame]) -> pd.DataFrame:
+    """
+    {ticker: DataFrame(date, close, volume)} → 縦持ちの売買代金（ticker, date, turnover）。
+    ticker, date の順に並べる（同じ日付の行は元の順のまま）。
+    """
+    frames = []
+    for t, df in prices.items():
+        if df is None or df.empty:
+            continue
+        close = pd.to_numeric(df["close"], errors="coerce").to_numpy()
+        volume = pd.to_numeric(df["volume"], errors="coerce").to_numpy()
+        frames.append(pd.DataFrame({"ticker": t, "date": pd.to_datetime(df["date"]).to_numpy(),
+                                    "turnover": close * volume}))
+    if not frames:
+        return pd.DataFrame({"ticker": pd.Series(dtype="object"), "date": pd.Series(dtype="datetime64[ns]"),
+                             "turnover": pd.Series(dtype="float64")})
+    long = pd.concat(frames, ignore_index=True)
+    return long.sort_values(["ticker", "date"], kind="mergesort", ignore_index=True)
+
+
+def rolling_adv(long: pd.DataFrame, lookback: int) -> pd.DataFrame:
+    """
+    銘柄ごとに自分の行だけで ADV（直近 lookback 本の平均売買代金）を求め、日付×銘柄 に並べる。
+    universe_builder.load_prices_local → compute_liquidity_all をその日を asof として呼んだときと同じ値:
+      - 使う行は asof から _window_pad(lookback) 営業日前〜asof の窓の中だけ
+        （売買が止まった銘柄は、最後の行が窓から外れた日から ADV が NaN になる）
+      - 窓内の後ろ lookback 本を平均する（NaN は除く。全部 NaN なら NaN）
+      - 窓内の行数が lookback//2 未満なら NaN、ADV が 0 以下も NaN
+    累積和の差で求めるので、各セルは銘柄ごとの searchsorted 2回で決まる。
+    """
+    from universe_builder import _window_starts
+
+    dates = pd.DatetimeIndex(np.unique(long["date"].to_numpy(dtype="datetime64[ns]")))
+    ticker_arr = long["ticker"].to_numpy()
+    bounds = np.r_[0, np.flatnonzero(ticker_arr[1:] != ticker_arr[:-1]) + 1, len(long)] if len(long) else np.r_[0]
+    tickers = pd.Index(ticker_arr[bounds[:-1]])
+    out = np.full((len(dates), len(tickers)), np.nan)
+    if len(dates):
+        ends = dates.asi8
+        starts = _window_starts(dates, lookback).asi8
+        min_rows = max(1, lookback // 2)
+
+        row_dates = long["date"].to_numpy(dtype="datetime64[ns]").view("i8")
+        turn = long["turnover"].to_numpy(dtype="float64")
+        ok = np.isfinite(turn)
+        csum = np.r_[0.0, np.cumsum(np.where(ok, turn, 0.0))]
+        ccnt = np.r_[0, np.cumsum(ok)]
+        for j, (a, b) in enumerate(zip(bounds[:-1], bounds[1:])):
+            d = row_dates[a:b]
+            hi = a + np.searchsorted(d, ends, side="right")   # asof 以前の行の終端（排他）
+            lo = a + np.searchsorted(d, starts, side="left")  # 窓の始点以降の最初の行
+            first = np.maximum(lo, hi - lookback)
+            cnt = ccnt[hi] - ccnt[first]
+            with np.errstate(invalid="ignore", divide="ignore"):
+                adv = (csum[hi] - csum[first]) / cnt
+            adv[(hi - lo < min_rows) | (cnt == 0)] = np.nan
+            out[:, j] = adv
+
+    wide = pd.DataFrame(out, index=dates, columns=tickers)
+    wide = wide.reindex(columns=sorted(wide.columns))
+    return wide.where(wide > 0)
+
+
+def rolling_universe_members(adv: pd.DataFrame, top_ratio: float) -> pd.DataFrame:
+    """
+    日付×銘柄 の ADV（rolling_adv）から、各日付で上位 ceil(N*top_ratio) 銘柄を True にした bool 行列を返す。
+    N は ADV が正の銘柄数。同値は ticker 昇順（universe_builder.select_top_liquidity と同じ）。
+    """
+    adv = adv.reindex(columns=sorted(adv.columns))
+    n_eligible = adv.notna().sum(axis=1).to_numpy()
+    k = np.where(n_eligible > 0, np.maximum(1, np.ceil(n_eligible * top_ratio)), 0)
+    rank = adv.rank(axis=1, ascending=False, method="first").to_numpy()
+    members = np.nan_to_num(rank, nan=np.inf) <= k[:, None]
+    return pd.DataFrame(members, index=adv.index, columns=adv.columns)
+
+
+def rebalance_mask(dates: pd.DatetimeIndex, rebalance_months: Iterable[int]) -> np.ndarray:
+    """各リバランス月の最終営業日（dates の中で月が変わる直前の日）なら True"""
+    months = set(int(m) for m in rebalance_months)
+    idx = pd.DatetimeIndex(dates)
+    period = idx.to_period("M")
+    is_month_end = np.r_[period[1:] != period[:-1], True] if len(idx) else np.zeros(0, dtype=bool)
+    return is_month_end & np.isin(idx.month, list(months))
+
+
+def hold_between_rebalances(members: pd.DataFrame, rebalance_months: Iterable[int]) -> pd.DataFrame:
+    """
+    各リバランス月の最終営業日のメンバーを次のリバランス日まで据え置く。
+    最初のリバランス日より前は全銘柄 False。
+    """
+    idx = pd.DatetimeIndex(members.index)
+    is_rebal = rebalance_mask(idx, rebalance_months)
+
+    arr = members.to_numpy(dtype=bool)
+    last = np.where(is_rebal, np.arange(len(idx)), -1)
+    last = np.maximum.accumulate(last) if len(last) else last
+    out = np.zeros_like(arr)
+    ok = last >= 0
+    out[ok] = arr[last[ok]]
+    return pd.DataFrame(out, index=members.index, columns=members.columns)
+
+
+def build_universe_history(
+    prices: Dict[str, pd.DataFrame],
+    lookback: int,
+    top_ratio: float,
+    rebalance_months: Optional[Iterable[int]] = None,
+) -> UniverseHistory:
+    adv = rolling_adv(turnover_long(prices), lookback)
+    members = rolling_universe_members(adv, top_ratio)
+    if rebalance_months:
+        members = hold_between_rebalances(members, rebalance_months)
+    return UniverseHistory.from_members(members)
+
+
+def check_last_rebalance(
+    hist: UniverseHistory,
+    prices: Dict[str, pd.DataFrame],
+    lookback: int,
+    top_ratio: float,
+    rebalance_months: Optional[Iterable[int]] = None,
+) -> Optional[pd.Timestamp]:
+    """
+    最後のリバランス日（rebalance_months が無ければ最終日）のメンバーが、その日を asof にした
+    universe_builder の選定（load_prices_local と同じ窓 → compute_liquidity_all → select_top_liquidity）
+    と同じか確かめる。違えば ValueError。戻り値: 確かめた日付（リバランス日が無ければ None）
+    """
+    from universe_builder import (_sessions_before, _window_pad, clip_price_window,
+                                  compute_liquidity_all, select_top_liquidity)
+
+    if not len(hist.dates):
+        return None
+    if rebalance_months:
+        pos = np.flatnonzero(rebalance_mask(hist.dates, rebalance_months))
+        if not len(pos):
+            return None
+        date = hist.dates[pos[-1]]
+    else:
+        date = hist.dates[-1]
+
+    start = _sessions_before(date, _window_pad(lookback))
+    window = {t: clip_price_window(df, start, date) for t, df in prices.items()
+              if df is not None and not df.empty}
+    liq = compute_liquidity_all(window, lookback)
+    expected = set(select_top_liquidity(liq, top_ratio)["ticker"]) if len(liq) else set()
+    actual = set(hist.members_at(date))
+    if actual != expected:
+        raise ValueError(
+            f"universe history と universe_builder のメンバーが {date.date()} で一致しません: "
+            f"履歴のみ {sorted(actual - expected)[:10]} / builder のみ {sorted(expected - actual)[:10]}"
+        )
+    return date
+
+
+def self_check(lookback: int = 20, top_ratio: float = 0.5) -> None:
+    """
+    合成データで、全日付の履歴が各日付を asof にした universe_builder の選定と一致するか確かめる。
+    途中で売買が止まる銘柄（上場廃止・データ途絶）を含め、窓を外れた後はメンバーにならないことも見る。
+    """
+    from universe_builder import (_sessions_before, _window_pad, clip_price_window,
+                                  compute_liquidity_all, select_top_liquidity)
+
+    rng = np.random.default_rng(0)
+    dates = pd.bdate_range("2024-01-04", "2024-12-27")
+    prices: Dict[str, pd.DataFrame] = {}
+    for i, t in enumerate(["1001.T", "1002.T", "1003.T", "1004.T"]):
+        n = len(dates)
+        prices[t] = pd.DataFrame({
+            "date": dates,
+            "close": 100.0 + i,
+            "volume": rng.integers(1_000, 2_000, n).astype("float64") * (1 + i),
+        })
+    # 最も流動性の高い銘柄が 3 月末で止まる／途中から上場する銘柄
+    prices["9999.T"] = pd.DataFrame({"date": dates[:60], "close": 1_000.0, "volume": 1e6})
+    prices["5555.T"] = pd.DataFrame({"date": dates[150:], "close": 500.0, "volume": 1e5})
+
+    hist = build_universe_history(prices, lookback, top_ratio)
+    pad = _window_pad(lookback)
+    for date in hist.dates:
+        start = _sessions_before(date, pad)
+        liq = compute_liquidity_all({t: clip_price_window(df, start, date) for t, df in prices.items()}, lookback)
+        expected = set(select_top_liquidity(liq, top_ratio)["ticker"]) if len(liq) else set()
+        actual = set(hist.members_at(date))
+        assert actual == expected, f"{date.date()}: history={sorted(actual)} builder={sorted(expected)}"
+
+    last_trade = prices["9999.T"]["date"].iloc[-1]
+    assert "9999.T" in hist.members_at(last_trade)
+    assert "9999.T" not in hist.members_at(hist.dates[-1]), "売買が止まった銘柄が残っている"
+    check_last_rebalance(hist, prices, lookback, top_ratio)
+    print(f"[universe_history] self-check ok: {len(hist.dates)} dates x {len(hist.tickers)} tickers")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser(description="universe history のセルフチェック")
+    ap.add_argument("--self-check", action="store_true", help="合成データで universe_builder との一致を確かめる")
+    if ap.parse_args().self_check:
+        self_check()
+    else:
+        ap.print_help()